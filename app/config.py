@@ -18,17 +18,75 @@ class Settings(BaseSettings):
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
+    REDIS_ENABLED: bool = False
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = 0.5
     
     # Roblox
     ROBLOX_COOKIE: str = ""
-    
-    # Rate Limiting
+    ROBLOX_COOKIES: List[str] = []  # Additional accounts to spread load over (JSON list)
+    UPSTREAM_MAX_CONCURRENCY: int = 8  # Concurrent Roblox fetches across all users, per credential
+    UPSTREAM_PREMIUM_WEIGHT: float = 4.0  # Fair-share weight of premium users (free users have 1)
+    UPSTREAM_TIMEOUT_SECONDS: float = 15.0
+    UPSTREAM_RATE_PER_SECOND: float = 10.0  # Starting request rate per upstream host
+    UPSTREAM_MIN_RATE_PER_SECOND: float = 0.5
+    UPSTREAM_MAX_RATE_PER_SECOND: float = 50.0
+    UPSTREAM_BURST: float = 10.0
+    UPSTREAM_MAX_QUEUE_SECONDS: float = 10.0  # Longer waits for a host are shed with 503
+    UPSTREAM_MAX_RETRIES: int = 2  # Extra attempts for idempotent requests
+    UPSTREAM_RETRY_BASE_SECONDS: float = 0.2
+    UPSTREAM_RETRY_MAX_SECONDS: float = 2.0
+    UPSTREAM_RETRY_BUDGET_RATIO: float = 0.1  # Retries + hedges allowed per request, on average
+    UPSTREAM_HEDGE_MIN_SAMPLES: int = 20  # Latency samples needed before hedging an endpoint
+    UPSTREAM_BREAKER_FAILURE_RATIO: float = 0.5
+    UPSTREAM_BREAKER_MIN_CALLS: int = 10
+    UPSTREAM_BREAKER_WINDOW: int = 20  # Recent calls considered per endpoint
+    UPSTREAM_BREAKER_OPEN_SECONDS: float = 30.0
+    ROBLOX_COOKIE_RECHECK_SECONDS: float = 60.0  # Probe interval for a quarantined cookie
+    ASSET_INFO_FRESH_SECONDS: int = 900  # Soft TTL: older info is served stale while it is refreshed
+    ASSET_INFO_CACHE_SECONDS: int = 3600  # Hard TTL: last good info, also served while Roblox is unavailable
+    ASSET_INFO_CACHE_SIZE: int = 10000
+    
+    # Popularity-driven warming of the asset info and audio caches
+    CACHE_WARMER_ENABLED: bool = True
+    CACHE_WARMER_INTERVAL_SECONDS: int = 300
+    CACHE_WARMER_WINDOW_HOURS: int = 24  # Download velocity is measured over this window
+    CACHE_WARMER_TOP_N: int = 100
+    CACHE_WARMER_UPSTREAM_BUDGET: int = 100  # Upstream calls per cycle
+    CACHE_WARMER_MAX_LOAD: float = 0.25  # Only warm while upstream slots in use stay below this fraction
+    
+    # Rate Limiting (per authenticated credential; free tier / premium tier)
     RATE_LIMIT_REQUESTS_PER_MINUTE: int = 60
     RATE_LIMIT_DOWNLOADS_PER_HOUR: int = 100
+    PREMIUM_RATE_LIMIT_REQUESTS_PER_MINUTE: int = 600
+    PREMIUM_RATE_LIMIT_DOWNLOADS_PER_HOUR: int = 1000
     RATE_LIMIT_BATCH_SIZE: int = 10
     
+    # Asynchronous batch download jobs
+    AUDIO_JOB_WORKERS: int = 4
+    AUDIO_JOB_TTL_SECONDS: int = 3600  # How long finished jobs stay available
+    AUDIO_JOB_MAX_STORED: int = 1000  # Finished jobs kept; the oldest are dropped first
+    AUDIO_JOB_MAX_ACTIVE_PER_USER: int = 3  # Unfinished jobs per user; more get 429
+    AUDIO_JOB_MAX_ACTIVE: int = 100  # Unfinished jobs overall; more get 503
+    AUDIO_JOB_EVENTS_KEEPALIVE_SECONDS: float = 15.0
+    
+    # Idempotency-Key replay for download and job submission endpoints
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_MAX_BODY_BYTES: int = 1024 * 1024  # Larger responses are not stored for replay
+    IDEMPOTENCY_WAIT_SECONDS: float = 30.0  # How long a duplicate waits for the original before getting 409
+    
+    # Per client IP ceiling applied before authentication (must cover the premium tier)
+    RATE_LIMIT_IP_REQUESTS_PER_MINUTE: int = 600
+    
     # File Storage
     TEMP_DIR: str = "./temp"
+    AUDIO_CACHE_DIR: str = "./temp/audio"  # Downloaded audio, one file per asset ID
+    AUDIO_CACHE_FRESH_SECONDS: int = 86400  # Soft TTL: older files are served stale while they are refreshed
+    AUDIO_CACHE_MAX_AGE_SECONDS: int = 604800  # Hard TTL: older files are downloaded again before serving
+    AUDIO_CLIP_CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # Trimmed clips kept on disk, least recently used evicted
+    AUDIO_MEMORY_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Hottest audio kept in RAM for archive streaming; 0 disables the memory tier
+    AUDIO_MEMORY_CACHE_MAX_BLOB_BYTES: int = 16 * 1024 * 1024  # Larger files are always read from disk
+    AUDIO_WORKER_PROCESSES: int = 0  # Processes probing and clipping audio; 0 means one per CPU core
     MAX_FILE_SIZE_MB: int = 50
     CLEANUP_INTERVAL_MINUTES: int = 30
     
@@ -42,6 +100,12 @@ class Settings(BaseSettings):
     # JWT
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRE_MINUTES: int = 1440  # 24 hours
+    TOKEN_VERSION_CACHE_SECONDS: int = 30  # Without Redis, how long a worker trusts its copy of a user's token version
+    
+    # OAuth2 client credentials (Discord bots)
+    CLIENT_TOKEN_EXPIRE_MINUTES: int = 15
+    CLIENT_SECRET_CACHE_SECONDS: int = 600  # How long a verified secret skips bcrypt
+    CLIENT_SECRET_CACHE_SIZE: int = 10000
     
     # Email Settings
     MAIL_USERNAME: str = ""
@@ -52,6 +116,17 @@ class Settings(BaseSettings):
     MAIL_SERVER: str = "smtp.gmail.com"
     MAIL_STARTTLS: bool = True
     MAIL_SSL_TLS: bool = False
+    MAIL_USE_CREDENTIALS: bool = True  # Disable to deliver to a local SMTP sink
+    MAIL_VALIDATE_CERTS: bool = True
+    
+    # Email outbox worker
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50
+    EMAIL_OUTBOX_POLL_SECONDS: float = 5.0
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 6
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS: float = 30.0
+    EMAIL_OUTBOX_RETRY_MAX_SECONDS: float = 3600.0
+    EMAIL_OUTBOX_LEASE_SECONDS: int = 120
+    EMAIL_OUTBOX_SMTP_IDLE_SECONDS: float = 30.0
     
     # Admin Settings (Pre-configured admin user)
     ADMIN_EMAIL: str = "mykey@apiadmin.dev"
@@ -1,65 +1,198 @@
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import Depends, Header, HTTPException, Request, Response, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHeader
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 from sqlalchemy.orm import selectinload
 from jose import JWTError, jwt
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Optional
+import hashlib
 import structlog
 
 from app.database import get_async_session
 from app.models.user import User
-from app.schemas.auth import UserResponse, TokenData
+from app.models.api_key import APIKey
+from app.schemas.auth import UserResponse, TokenData, Principal
+from app.services.token_versions import token_versions
+from app.services.cache import TTLCache
+from app.services.idempotency import (
+    IDEMPOTENCY_STATE_KEY, IdempotencyInProgressError, IdempotentReplay, idempotency_store, request_fingerprint
+)
+from app.services.rate_limiter import (
+    LimitSpec, RateLimitResult, get_rate_limit_backend, rate_limit_headers
+)
 from app.config import settings
 
 logger = structlog.get_logger(__name__)
-security = HTTPBearer()
+security = HTTPBearer(auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
+# Only write last_seen when it is older than this, so auth stays read-only on hot paths
+LAST_SEEN_UPDATE_INTERVAL = timedelta(minutes=5)
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_async_session)
-) -> UserResponse:
-    """Get current authenticated user"""
-    
-    credentials_exception = HTTPException(
+# Users whose last_seen this process wrote recently; lets claim-authorized requests skip the read
+_last_seen_written = TTLCache(maxsize=10000, ttl=LAST_SEEN_UPDATE_INTERVAL.total_seconds())
+
+# Columns needed to build a Principal; avoids loading full User rows and relationships
+_PRINCIPAL_COLUMNS = (
+    User.id,
+    User.username,
+    User.is_active,
+    User.is_admin,
+    User.is_premium,
+    User.daily_limit,
+    User.last_seen,
+)
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _row_to_principal(row, auth_method: str, api_key_id: Optional[int] = None) -> Principal:
+    return Principal(
+        id=row.id,
+        username=row.username,
+        is_admin=bool(row.is_admin),
+        is_premium=bool(row.is_premium),
+        daily_limit=row.daily_limit or settings.FREE_TIER_DAILY_LIMIT,
+        auth_method=auth_method,
+        api_key_id=api_key_id,
+    )
+
+
+def _last_seen_is_stale(last_seen: Optional[datetime], now: datetime) -> bool:
+    if last_seen is None:
+        return True
+    return now - last_seen.replace(tzinfo=None) > LAST_SEEN_UPDATE_INTERVAL
+
+
+async def _principal_from_claims(payload: dict) -> Optional[Principal]:
+    """Build a principal from token claims alone; None if the token predates claim-carrying JWTs.
+
+    Deactivating a user bumps their token version, so the version check
+    also rejects tokens of inactive accounts.
+    """
+    user_id = payload.get("uid")
+    version = payload.get("ver")
+    if not isinstance(user_id, int) or not isinstance(version, int):
+        return None
     
+    if version < await token_versions.get(user_id):
+        raise _credentials_exception()
+    
+    return Principal(
+        id=user_id,
+        username=payload["sub"],
+        is_admin=bool(payload.get("adm")),
+        is_premium=bool(payload.get("prem")),
+        daily_limit=payload.get("lim") or settings.FREE_TIER_DAILY_LIMIT,
+        auth_method="jwt",
+    )
+
+
+async def _principal_from_jwt(token: str, db: AsyncSession) -> Principal:
+    """Verify a bearer JWT locally; only legacy tokens without claims fall back to the database"""
     try:
-        # Decode JWT token
         payload = jwt.decode(
-            credentials.credentials, 
-            settings.SECRET_KEY, 
+            token,
+            settings.SECRET_KEY,
             algorithms=[settings.JWT_ALGORITHM]
         )
         username: str = payload.get("sub") or ""
         if not username:
-            raise credentials_exception
+            raise _credentials_exception()
         token_data = TokenData(username=username)
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
     
-    # Get user from database with API keys relationship
+    principal = await _principal_from_claims(payload)
+    if principal is not None:
+        if principal.id not in _last_seen_written:
+            await db.execute(update(User).where(User.id == principal.id).values(last_seen=datetime.utcnow()))
+            await db.commit()
+            _last_seen_written.set(principal.id, True)
+        return principal
+
+    result = await db.execute(
+        select(*_PRINCIPAL_COLUMNS).where(User.username == token_data.username)
+    )
+    row = result.one_or_none()
+    if row is None or not row.is_active:
+        raise _credentials_exception()
+
+    now = datetime.utcnow()
+    if _last_seen_is_stale(row.last_seen, now):
+        await db.execute(update(User).where(User.id == row.id).values(last_seen=now))
+        await db.commit()
+
+    return _row_to_principal(row, "jwt")
+
+
+async def _principal_from_api_key(api_key: str, db: AsyncSession) -> Principal:
+    """Verify an API key with a single indexed hash lookup (no bcrypt, no login round trip)"""
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+
+    result = await db.execute(
+        select(APIKey.id.label("api_key_id"), APIKey.expires_at, *_PRINCIPAL_COLUMNS)
+        .join(User, APIKey.user_id == User.id)
+        .where(APIKey.key_hash == key_hash, APIKey.is_active == True)
+    )
+    row = result.one_or_none()
+    if row is None or not row.is_active:
+        raise _credentials_exception()
+
+    now = datetime.utcnow()
+    if row.expires_at is not None and row.expires_at.replace(tzinfo=None) <= now:
+        raise _credentials_exception()
+
+    await db.execute(
+        update(APIKey)
+        .where(APIKey.id == row.api_key_id)
+        .values(last_used=now, usage_count=APIKey.usage_count + 1)
+    )
+    if _last_seen_is_stale(row.last_seen, now):
+        await db.execute(update(User).where(User.id == row.id).values(last_seen=now))
+    await db.commit()
+
+    return _row_to_principal(row, "api_key", api_key_id=row.api_key_id)
+
+
+async def get_current_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    api_key: Optional[str] = Depends(api_key_header),
+    db: AsyncSession = Depends(get_async_session)
+) -> Principal:
+    """Authenticate with either a Bearer JWT or an X-API-Key header.
+
+    A bearer token is preferred when both are sent since its signature is
+    checked locally before touching the database.
+    """
+    if credentials is not None and credentials.scheme.lower() == "bearer":
+        return await _principal_from_jwt(credentials.credentials, db)
+    if api_key:
+        return await _principal_from_api_key(api_key, db)
+    raise _credentials_exception()
+
+
+async def get_current_user(
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_session)
+) -> UserResponse:
+    """Get current authenticated user with the full profile"""
     result = await db.execute(
         select(User)
         .options(selectinload(User.api_keys))
-        .where(User.username == token_data.username)
+        .where(User.id == principal.id)
     )
     user = result.scalar_one_or_none()
     
     if user is None:
-        raise credentials_exception
-    
-    # Update last seen
-    await db.execute(
-        update(User)
-        .where(User.id == user.id)
-        .values(last_seen=datetime.utcnow())
-    )
-    await db.commit()
+        raise _credentials_exception()
     
     # Use AuthService to properly convert User to UserResponse
     from app.services.auth import AuthService
@@ -86,11 +219,113 @@ async def get_admin_user(
     return current_user
 
 
-async def rate_limit_check():
-    """Rate limiting dependency (placeholder)"""
-    # This would be implemented with Redis or similar
-    # For now, it's a placeholder
-    pass
+DAY_SECONDS = 86400
+
+
+def _tier_limits(principal: Principal) -> tuple[int, int]:
+    """Requests per minute and downloads per hour for the principal's tier"""
+    if principal.is_premium:
+        return settings.PREMIUM_RATE_LIMIT_REQUESTS_PER_MINUTE, settings.PREMIUM_RATE_LIMIT_DOWNLOADS_PER_HOUR
+    return settings.RATE_LIMIT_REQUESTS_PER_MINUTE, settings.RATE_LIMIT_DOWNLOADS_PER_HOUR
+
+
+def _credential_key(principal: Principal) -> str:
+    # Each API key gets its own short-term budget; daily quotas are per user
+    if principal.api_key_id is not None:
+        return f"key:{principal.api_key_id}"
+    return f"user:{principal.id}"
+
+
+async def _enforce_quotas(specs: list[LimitSpec], response: Response) -> RateLimitResult:
+    """Apply quotas atomically and expose the tightest one in X-RateLimit-* headers"""
+    results = await get_rate_limit_backend().hit_many(specs)
+    result = min(results, key=lambda r: (r.allowed, r.remaining))
+    headers = rate_limit_headers(result)
+    
+    if not result.allowed:
+        detail = "Rate limit exceeded. Please try again later."
+        rejected = [(spec, r) for spec, r in zip(specs, results) if not r.allowed and spec.cost > 1]
+        if rejected:
+            # Weighted request: tell the caller how much of it would fit right now
+            admissible = min(r.remaining for _, r in rejected)
+            detail = (f"Rate limit exceeded: {admissible} of {rejected[0][0].cost} "
+                      f"requested items can be admitted now.")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers=headers
+        )
+    
+    response.headers.update(headers)
+    return result
+
+
+async def rate_limit_check(
+    response: Response,
+    principal: Principal = Depends(get_current_principal)
+):
+    """Per-credential request quota for the principal's tier (no database access)"""
+    requests_per_minute, _ = _tier_limits(principal)
+    await _enforce_quotas(
+        [LimitSpec("user_requests", _credential_key(principal), requests_per_minute, 60)],
+        response
+    )
+
+
+async def charge_downloads(principal: Principal, response: Response, items: int = 1) -> RateLimitResult:
+    """Charge one request and ``items`` downloads against the principal's quotas.
+
+    Daily counters live in the rate limit store (memory or Redis) in UTC-day
+    buckets, so they reset lazily at the day boundary without touching the
+    database. Nothing is recorded when any quota rejects the request.
+    """
+    requests_per_minute, downloads_per_hour = _tier_limits(principal)
+    credential = _credential_key(principal)
+    return await _enforce_quotas(
+        [
+            LimitSpec("user_requests", credential, requests_per_minute, 60),
+            LimitSpec("user_downloads", credential, downloads_per_hour, 3600, cost=items),
+            LimitSpec("user_daily_downloads", f"user:{principal.id}", principal.daily_limit,
+                      DAY_SECONDS, cost=items, fixed=True),
+        ],
+        response
+    )
+
+
+async def download_quota_check(
+    response: Response,
+    principal: Principal = Depends(get_current_principal)
+):
+    """Request, hourly download and daily download quotas for single-item download endpoints"""
+    await charge_downloads(principal, response)
+
+
+async def idempotency_guard(
+    request: Request,
+    principal: Principal = Depends(get_current_principal),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=255)
+):
+    """Replay the stored response for a repeated Idempotency-Key instead of executing again.
+
+    Declare before quota dependencies so replays are not charged. Requests
+    without the header are unaffected.
+    """
+    if idempotency_key is None:
+        return
+
+    key = (principal.id, idempotency_key)
+    fingerprint = request_fingerprint(request.method, request.url.path, await request.body())
+    try:
+        stored = await idempotency_store.claim(key, fingerprint)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except IdempotencyInProgressError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e), headers={"Retry-After": "1"})
+    if stored is not None:
+        logger.info("Idempotent request replayed", user_id=principal.id, path=request.url.path)
+        raise IdempotentReplay(stored)
+    # Picked up by IdempotencyMiddleware, which stores the response or releases the key
+    request.scope["state"][IDEMPOTENCY_STATE_KEY] = (key, fingerprint)
 
 
 async def api_key_auth(
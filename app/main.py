@@ -13,10 +13,20 @@ import logging.config
 logging.config.dictConfig(LOGGING_CONFIG)
 
 from app.config import settings, configure_logging
-from app.database import create_tables
+from app.database import create_tables, async_session_factory
+from app.redis_client import close_redis
+from app.services.token_versions import token_versions
+from app.services.email import get_email_service
+from app.services.email_outbox import email_outbox
+from app.services.upstream import upstream
+from app.services.jobs import job_manager
+from app.services.warmer import cache_warmer
+from app.services.probe import shutdown_audio_process_pool
 from app.routers import auth, audio, stats, health, docs
 from app.middleware.logging import LoggingMiddleware
 from app.middleware.rate_limit import RateLimitMiddleware
+from app.middleware.idempotency import IdempotencyMiddleware
+from app.services.idempotency import IdempotentReplay, idempotent_replay_handler
 
 
 @asynccontextmanager
@@ -49,8 +59,17 @@ async def lifespan(app: FastAPI):
     # Create database tables
     print("📊 Setting up database...")
     await create_tables()
+    async with async_session_factory() as db:
+        await token_versions.load_from_db(db)
     print("✅ Database ready")
     
+    # Build the email service (mail client, serializer, compiled templates) once per process
+    get_email_service()
+    email_outbox.start()
+    job_manager.start()
+    # Loads the hot set in the background so a deploy does not start cold
+    cache_warmer.start()
+    
     logger = structlog.get_logger()
     logger.info("Application startup complete", version=settings.API_VERSION)
     
@@ -63,6 +82,12 @@ async def lifespan(app: FastAPI):
     # Shutdown
     print()
     print("🔄 Application shutdown...")
+    await cache_warmer.stop()
+    await job_manager.stop()
+    shutdown_audio_process_pool()
+    await email_outbox.stop()
+    await upstream.close()
+    await close_redis()
     logger.info("Application shutdown complete")
     print("✅ Cleanup complete")
 
@@ -226,8 +251,12 @@ def create_app() -> FastAPI:
         allowed_hosts=["localhost", "127.0.0.1", "*.vercel.app"]
     )
     
-    app.add_middleware(LoggingMiddleware)
+    # Last added runs first: logging wraps rate limiting so 429s get request IDs too
+    app.add_middleware(IdempotencyMiddleware)
     app.add_middleware(RateLimitMiddleware)
+    app.add_middleware(LoggingMiddleware)
+
+    app.add_exception_handler(IdempotentReplay, idempotent_replay_handler)
 
     # Include routers
     app.include_router(docs.router, tags=["Documentation"])
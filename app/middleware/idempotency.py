@@ -0,0 +1,52 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.idempotency import (
+    IDEMPOTENCY_STATE_KEY, IdempotencyStore, StoredResponse, idempotency_store, storable_headers
+)
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI capture of responses to requests that claimed an Idempotency-Key.
+
+    The dependency decides which requests take part; this only records the
+    response on its way out and hands it to the store, so duplicates
+    waiting on the same key are woken even if the route raised.
+    """
+
+    def __init__(self, app: ASGIApp, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        captured: dict = {"body": []}
+
+        async def capture(message: Message):
+            if IDEMPOTENCY_STATE_KEY in state:
+                if message["type"] == "http.response.start":
+                    captured["status"] = message["status"]
+                    captured["headers"] = list(message.get("headers", []))
+                elif message["type"] == "http.response.body":
+                    captured["body"].append(message.get("body", b""))
+                    captured["complete"] = not message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            claim = state.pop(IDEMPOTENCY_STATE_KEY, None)
+            if claim is not None:
+                key, fingerprint = claim
+                if captured.get("complete"):
+                    self.store.complete(key, StoredResponse(
+                        fingerprint=fingerprint,
+                        status_code=captured["status"],
+                        headers=storable_headers(captured["headers"]),
+                        body=b"".join(captured["body"])
+                    ))
+                else:
+                    self.store.release(key)
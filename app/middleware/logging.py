@@ -1,53 +1,51 @@
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers, MutableHeaders, URL
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import structlog
 import time
 import uuid
 
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware for request/response logging"""
+class LoggingMiddleware:
+    """Pure ASGI middleware for request/response logging"""
     
-    def __init__(self, app):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp):
+        self.app = app
         self.logger = structlog.get_logger(__name__)
     
-    async def dispatch(self, request: Request, call_next):
-        # Generate request ID
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Generate request ID (exposed to handlers as request.state.request_id)
         request_id = str(uuid.uuid4())
-        request.state.request_id = request_id
+        scope.setdefault("state", {})["request_id"] = request_id
         
         # Log request start
         start_time = time.time()
+        client = scope.get("client")
         self.logger.info(
             "Request started",
             request_id=request_id,
-            method=request.method,
-            url=str(request.url),
-            client_ip=request.client.host if request.client else None,
-            user_agent=request.headers.get("user-agent")
+            method=scope["method"],
+            url=str(URL(scope=scope)),
+            client_ip=client[0] if client else None,
+            user_agent=Headers(scope=scope).get("user-agent")
         )
         
+        status_code = None
+        
+        async def send_with_request_id(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Add request ID to response headers
+                MutableHeaders(scope=message).append("X-Request-ID", request_id)
+            await send(message)
+        
         # Process request
         try:
-            response = await call_next(request)
-            
-            # Calculate processing time
-            process_time = time.time() - start_time
-            
-            # Log successful response
-            self.logger.info(
-                "Request completed",
-                request_id=request_id,
-                status_code=response.status_code,
-                process_time=round(process_time, 4)
-            )
-            
-            # Add request ID to response headers
-            response.headers["X-Request-ID"] = request_id
-            
-            return response
-            
+            await self.app(scope, receive, send_with_request_id)
         except Exception as e:
             # Calculate processing time for failed requests
             process_time = time.time() - start_time
@@ -62,3 +60,14 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             
             # Re-raise the exception
             raise
+        
+        # Calculate processing time (streamed bodies are included since we wrap send)
+        process_time = time.time() - start_time
+        
+        # Log completed response
+        self.logger.info(
+            "Request completed",
+            request_id=request_id,
+            status_code=status_code,
+            process_time=round(process_time, 4)
+        )
@@ -1,93 +1,75 @@
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
-from collections import defaultdict
-import time
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Optional
 import structlog
 
+from app.config import settings
+from app.services.rate_limiter import (
+    LimitSpec, RateLimitBackend, get_rate_limit_backend, rate_limit_headers
+)
+
 logger = structlog.get_logger(__name__)
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Simple in-memory rate limiting middleware"""
+class RateLimitMiddleware:
+    """Pure ASGI per-IP rate limiting backed by a pluggable counter store.
+
+    This is a coarse flood guard applied before authentication; tiered
+    per-user quotas are enforced by the rate limit dependencies.
+    """
+    
+    def __init__(self, app: ASGIApp, backend: Optional[RateLimitBackend] = None):
+        self.app = app
+        self._backend = backend
     
-    def __init__(self, app):
-        super().__init__(app)
-        self.requests = defaultdict(list)
-        self.downloads = defaultdict(list)
+    @property
+    def backend(self) -> RateLimitBackend:
+        # Resolved lazily so Redis settings are read after configuration is loaded
+        if self._backend is None:
+            self._backend = get_rate_limit_backend()
+        return self._backend
     
-    async def dispatch(self, request: Request, call_next):
-        # Get client IP
-        client_ip = request.client.host if request.client else "unknown"
-        current_time = time.time()
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Clean old entries (older than 1 hour)
-        self._cleanup_old_entries(current_time)
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        path = scope["path"]
         
-        # Check rate limits
-        if self._is_rate_limited(client_ip, request.url.path, current_time):
+        # One atomic check-and-record covering every applicable limit
+        results = await self.backend.hit_many(self._limits(client_ip, path))
+        result = min(results, key=lambda r: (r.allowed, r.remaining))
+        
+        if not result.allowed:
             logger.warning(
                 "Rate limit exceeded",
                 client_ip=client_ip,
-                path=request.url.path
+                path=path
             )
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Rate limit exceeded. Please try again later."
+            response = JSONResponse(
+                {"detail": "Rate limit exceeded. Please try again later."},
+                status_code=429,
+                headers=rate_limit_headers(result)
             )
+            await response(scope, receive, send)
+            return
         
-        # Record this request
-        self._record_request(client_ip, request.url.path, current_time)
-        
-        response = await call_next(request)
-        return response
-    
-    def _cleanup_old_entries(self, current_time: float):
-        """Remove entries older than 1 hour"""
-        cutoff_time = current_time - 3600  # 1 hour ago
+        headers = rate_limit_headers(result)
         
-        for ip in list(self.requests.keys()):
-            self.requests[ip] = [
-                timestamp for timestamp in self.requests[ip] 
-                if timestamp > cutoff_time
-            ]
-            if not self.requests[ip]:
-                del self.requests[ip]
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                # Per-user quota headers set by the route take precedence over the IP ceiling
+                if "x-ratelimit-limit" not in response_headers:
+                    for name, value in headers.items():
+                        response_headers.append(name, value)
+            await send(message)
         
-        for ip in list(self.downloads.keys()):
-            self.downloads[ip] = [
-                timestamp for timestamp in self.downloads[ip] 
-                if timestamp > cutoff_time
-            ]
-            if not self.downloads[ip]:
-                del self.downloads[ip]
+        await self.app(scope, receive, send_with_headers)
     
-    def _is_rate_limited(self, client_ip: str, path: str, current_time: float) -> bool:
-        """Check if client is rate limited"""
-        # General request rate limit (60 per minute)
-        recent_requests = [
-            timestamp for timestamp in self.requests[client_ip]
-            if timestamp > current_time - 60  # Last minute
-        ]
-        
-        if len(recent_requests) >= 60:
-            return True
-        
-        # Download-specific rate limit (100 per hour)
-        if "/audio/download" in path or "/audio/batch" in path:
-            recent_downloads = [
-                timestamp for timestamp in self.downloads[client_ip]
-                if timestamp > current_time - 3600  # Last hour
-            ]
-            
-            if len(recent_downloads) >= 100:
-                return True
-        
-        return False
-    
-    def _record_request(self, client_ip: str, path: str, current_time: float):
-        """Record a request"""
-        self.requests[client_ip].append(current_time)
-        
-        # Also record as download if it's a download endpoint
-        if "/audio/download" in path or "/audio/batch" in path:
-            self.downloads[client_ip].append(current_time)
+    def _limits(self, client_ip: str, path: str) -> list[LimitSpec]:
+        """Limits that apply to this request"""
+        return [LimitSpec("ip_requests", client_ip, settings.RATE_LIMIT_IP_REQUESTS_PER_MINUTE, 60)]
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class AudioFingerprint(Base):
+    """Fingerprints of a downloaded asset and the canonical asset it duplicates"""
+    __tablename__ = "audio_fingerprints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    asset_id = Column(Integer, unique=True, nullable=False, index=True)
+
+    # Fingerprints
+    sha256 = Column(String(64), nullable=False, index=True)  # Whole file
+    content_hash = Column(String(64), nullable=True, index=True)  # Audio packets only; None if not OGG
+    file_size = Column(Integer, nullable=False)
+
+    # The first asset seen with this content; equal to asset_id for originals
+    canonical_asset_id = Column(Integer, nullable=False, index=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<AudioFingerprint(asset_id={self.asset_id}, canonical_asset_id={self.canonical_asset_id})>"
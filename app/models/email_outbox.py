@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class EmailOutbox(Base):
+    """Outgoing email queued for delivery by the background outbox worker"""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Message
+    kind = Column(String(50), nullable=False)  # verification, password_reset, welcome
+    recipient = Column(String(100), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)  # Rendered HTML
+    dedupe_key = Column(String(200), nullable=False, index=True)  # One pending message per key
+
+    # Delivery state: pending -> sending -> sent | failed
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(Text, nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    def __repr__(self):
+        return f"<EmailOutbox(id={self.id}, kind='{self.kind}', status='{self.status}')>"
@@ -36,6 +36,9 @@ class User(Base):
     daily_limit = Column(Integer, default=1000)  # Free tier limit
     is_premium = Column(Boolean, default=False)
     
+    # Bumped to invalidate every stateless JWT issued before the change
+    token_version = Column(Integer, default=0, nullable=False, server_default="0")
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -57,7 +60,7 @@ class User(Base):
     password_reset_sent_at = Column(DateTime(timezone=True), nullable=True)
     
     # Client information (for Discord bot users)
-    client_id = Column(String(100), nullable=True)  # Discord bot client ID
+    client_id = Column(String(100), unique=True, index=True, nullable=True)  # Discord bot client ID
     client_secret = Column(String(255), nullable=True)  # Hashed client secret
     client_name = Column(String(100), nullable=True)  # Bot/app name
     
@@ -0,0 +1,36 @@
+from typing import Optional
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+_redis = None
+
+
+def get_redis() -> Optional["redis.asyncio.Redis"]:  # type: ignore[name-defined]
+    """Return the shared Redis client, or None when Redis is disabled or unavailable"""
+    global _redis
+    if not settings.REDIS_ENABLED:
+        return None
+    if _redis is None:
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            logger.warning("redis package not installed - falling back to in-process state")
+            return None
+        _redis = redis_asyncio.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        )
+    return _redis
+
+
+async def close_redis():
+    """Close the shared Redis client on shutdown"""
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
@@ -1,38 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Request
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import json
+import math
 import structlog
 
 from app.database import get_async_session
 from app.schemas.audio import (
     AssetInfo, AudioDownloadRequest, AudioBatchRequest, 
-    AudioDownloadResponse, AudioBatchResponse
+    AudioDownloadResponse, AudioBatchResponse, AudioJobRequest, AudioJobResponse
 )
-from app.services.audio import AudioService
-from app.dependencies import get_current_user, rate_limit_check
-from app.schemas.auth import UserResponse
+from app.services.audio import AudioService, CacheStatus
+from app.services.probe import audio_prober
+from app.services.upstream import UpstreamUnavailableError
+from app.services.jobs import JobLimitError, job_manager
+from app.services.archive import stream_audio_archive
+from app.config import settings
+from app.dependencies import (
+    get_current_principal, rate_limit_check, download_quota_check, charge_downloads, idempotency_guard
+)
+from app.schemas.auth import Principal
 
 router = APIRouter()
 logger = structlog.get_logger(__name__)
 
 
+def _set_cache_headers(response: Response, cache_status: Optional[CacheStatus]):
+    """X-Cache (HIT, STALE or MISS) plus the cached value's Age in seconds"""
+    if cache_status is None:
+        return
+    response.headers["X-Cache"] = cache_status.state.upper()
+    if cache_status.state != "miss":
+        response.headers["Age"] = str(int(cache_status.age))
+
+
 @router.get("/info/{asset_id}", response_model=AssetInfo)
 async def get_asset_info(
     asset_id: int,
-    current_user: UserResponse = Depends(get_current_user),
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session),
     _: None = Depends(rate_limit_check)
 ):
     """Get information about a Roblox audio asset"""
     try:
-        audio_service = AudioService(db)
+        audio_service = AudioService(db, current_user)
         asset_info = await audio_service.get_asset_info(asset_id)
+        _set_cache_headers(response, audio_service.cache_status)
+        # Cached info is shared, so properties of downloaded audio go on a copy
+        properties = await audio_prober.properties(asset_id)
+        if properties is not None:
+            asset_info = asset_info.model_copy(update={"audio": properties})
         
         logger.info("Asset info retrieved", 
                    user_id=current_user.id, 
                    asset_id=asset_id)
         
         return asset_info
+    except UpstreamUnavailableError as e:
+        logger.warning("Upstream unavailable", 
+                      user_id=current_user.id, 
+                      asset_id=asset_id, 
+                      error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Roblox is temporarily unavailable. Please try again later.",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
     except ValueError as e:
         logger.warning("Invalid asset ID", 
                       user_id=current_user.id, 
@@ -56,18 +91,23 @@ async def get_asset_info(
 @router.post("/download", response_model=AudioDownloadResponse)
 async def download_audio(
     request: AudioDownloadRequest,
-    current_user: UserResponse = Depends(get_current_user),
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session),
-    _: None = Depends(rate_limit_check)
+    _replay: None = Depends(idempotency_guard),
+    _: None = Depends(download_quota_check)
 ):
     """Download a single Roblox audio file"""
     try:
-        audio_service = AudioService(db)
+        audio_service = AudioService(db, current_user)
         result = await audio_service.download_audio(
             user_id=current_user.id,
             asset_id=request.asset_id,
-            place_id=request.place_id
+            place_id=request.place_id,
+            start=request.start,
+            end=request.end
         )
+        _set_cache_headers(response, audio_service.cache_status)
         
         logger.info("Audio download completed", 
                    user_id=current_user.id, 
@@ -98,13 +138,17 @@ async def download_audio(
 @router.post("/batch", response_model=AudioBatchResponse)
 async def download_audio_batch(
     request: AudioBatchRequest,
-    current_user: UserResponse = Depends(get_current_user),
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session),
-    _: None = Depends(rate_limit_check)
+    _replay: None = Depends(idempotency_guard)
 ):
     """Download multiple Roblox audio files"""
+    # Each asset costs one download, so a 10-item batch uses 10x the budget of a single download
+    await charge_downloads(current_user, response, items=len(request.asset_ids))
+    
     try:
-        audio_service = AudioService(db)
+        audio_service = AudioService(db, current_user)
         result = await audio_service.download_audio_batch(
             user_id=current_user.id,
             asset_ids=request.asset_ids,
@@ -134,3 +178,99 @@ async def download_audio_batch(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to process batch download"
         )
+
+
+@router.post("/batch/archive")
+async def download_audio_archive(
+    request: AudioBatchRequest,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Download multiple Roblox audio files as one streamed ZIP archive"""
+    # Repeated IDs are archived once, so they are only charged once
+    asset_ids = list(dict.fromkeys(request.asset_ids))
+    await charge_downloads(current_user, response, items=len(asset_ids))
+    
+    response.headers["Content-Disposition"] = 'attachment; filename="audio.zip"'
+    return StreamingResponse(
+        stream_audio_archive(current_user, asset_ids, request.place_id),
+        media_type="application/zip",
+        headers=dict(response.headers)
+    )
+
+
+@router.post("/jobs", response_model=AudioJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_audio_job(
+    request: AudioJobRequest,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    _replay: None = Depends(idempotency_guard)
+):
+    """Queue a batch download job and return immediately; poll or stream it for progress"""
+    try:
+        # The slot is held across the charge, so a request that pays always gets its job
+        with job_manager.reserve(current_user):
+            await charge_downloads(current_user, response, items=len(request.asset_ids))
+            job = job_manager.submit(current_user, request.asset_ids, request.place_id, reserved=True)
+    except JobLimitError as e:
+        logger.warning("Audio job rejected", user_id=current_user.id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS if e.per_principal else status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "30"}
+        )
+    
+    response.headers["Location"] = f"/audio/jobs/{job.id}"
+    return job.to_response()
+
+
+@router.get("/jobs/{job_id}", response_model=AudioJobResponse)
+async def get_audio_job(
+    job_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    _: None = Depends(rate_limit_check)
+):
+    """Get the status of a batch download job"""
+    return _get_job(job_id, current_user).to_response()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_audio_job(
+    job_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    _: None = Depends(rate_limit_check)
+):
+    """Stream job progress as Server-Sent Events (one "item" event per finished asset, then "done")"""
+    job = _get_job(job_id, current_user)
+    
+    async def events():
+        sent = 0
+        while True:
+            while sent < len(job.finished_order):
+                index = job.finished_order[sent]
+                sent += 1
+                payload = {"index": index, "completed": sent, "total": len(job.asset_ids),
+                           **job.item(index).model_dump()}
+                yield f"event: item\ndata: {json.dumps(payload)}\n\n"
+            if job.done:
+                summary = job.to_response().model_dump(mode="json", exclude={"items"})
+                yield f"event: done\ndata: {json.dumps(summary)}\n\n"
+                return
+            if not await job.wait_for_change(settings.AUDIO_JOB_EVENTS_KEEPALIVE_SECONDS):
+                yield ": keepalive\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _get_job(job_id: str, principal: Principal):
+    job = job_manager.get(job_id, principal)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found or expired"
+        )
+    return job
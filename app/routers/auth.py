@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Form
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import Optional
@@ -7,7 +8,7 @@ import structlog
 from app.database import get_async_session
 from app.schemas.auth import (
     UserCreate, UserLogin, UserResponse, Token, APIKeyResponse, APIKeyCreate, APIKeyInfo,
-    ClientCredentials, ClientCredentialsResponse, EmailVerificationRequest, 
+    ClientCredentials, ClientCredentialsResponse, ClientTokenResponse, EmailVerificationRequest, 
     EmailVerificationConfirm, PasswordResetRequest, PasswordResetConfirm,
     UserProfileUpdate, EmailResponse
 )
@@ -16,6 +17,7 @@ from app.dependencies import get_current_user, get_admin_user
 
 router = APIRouter()
 logger = structlog.get_logger(__name__)
+client_basic_auth = HTTPBasic(auto_error=False)
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
@@ -106,6 +108,25 @@ async def update_user_profile(
         )
 
 
+@router.post("/logout-all", response_model=EmailResponse)
+async def logout_all_sessions(
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Invalidate every access token issued to the current user"""
+    try:
+        auth_service = AuthService(db)
+        await auth_service.revoke_user_tokens(current_user.id)
+        logger.info("All sessions revoked", user_id=current_user.id)
+        return EmailResponse(message="All access tokens have been revoked")
+    except Exception as e:
+        logger.error("Error revoking tokens", user_id=current_user.id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to revoke tokens"
+        )
+
+
 @router.post("/api-key", response_model=APIKeyResponse)
 async def generate_api_key(
     current_user: UserResponse = Depends(get_current_user),
@@ -202,6 +223,51 @@ async def generate_client_credentials(
         )
 
 
+@router.post("/token", response_model=ClientTokenResponse)
+async def issue_client_token(
+    grant_type: str = Form(...),
+    client_id: Optional[str] = Form(None),
+    client_secret: Optional[str] = Form(None),
+    basic_credentials: Optional[HTTPBasicCredentials] = Depends(client_basic_auth),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """OAuth2 client_credentials grant: exchange bot client credentials for a short-lived token"""
+    if grant_type != "client_credentials":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported grant_type"
+        )
+    
+    # Credentials may be sent in the form body or via HTTP Basic (RFC 6749 section 2.3.1)
+    if basic_credentials is not None:
+        client_id = basic_credentials.username
+        client_secret = basic_credentials.password
+    
+    if not client_id or not client_secret:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid client credentials",
+            headers={"WWW-Authenticate": "Basic"},
+        )
+    
+    try:
+        auth_service = AuthService(db)
+        return await auth_service.issue_client_token(client_id, client_secret)
+    except ValueError as e:
+        logger.warning("Client token request failed", client_id=client_id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid client credentials",
+            headers={"WWW-Authenticate": "Basic"},
+        )
+    except Exception as e:
+        logger.error("Unexpected error issuing client token", client_id=client_id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error"
+        )
+
+
 @router.post("/send-verification-email", response_model=EmailResponse)
 async def send_verification_email(
     request: EmailVerificationRequest,
@@ -304,6 +370,31 @@ async def create_admin_user(
         )
 
 
+@router.post("/admin/users/{user_id}/deactivate", response_model=EmailResponse)
+async def deactivate_user(
+    user_id: int,
+    admin_user: UserResponse = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Deactivate an account and revoke its access tokens (admin only)"""
+    try:
+        auth_service = AuthService(db)
+        await auth_service.deactivate_user(user_id)
+        logger.info("User deactivated by admin", user_id=user_id, admin_id=admin_user.id)
+        return EmailResponse(message="User deactivated and access tokens revoked")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error("Error deactivating user", user_id=user_id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to deactivate user"
+        )
+
+
 @router.get("/api-keys", response_model=list[APIKeyInfo])
 async def list_api_keys(
     current_user: UserResponse = Depends(get_current_user),
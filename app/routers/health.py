@@ -1,4 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+
+from app.dependencies import get_admin_user
+from app.schemas.auth import UserResponse
+from app.services.scheduler import get_upstream_scheduler
+from app.services.upstream import upstream
+from app.services.warmer import cache_warmer
+from app.services.audio_cache import audio_cache
+from app.services.clips import audio_clips
 
 router = APIRouter()
 
@@ -22,3 +30,16 @@ async def readiness_check():
         "database": "connected",
         "cache": "available"
     }
+
+
+@router.get("/upstream")
+async def upstream_health(_: UserResponse = Depends(get_admin_user)):
+    """Upstream scheduler queues, rate governors, circuit breakers, cookie health, cache warming, revalidation and audio cache tiers (admin only)"""
+    return {
+        "scheduler": get_upstream_scheduler().metrics(),
+        **upstream.metrics(),
+        "cache_warmer": cache_warmer.metrics(),
+        "audio_cache": audio_cache.metrics(),
+        "audio_cache_tiers": audio_cache.tier_metrics(),
+        "audio_clips": audio_clips.metrics()
+    }
@@ -5,8 +5,10 @@ import structlog
 
 from app.database import get_async_session
 from app.services.stats import StatsService
-from app.dependencies import get_current_user
-from app.schemas.auth import UserResponse, UserStats
+from app.services.fingerprints import FingerprintService
+from app.dependencies import get_current_principal, get_admin_user
+from app.schemas.auth import Principal, UserStats, UserResponse
+from app.schemas.stats import DuplicateClusterResponse
 
 router = APIRouter()
 logger = structlog.get_logger(__name__)
@@ -14,7 +16,7 @@ logger = structlog.get_logger(__name__)
 
 @router.get("/user", response_model=UserStats)
 async def get_user_stats(
-    current_user: UserResponse = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Get statistics for the current user"""
@@ -34,7 +36,7 @@ async def get_user_stats(
 
 @router.get("/global")
 async def get_global_stats(
-    current_user: UserResponse = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Get global platform statistics"""
@@ -53,7 +55,7 @@ async def get_global_stats(
 @router.get("/assets")
 async def get_asset_stats(
     limit: int = Query(10, ge=1, le=100),
-    current_user: UserResponse = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Get statistics for popular assets"""
@@ -72,7 +74,7 @@ async def get_asset_stats(
 @router.get("/daily")
 async def get_daily_stats(
     days: int = Query(7, ge=1, le=30),
-    current_user: UserResponse = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Get daily statistics for the specified number of days"""
@@ -86,3 +88,20 @@ async def get_daily_stats(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to retrieve daily statistics"
         )
+
+
+@router.get("/duplicates", response_model=List[DuplicateClusterResponse])
+async def get_duplicate_clusters(
+    limit: int = Query(50, ge=1, le=500),
+    _: UserResponse = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """List groups of asset IDs that are uploads of the same audio (admin only)"""
+    try:
+        return await FingerprintService(db).duplicate_clusters(limit=limit)
+    except Exception as e:
+        logger.error("Error retrieving duplicate clusters", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve duplicate clusters"
+        )
@@ -13,6 +13,7 @@ from .auth import (
 
 # Audio schemas
 from .audio import (
+    AudioProperties,
     AssetInfo,
     AudioDownloadRequest,
     AudioBatchRequest,
@@ -29,7 +30,8 @@ from .stats import (
     UserRankingResponse,
     TimeSeriesData,
     TimeSeriesResponse,
-    HealthStatus
+    HealthStatus,
+    DuplicateClusterResponse
 )
 
 __all__ = [
@@ -42,6 +44,7 @@ __all__ = [
     "TokenData",
     "APIKeyResponse",
     # Audio schemas
+    "AudioProperties",
     "AssetInfo",
     "AudioDownloadRequest",
     "AudioBatchRequest", 
@@ -55,5 +58,6 @@ __all__ = [
     "UserRankingResponse",
     "TimeSeriesData",
     "TimeSeriesResponse",
-    "HealthStatus"
+    "HealthStatus",
+    "DuplicateClusterResponse"
 ]
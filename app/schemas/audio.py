@@ -1,8 +1,17 @@
-from pydantic import BaseModel, Field, HttpUrl
-from typing import Optional, List
+from pydantic import BaseModel, Field, HttpUrl, validator
+from typing import Literal, Optional, List
 from datetime import datetime
 
 
+class AudioProperties(BaseModel):
+    """Schema for technical properties read from an audio file's container headers"""
+    codec: str = Field(..., title="Codec", description="Audio codec (vorbis or opus)")
+    duration_seconds: float = Field(..., title="Duration", description="Playback duration in seconds")
+    sample_rate: int = Field(..., title="Sample Rate", description="Sample rate in Hz")
+    channels: int = Field(..., title="Channels", description="Number of audio channels")
+    bitrate_kbps: Optional[float] = Field(None, title="Bitrate", description="Average bitrate in kbit/s")
+
+
 class AssetInfo(BaseModel):
     """Schema for Roblox audio asset information"""
     asset_id: int = Field(..., title="Asset ID", description="Roblox asset identifier")
@@ -11,6 +20,7 @@ class AssetInfo(BaseModel):
     description: Optional[str] = Field(None, title="Description", description="Asset description")
     created: Optional[str] = Field(None, title="Created Date", description="Asset creation date")
     updated: Optional[str] = Field(None, title="Updated Date", description="Asset last update date")
+    audio: Optional[AudioProperties] = Field(None, title="Audio Properties", description="Technical properties, once the audio has been downloaded")
 
     model_config = {
         "json_schema_extra": {
@@ -30,12 +40,23 @@ class AudioDownloadRequest(BaseModel):
     """Schema for single audio download request"""
     asset_id: int = Field(..., gt=0, title="Asset ID", description="Roblox asset ID to download")
     place_id: str = Field(..., min_length=1, title="Place ID", description="Roblox place ID for authentication")
+    start: Optional[float] = Field(None, ge=0, title="Start", description="Clip start in seconds")
+    end: Optional[float] = Field(None, gt=0, title="End", description="Clip end in seconds")
+    format: Literal["ogg"] = Field("ogg", title="Format", description="Output format; clips are cut from the original OGG without re-encoding")
+
+    @validator('end')
+    def validate_end(cls, v, values):
+        if v is not None and values.get('start') is not None and v <= values['start']:
+            raise ValueError('end must be after start')
+        return v
 
     model_config = {
         "json_schema_extra": {
             "example": {
                 "asset_id": 1234567890,
-                "place_id": "9876543210"
+                "place_id": "9876543210",
+                "start": 10.0,
+                "end": 25.0
             }
         }
     }
@@ -65,6 +86,7 @@ class AudioDownloadResponse(BaseModel):
     file_size: Optional[int] = Field(None, title="File Size", description="Size of the downloaded file in bytes")
     download_url: Optional[str] = Field(None, title="Download URL", description="URL to download the audio file")
     error_message: Optional[str] = Field(None, title="Error Message", description="Error message if download failed")
+    audio: Optional[AudioProperties] = Field(None, title="Audio Properties", description="Technical properties of the downloaded file")
 
     model_config = {
         "json_schema_extra": {
@@ -110,6 +132,61 @@ class AudioBatchResponse(BaseModel):
     }
 
 
+class AudioJobRequest(BaseModel):
+    """Schema for an asynchronous batch download job"""
+    asset_ids: List[int] = Field(..., min_length=1, max_length=500, title="Asset IDs", description="List of Roblox asset IDs to download")
+    place_id: str = Field(..., min_length=1, title="Place ID", description="Roblox place ID for authentication")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "asset_ids": [1234567890, 1234567891, 1234567892],
+                "place_id": "9876543210"
+            }
+        }
+    }
+
+
+class AudioJobItem(BaseModel):
+    """Schema for the state of one asset within a job"""
+    asset_id: int = Field(..., title="Asset ID", description="Roblox asset ID")
+    status: str = Field(..., title="Status", description="queued, running, succeeded or failed")
+    result: Optional[AudioDownloadResponse] = Field(None, title="Result", description="Download result once finished")
+
+
+class AudioJobResponse(BaseModel):
+    """Schema for batch download job status"""
+    job_id: str = Field(..., title="Job ID", description="Identifier to poll or stream the job with")
+    status: str = Field(..., title="Status", description="queued, running or completed")
+    total: int = Field(..., title="Total", description="Number of assets in the job")
+    completed: int = Field(..., title="Completed", description="Number of assets finished so far")
+    successful_downloads: int = Field(..., title="Successful Downloads", description="Number of successful downloads")
+    failed_downloads: int = Field(..., title="Failed Downloads", description="Number of failed downloads")
+    created_at: datetime = Field(..., title="Created At", description="Job submission timestamp")
+    finished_at: Optional[datetime] = Field(None, title="Finished At", description="Job completion timestamp")
+    items: List[AudioJobItem] = Field(..., title="Items", description="Per-asset status")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "job_id": "3f7c1a9e5b2d4c8f",
+                "status": "running",
+                "total": 3,
+                "completed": 1,
+                "successful_downloads": 1,
+                "failed_downloads": 0,
+                "created_at": "2024-07-13T14:22:30",
+                "finished_at": None,
+                "items": [
+                    {"asset_id": 1234567890, "status": "succeeded", "result": None},
+                    {"asset_id": 1234567891, "status": "running", "result": None},
+                    {"asset_id": 1234567892, "status": "queued", "result": None}
+                ]
+            }
+        }
+    }
+
+
 class AudioDownloadLog(BaseModel):
     """Schema for audio download log entry"""
     id: int = Field(..., title="Log ID", description="Unique log entry identifier")
@@ -258,6 +258,23 @@ class ClientCredentialsResponse(BaseModel):
     }
 
 
+class ClientTokenResponse(BaseModel):
+    """Schema for OAuth2 client_credentials token response"""
+    access_token: str = Field(..., title="Access Token", description="Short-lived JWT access token")
+    token_type: str = Field(default="bearer", title="Token Type", description="Type of the authentication token")
+    expires_in: int = Field(..., title="Expires In", description="Token expiration time in seconds")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "access_token": "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9...",
+                "token_type": "bearer",
+                "expires_in": 900
+            }
+        }
+    }
+
+
 class UserStats(BaseModel):
     """Schema for user statistics overview"""
     total_commands: int = Field(..., title="Total Commands", description="Total number of commands executed")
@@ -318,6 +335,17 @@ class TokenData(BaseModel):
     username: Optional[str] = Field(None, title="Username", description="Username from token payload")
 
 
+class Principal(BaseModel):
+    """Lightweight identity of an authenticated caller (JWT or API key)"""
+    id: int = Field(..., title="User ID", description="Unique user identifier")
+    username: str = Field(..., title="Username", description="User's unique username")
+    is_admin: bool = Field(False, title="Admin Status", description="Whether the user has admin privileges")
+    is_premium: bool = Field(False, title="Premium Status", description="Whether the user has premium features")
+    daily_limit: int = Field(..., title="Daily Limit", description="Daily download limit")
+    auth_method: str = Field(..., title="Auth Method", description="Credential used for this request: 'jwt' or 'api_key'")
+    api_key_id: Optional[int] = Field(None, title="API Key ID", description="API key used, when authenticated by key")
+
+
 class EmailResponse(BaseModel):
     """Schema for email operation responses"""
     message: str = Field(..., title="Message", description="Response message")
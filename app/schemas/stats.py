@@ -148,3 +148,12 @@ class HealthStatus(BaseModel):
             }
         }
     }
+
+
+class DuplicateClusterResponse(BaseModel):
+    """Schema for a group of assets with the same audio content"""
+    canonical_asset_id: int = Field(..., title="Canonical Asset ID", description="First asset seen with this content")
+    asset_ids: List[int] = Field(..., title="Asset IDs", description="All assets in the cluster, canonical first")
+    exact_copies: int = Field(..., title="Exact Copies", description="Assets byte-for-byte identical to the canonical file")
+    file_size: int = Field(..., title="File Size", description="Size of the canonical file in bytes")
+    bytes_duplicated: int = Field(..., title="Bytes Duplicated", description="Total size of the non-canonical copies")
@@ -0,0 +1,89 @@
+from typing import AsyncIterator
+import asyncio
+import json
+import time
+import zipfile
+import structlog
+
+from app.database import async_session_factory
+from app.schemas.audio import AudioDownloadResponse
+from app.schemas.auth import Principal
+from app.services.audio import AudioService
+from app.services.audio_cache import audio_cache
+
+logger = structlog.get_logger(__name__)
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that hands written bytes back in chunks.
+
+    Because it cannot seek, ``zipfile`` writes each entry's sizes and CRC
+    in a trailing data descriptor instead of patching the local header, so
+    the archive can be produced strictly front to back.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _entry_name(result: AudioDownloadResponse) -> str:
+    safe_name = "".join(c for c in result.asset_name if c.isalnum() or c in (" ", "-", "_")).strip()
+    return f"{result.asset_id} - {safe_name or 'audio'}.ogg"
+
+
+async def _download(principal: Principal, asset_id: int, place_id: str) -> AudioDownloadResponse:
+    # Downloads run concurrently, so each needs its own session
+    async with async_session_factory() as db:
+        return await AudioService(db, principal).download_audio(principal.id, asset_id, place_id)
+
+
+async def stream_audio_archive(principal: Principal, asset_ids: list[int], place_id: str) -> AsyncIterator[bytes]:
+    """Yield a ZIP of the requested assets, adding each file as soon as its download completes.
+
+    Entries are stored uncompressed (OGG is already compressed) and copied
+    from the audio cache in chunks, so neither the archive nor a whole file
+    is held in memory. A manifest.json entry lists every asset's outcome.
+    """
+    tasks = [asyncio.create_task(_download(principal, asset_id, place_id)) for asset_id in dict.fromkeys(asset_ids)]
+    sink = _ChunkSink()
+    manifest = []
+    try:
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                manifest.append(result.model_dump(exclude={"download_url"}))
+                if not result.success or audio_cache.get(result.asset_id) is None:
+                    continue
+
+                info = zipfile.ZipInfo(_entry_name(result), date_time=time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                with archive.open(info, mode="w") as entry:
+                    async for chunk in audio_cache.iter_chunks(result.asset_id):
+                        entry.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                data = sink.drain()
+                if data:
+                    yield data
+
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+        yield sink.drain()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    logger.info("Audio archive streamed", user_id=principal.id, requested=len(asset_ids),
+                included=sum(1 for item in manifest if item["success"]))
@@ -1,8 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from datetime import datetime, timedelta
-import httpx
-import aiofiles
+from typing import NamedTuple, Optional
 import os
 import tempfile
 import structlog
@@ -10,24 +9,75 @@ import structlog
 from app.models.user import User
 from app.models.audio_log import AudioDownloadLog, AssetStats
 from app.schemas.audio import (
-    AssetInfo, AudioDownloadResponse, AudioBatchResponse
+    AssetInfo, AudioDownloadResponse, AudioBatchResponse, AudioProperties
 )
+from app.schemas.auth import Principal
+from app.services.scheduler import get_upstream_scheduler
+from app.services.upstream import upstream, UpstreamUnavailableError
+from app.services.cache import BackgroundRefresher, TTLCache
+from app.services.audio_cache import audio_cache
+from app.services.probe import audio_prober
+from app.services.clips import audio_clips
+from app.services.fingerprints import FingerprintService
 from app.config import settings
 
 logger = structlog.get_logger(__name__)
 
+# Last good catalog details per asset. Fresh for ASSET_INFO_FRESH_SECONDS, then served
+# stale while a background refresh runs, until ASSET_INFO_CACHE_SECONDS
+asset_info_cache = TTLCache(
+    maxsize=settings.ASSET_INFO_CACHE_SIZE,
+    ttl=settings.ASSET_INFO_CACHE_SECONDS
+)
+
+# One background refresh per stale asset info entry or audio blob
+background_refresh = BackgroundRefresher()
+
+
+class CacheStatus(NamedTuple):
+    """How a lookup was answered: "hit", "stale" or "miss", with the cached value's age"""
+    state: str
+    age: float = 0.0
+
 
 class AudioService:
     """Service for handling audio operations"""
     
-    def __init__(self, db: AsyncSession):
-        self.db = db
+    def __init__(self, db: Optional[AsyncSession], principal: Optional[Principal] = None):
+        self.db = db  # None only for upstream-only use: asset info and audio refreshes
+        self.principal = principal
+        self.cache_status: Optional[CacheStatus] = None  # Of the latest info or audio lookup
+    
+    def _upstream_slot(self):
+        """Fair-share slot for one upstream fetch on behalf of the current principal"""
+        scheduler = get_upstream_scheduler()
+        if self.principal is None:
+            return scheduler.slot("system")
+        if self.principal.is_premium:
+            return scheduler.slot(self.principal.id, settings.UPSTREAM_PREMIUM_WEIGHT, "premium")
+        return scheduler.slot(self.principal.id)
     
     async def get_asset_info(self, asset_id: int) -> AssetInfo:
-        """Get information about an audio asset"""
+        """Get information about an audio asset, serving cached details while they are usable"""
+        cached = asset_info_cache.get(asset_id)
+        if cached is None:
+            self.cache_status = CacheStatus("miss")
+            return await self.fetch_asset_info(asset_id)
+        
+        age = asset_info_cache.age(asset_id) or 0.0
+        if age < settings.ASSET_INFO_FRESH_SECONDS:
+            self.cache_status = CacheStatus("hit", age)
+        else:
+            # Past the soft TTL: answer now and let one background fetch bring it up to date
+            self.cache_status = CacheStatus("stale", age)
+            background_refresh.start(("info", asset_id), lambda: self.fetch_asset_info(asset_id))
+        return cached
+    
+    async def fetch_asset_info(self, asset_id: int) -> AssetInfo:
+        """Fetch asset information from Roblox, updating the cache"""
         try:
-            # Check if Roblox cookie is configured
-            if not settings.ROBLOX_COOKIE:
+            # Check if Roblox cookies are configured
+            if not upstream.credentials.configured:
                 logger.warning("Roblox cookie not configured - using fallback mode", asset_id=asset_id)
                 return AssetInfo(
                     asset_id=asset_id,
@@ -38,29 +88,25 @@ class AudioService:
                     updated=None
                 )
             
-            async with httpx.AsyncClient() as client:
+            async with self._upstream_slot():
+                client = upstream
+                # Rejected cookies would only earn another 403; skip the round trip until one is rechecked
+                credential = client.credentials.select()
+                if credential is None:
+                    return asset_info_cache.get(asset_id) or self._auth_failed_info(asset_id)
+                
                 # Use Roblox API to get asset info
                 url = f"https://assetdelivery.roblox.com/v1/asset/?id={asset_id}"
-                headers = {
-                    "Cookie": f".ROBLOSECURITY={settings.ROBLOX_COOKIE}",
-                    "User-Agent": "Roblox/WinInet"
-                }
+                headers = {"User-Agent": "Roblox/WinInet"}
                 
-                response = await client.get(url, headers=headers)
+                response = await client.get(url, headers=headers, credential=credential, endpoint="assetdelivery")
                 
                 # Handle 403 Forbidden specifically
                 if response.status_code == 403:
                     logger.error("Roblox authentication failed - cookie may be invalid or expired", 
                                asset_id=asset_id, status_code=response.status_code)
                     # Return fallback info instead of failing
-                    return AssetInfo(
-                        asset_id=asset_id,
-                        name=f"Audio Asset {asset_id}",
-                        creator="Unknown (Auth Failed)",
-                        description="Cookie expired or invalid - please update ROBLOX_COOKIE in .env",
-                        created=None,
-                        updated=None
-                    )
+                    return asset_info_cache.get(asset_id) or self._auth_failed_info(asset_id)
                 
                 response.raise_for_status()
                 
@@ -68,13 +114,18 @@ class AudioService:
                 catalog_url = f"https://catalog.roblox.com/v1/catalog/items/details"
                 catalog_payload = {"items": [{"itemType": "Asset", "id": asset_id}]}
                 
-                catalog_response = await client.post(catalog_url, json=catalog_payload)
+                try:
+                    # A details lookup changes nothing upstream, so it is safe to retry
+                    catalog_response = await client.post(catalog_url, json=catalog_payload,
+                                                         endpoint="catalog", idempotent=True)
+                except UpstreamUnavailableError:
+                    catalog_response = None  # Catalog details are optional
                 
-                if catalog_response.status_code == 200:
+                if catalog_response is not None and catalog_response.status_code == 200:
                     catalog_data = catalog_response.json()
                     if catalog_data.get("data"):
                         item = catalog_data["data"][0]
-                        return AssetInfo(
+                        asset_info = AssetInfo(
                             asset_id=asset_id,
                             name=item.get("name", f"Audio {asset_id}"),
                             creator=item.get("creatorName", "Unknown"),
@@ -82,9 +133,11 @@ class AudioService:
                             created=item.get("created"),
                             updated=item.get("updated")
                         )
+                        asset_info_cache.set(asset_id, asset_info)
+                        return asset_info
                 
                 # Fallback to basic info
-                return AssetInfo(
+                return asset_info_cache.get(asset_id) or AssetInfo(
                     asset_id=asset_id,
                     name=f"Audio {asset_id}",
                     creator="Unknown",
@@ -94,31 +147,68 @@ class AudioService:
                 )
                 
         except Exception as e:
+            # Roblox is failing or throttling us: serve the last good answer if we have one
+            cached = asset_info_cache.get(asset_id)
+            if cached is not None:
+                logger.warning("Serving cached asset info", asset_id=asset_id, error=str(e))
+                return cached
+            if isinstance(e, UpstreamUnavailableError):
+                raise
             logger.error("Error getting asset info", asset_id=asset_id, error=str(e))
             raise ValueError(f"Could not retrieve information for asset {asset_id}")
     
-    async def download_audio(self, user_id: int, asset_id: int, place_id: str) -> AudioDownloadResponse:
-        """Download a single audio file"""
+    @staticmethod
+    def _auth_failed_info(asset_id: int) -> AssetInfo:
+        return AssetInfo(
+            asset_id=asset_id,
+            name=f"Audio Asset {asset_id}",
+            creator="Unknown (Auth Failed)",
+            description="Cookies expired or invalid - please update ROBLOX_COOKIES in .env",
+            created=None,
+            updated=None
+        )
+    
+    async def download_audio(self, user_id: int, asset_id: int, place_id: str,
+                             start: Optional[float] = None, end: Optional[float] = None) -> AudioDownloadResponse:
+        """Download a single audio file, or a clip of it when ``start`` or ``end`` is given"""
         try:
             # Get asset info first
             asset_info = await self.get_asset_info(asset_id)
             
-            # Get audio URL
-            audio_url = await self._get_audio_url(asset_id, place_id)
-            if not audio_url:
-                await self._log_download(user_id, asset_id, asset_info.name, asset_info.creator, False, "Could not get audio URL")
-                return AudioDownloadResponse(
-                    success=False,
-                    asset_id=asset_id,
-                    asset_name=asset_info.name,
-                    creator=asset_info.creator,
-                    file_size=None,
-                    download_url=None,
-                    error_message="Could not get audio URL"
-                )
-            
-            # Download the file
-            file_size, download_url = await self._download_file(audio_url, asset_info.name)
+            # Serve from the local audio cache when this asset was fetched before
+            cached_path = self._cached_audio(asset_id)
+            if cached_path:
+                audio_cache.hits += 1
+                file_size, download_url = os.path.getsize(cached_path), cached_path
+            elif (canonical_path := await self._cached_canonical(asset_id)) is not None:
+                audio_cache.hits += 1
+                file_size, download_url = os.path.getsize(canonical_path), canonical_path
+            else:
+                audio_cache.misses += 1
+                # Get audio URL
+                audio_url = await self._get_audio_url(asset_id, place_id)
+                if not audio_url:
+                    await self._log_download(user_id, asset_id, asset_info.name, asset_info.creator, False, "Could not get audio URL")
+                    return AudioDownloadResponse(
+                        success=False,
+                        asset_id=asset_id,
+                        asset_name=asset_info.name,
+                        creator=asset_info.creator,
+                        file_size=None,
+                        download_url=None,
+                        error_message="Could not get audio URL"
+                    )
+                
+                # Download the file
+                file_size, download_url = await self._download_file(audio_url, asset_id)
+                await self._record_fingerprint(asset_id)
+
+            if start is not None or end is not None:
+                clip = await audio_clips.get(asset_id, start or 0.0, end)
+                file_size, download_url = clip.size, clip.path
+                properties = AudioProperties(**clip.properties) if clip.properties else None
+            else:
+                properties = await audio_prober.properties(asset_id)
             
             # Log successful download
             await self._log_download(user_id, asset_id, asset_info.name, asset_info.creator, True, None, file_size)
@@ -130,7 +220,8 @@ class AudioService:
                 creator=asset_info.creator,
                 file_size=file_size,
                 download_url=download_url,
-                error_message=None
+                error_message=None,
+                audio=properties
             )
             
         except Exception as e:
@@ -169,18 +260,61 @@ class AudioService:
             downloads=downloads
         )
     
+    def _cached_audio(self, asset_id: int) -> Optional[str]:
+        """Path of a usable cached blob, refreshing it in the background once past AUDIO_CACHE_FRESH_SECONDS"""
+        age = audio_cache.age(asset_id)
+        if age is None or age >= settings.AUDIO_CACHE_MAX_AGE_SECONDS:
+            self.cache_status = CacheStatus("miss")
+            return None
+        if age < settings.AUDIO_CACHE_FRESH_SECONDS:
+            self.cache_status = CacheStatus("hit", age)
+        else:
+            self.cache_status = CacheStatus("stale", age)
+            background_refresh.start(("audio", asset_id), lambda: self.refresh_audio(asset_id))
+        return audio_cache.path(asset_id)
+    
+    async def _cached_canonical(self, asset_id: int) -> Optional[str]:
+        """For a known byte-identical reupload, store the canonical asset's cached audio as this asset's"""
+        canonical_asset_id = await FingerprintService(self.db).exact_copy_of(asset_id)
+        if canonical_asset_id is None or self._cached_audio(canonical_asset_id) is None:
+            self.cache_status = CacheStatus("miss")
+            return None
+        logger.info("Serving duplicate from canonical asset", asset_id=asset_id,
+                    canonical_asset_id=canonical_asset_id)
+        return await audio_cache.link(asset_id, canonical_asset_id, identical=True)
+
+    async def _record_fingerprint(self, asset_id: int):
+        try:
+            await FingerprintService(self.db).record(asset_id)
+        except Exception as e:
+            # Duplicate detection is best effort; the download itself succeeded
+            logger.warning("Could not fingerprint audio", asset_id=asset_id, error=str(e))
+            await self.db.rollback()
+
+    async def refresh_audio(self, asset_id: int) -> bool:
+        """Fetch an asset's audio into the cache without logging a download; True if fetched"""
+        audio_url = await self._get_audio_url(asset_id, place_id="")
+        if not audio_url:
+            return False
+        await self._download_file(audio_url, asset_id)
+        return True
+    
     async def _get_audio_url(self, asset_id: int, place_id: str) -> str | None:
         """Get the actual audio file URL"""
         try:
-            async with httpx.AsyncClient() as client:
+            async with self._upstream_slot():
+                client = upstream
+                credential = client.credentials.select()
+                if credential is None:
+                    logger.warning("No usable Roblox cookie - skipping audio URL lookup", asset_id=asset_id)
+                    return None
+                
                 # This is a simplified version - you'll need to implement the actual Roblox audio location logic
                 url = f"https://assetdelivery.roblox.com/v1/asset/?id={asset_id}"
-                headers = {
-                    "Cookie": f".ROBLOSECURITY={settings.ROBLOX_COOKIE}",
-                    "User-Agent": "Roblox/WinInet"
-                }
+                headers = {"User-Agent": "Roblox/WinInet"}
                 
-                response = await client.get(url, headers=headers, follow_redirects=True)
+                response = await client.get(url, headers=headers, follow_redirects=True,
+                                            credential=credential, endpoint="assetdelivery")
                 if response.status_code == 200:
                     return str(response.url)
                 
@@ -189,25 +323,31 @@ class AudioService:
             logger.error("Error getting audio URL", asset_id=asset_id, error=str(e))
             return None
     
-    async def _download_file(self, url: str, filename: str) -> tuple[int, str]:
-        """Download file and return size and local path"""
+    async def _download_file(self, url: str, asset_id: int) -> tuple[int, str]:
+        """Download file into the audio cache and return size and local path.
+        
+        When a blob is already cached the request is conditional, and a 304
+        keeps the cached bytes.
+        """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
+            validators = await audio_cache.validators(asset_id)
+            headers = validators.conditional_headers() if validators else {}
+            async with self._upstream_slot():
+                client = upstream
+                # CDN hosts share one breaker and latency profile; slow fetches are hedged
+                response = await client.get(url, headers=headers, endpoint="cdn", hedge=True)
+                if validators and response.status_code == 304:
+                    return validators.content_length, audio_cache.mark_revalidated(asset_id, validators)
                 response.raise_for_status()
+                if validators:
+                    audio_cache.revalidation_misses += 1
                 
-                # Create temp file
-                temp_dir = settings.TEMP_DIR
-                os.makedirs(temp_dir, exist_ok=True)
-                
-                safe_filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                temp_path = os.path.join(temp_dir, f"{safe_filename}.ogg")
-                
-                async with aiofiles.open(temp_path, 'wb') as f:
-                    await f.write(response.content)
+                path = await audio_cache.put(asset_id, response.content,
+                                             etag=response.headers.get("ETag"),
+                                             last_modified=response.headers.get("Last-Modified"))
                 
                 file_size = len(response.content)
-                return file_size, temp_path
+                return file_size, path
                 
         except Exception as e:
             logger.error("Error downloading file", url=url, error=str(e))
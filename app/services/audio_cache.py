@@ -0,0 +1,230 @@
+from typing import AsyncIterator, NamedTuple, Optional
+import aiofiles
+import json
+import os
+import secrets
+import shutil
+import time
+import structlog
+
+from app.services.cache import HotBlobCache
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobValidators(NamedTuple):
+    """Upstream cache validators recorded with a blob"""
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_length: int
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class AudioBlobCache:
+    """Downloaded audio files on local disk, keyed by asset ID.
+
+    Writes go to a temporary file that is renamed into place, so readers
+    never see a partially written blob. The CDN's ETag and Last-Modified
+    are kept in a JSON file next to each blob so an expired blob can be
+    revalidated instead of downloaded again, and probed audio properties
+    in another so they survive restarts; both are dropped when the blob
+    is replaced. An optional ``memory`` tier keeps the hottest blobs in
+    RAM for ``iter_chunks``.
+    """
+
+    def __init__(self, directory: str, memory: Optional[HotBlobCache] = None):
+        self.directory = directory
+        self.memory = memory
+        self.hits = 0  # Downloads served from disk instead of the CDN
+        self.misses = 0
+        self.revalidated = 0  # 304s: blob kept, no bytes transferred
+        self.revalidation_misses = 0  # Blob had changed and was downloaded again
+        self.bytes_saved = 0
+
+    def path(self, asset_id: int) -> str:
+        return os.path.join(self.directory, f"{asset_id}.ogg")
+
+    def _validators_path(self, asset_id: int) -> str:
+        return os.path.join(self.directory, f"{asset_id}.json")
+
+    def _probe_path(self, asset_id: int) -> str:
+        return os.path.join(self.directory, f"{asset_id}.probe.json")
+
+    def get(self, asset_id: int) -> Optional[str]:
+        """Path of the cached blob, or None if the asset is not cached"""
+        path = self.path(asset_id)
+        return path if os.path.isfile(path) else None
+
+    def age(self, asset_id: int) -> Optional[float]:
+        """Seconds since the blob was written, or None if the asset is not cached"""
+        try:
+            return max(0.0, time.time() - os.stat(self.path(asset_id)).st_mtime)
+        except FileNotFoundError:
+            return None
+
+    async def validators(self, asset_id: int) -> Optional[BlobValidators]:
+        """Validators for the cached blob, or None if there are none or the blob no longer matches them"""
+        try:
+            async with aiofiles.open(self._validators_path(asset_id), "r") as f:
+                validators = BlobValidators(**json.loads(await f.read()))
+            size = os.path.getsize(self.path(asset_id))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+        if size != validators.content_length or not (validators.etag or validators.last_modified):
+            return None
+        return validators
+
+    async def put(self, asset_id: int, content: bytes, etag: Optional[str] = None,
+                  last_modified: Optional[str] = None) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(asset_id)
+        validators_path = self._validators_path(asset_id)
+        # Old validators and probe results must never describe the new blob
+        for sidecar in (validators_path, self._probe_path(asset_id)):
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+        self._forget(asset_id)
+        await self._write_atomic(path, content)
+        if etag or last_modified:
+            validators = BlobValidators(etag, last_modified, len(content))
+            await self._write_atomic(validators_path, json.dumps(validators._asdict()).encode())
+        return path
+
+    async def load_probe(self, asset_id: int) -> tuple[bool, Optional[dict]]:
+        """(found, properties) stored for the cached blob; properties is None if it could not be parsed"""
+        try:
+            async with aiofiles.open(self._probe_path(asset_id), "r") as f:
+                return True, json.loads(await f.read())
+        except (FileNotFoundError, ValueError):
+            return False, None
+
+    async def save_probe(self, asset_id: int, properties: Optional[dict]):
+        await self._write_atomic(self._probe_path(asset_id), json.dumps(properties).encode())
+
+    async def link(self, asset_id: int, source_asset_id: int, identical: bool = False) -> str:
+        """Store another asset's blob as this asset's, sharing the file on disk where possible.
+
+        The blob is hard-linked (copied if the cache spans filesystems).
+        Sidecars are kept only when the caller knows the bytes are
+        ``identical`` to what this asset already had.
+        """
+        path = self.path(asset_id)
+        if not identical:
+            for sidecar in (self._validators_path(asset_id), self._probe_path(asset_id)):
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
+        temp_path = f"{path}.{secrets.token_hex(4)}.part"
+        try:
+            try:
+                os.link(self.path(source_asset_id), temp_path)
+            except OSError:
+                shutil.copyfile(self.path(source_asset_id), temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._forget(asset_id)
+        return path
+
+    def _forget(self, asset_id: int):
+        if self.memory is not None:
+            self.memory.discard(asset_id)
+
+    def size(self, asset_id: int) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(asset_id))
+        except FileNotFoundError:
+            return None
+
+    def mark_revalidated(self, asset_id: int, validators: BlobValidators) -> str:
+        """Record a 304 for a cached blob, restarting its freshness lifetime"""
+        path = self.path(asset_id)
+        os.utime(path)
+        self.revalidated += 1
+        self.bytes_saved += validators.content_length
+        return path
+
+    async def _write_atomic(self, path: str, content: bytes):
+        temp_path = f"{path}.{secrets.token_hex(4)}.part"
+        try:
+            async with aiofiles.open(temp_path, "wb") as f:
+                await f.write(content)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    async def iter_chunks(self, asset_id: int, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Stream a cached blob, from the memory tier when it is hot.
+
+        Cold blobs are read from disk in chunks and only buffered whole when
+        the memory tier would admit them.
+        """
+        path = self.path(asset_id)
+        if self.memory is None:
+            async for chunk in self._read_chunks(path, chunk_size):
+                yield chunk
+            return
+
+        stat = os.stat(path)
+        version = (stat.st_ino, stat.st_size)  # A replaced blob is never served from memory
+        blob = self.memory.get(asset_id, version)
+        if blob is not None:
+            view = memoryview(blob)
+            for offset in range(0, len(view), chunk_size):
+                yield view[offset:offset + chunk_size]
+            return
+
+        parts = [] if self.memory.admits(asset_id, stat.st_size) else None
+        async for chunk in self._read_chunks(path, chunk_size):
+            if parts is not None:
+                parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            self.memory.put(asset_id, version, b"".join(parts))
+
+    @staticmethod
+    async def _read_chunks(path: str, chunk_size: int) -> AsyncIterator[bytes]:
+        async with aiofiles.open(path, "rb") as f:
+            while True:
+                chunk = await f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def metrics(self) -> dict:
+        return {
+            "revalidated": self.revalidated,
+            "revalidation_misses": self.revalidation_misses,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def tier_metrics(self) -> dict:
+        """Hit ratios of the memory tier (blob reads) and the disk tier (downloads not fetched from the CDN)"""
+        lookups = self.hits + self.misses
+        return {
+            "memory": self.memory.metrics() if self.memory is not None else None,
+            "disk": {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            },
+        }
+
+
+audio_cache = AudioBlobCache(
+    settings.AUDIO_CACHE_DIR,
+    HotBlobCache(settings.AUDIO_MEMORY_CACHE_MAX_BYTES, settings.AUDIO_MEMORY_CACHE_MAX_BLOB_BYTES)
+)
@@ -8,33 +8,61 @@ from typing import Optional
 import secrets
 import structlog
 import hashlib
+import hmac
 
 from app.models.user import User
 from app.models.api_key import APIKey
 from app.schemas.auth import (
     UserCreate, Token, APIKeyResponse, UserResponse, 
-    APIKeyCreate, APIKeyInfo, ClientCredentials, ClientCredentialsResponse,
+    APIKeyCreate, APIKeyInfo, ClientCredentials, ClientCredentialsResponse, ClientTokenResponse,
     EmailVerificationRequest, EmailVerificationConfirm,
     PasswordResetRequest, PasswordResetConfirm, UserProfileUpdate
 )
 from app.config import settings
+from app.services.cache import TTLCache
+from app.services.token_versions import token_versions
 
 logger = structlog.get_logger(__name__)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+try:
+    from app.services.email import get_email_service
+except ImportError:
+    logger.warning("Email service not available")
+    get_email_service = None
+
+# Successful client secret verifications, keyed by an HMAC of (client_id, secret).
+# Values hold the stored bcrypt hash so a rotated secret never matches a stale entry.
+client_secret_cache = TTLCache(
+    maxsize=settings.CLIENT_SECRET_CACHE_SIZE,
+    ttl=settings.CLIENT_SECRET_CACHE_SECONDS
+)
+
+
+def _client_secret_cache_key(client_id: str, client_secret: str) -> str:
+    message = f"{client_id}:{client_secret}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def access_token_claims(user) -> dict:
+    """Claims that let hot paths authorize from the token alone (accepts a User or a row)"""
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "adm": bool(user.is_admin),
+        "prem": bool(user.is_premium),
+        "lim": user.daily_limit or settings.FREE_TIER_DAILY_LIMIT,
+        "ver": user.token_version or 0,
+    }
+
 
 class AuthService:
     """Enhanced authentication service with email verification and comprehensive features"""
     
     def __init__(self, db: AsyncSession):
         self.db = db
-        # Import here to avoid circular imports
-        try:
-            from app.services.email import EmailService
-            self.email_service = EmailService()
-        except ImportError:
-            logger.warning("Email service not available")
-            self.email_service = None
+        # Shared singleton; constructing AuthService per request stays cheap
+        self.email_service = get_email_service() if get_email_service else None
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
@@ -155,7 +183,7 @@ class AuthService:
         await self.db.commit()
         await self.db.refresh(user)
         
-        # Send verification email (unless it's admin)
+        # Queue verification email (unless it's admin); delivery happens in the outbox worker
         if not is_admin and self.email_service:
             try:
                 token = self.email_service.generate_verification_token(user_data.email)
@@ -169,13 +197,14 @@ class AuthService:
                 )
                 await self.db.commit()
                 
-                await self.email_service.send_verification_email(
+                await self.email_service.queue_verification_email(
+                    self.db,
                     user_data.email, 
                     user_data.username, 
                     token
                 )
             except Exception as e:
-                logger.error("Failed to send verification email", user_id=user.id, error=str(e))
+                logger.error("Failed to queue verification email", user_id=user.id, error=str(e))
                 # Don't fail user creation if email fails
         
         logger.info("User created", user_id=user.id, username=user_data.username, is_admin=is_admin)
@@ -214,7 +243,7 @@ class AuthService:
         # Create access token
         access_token_expires = timedelta(minutes=settings.JWT_EXPIRE_MINUTES)
         access_token = self.create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
+            data=access_token_claims(user), expires_delta=access_token_expires
         )
         
         # Convert user to response schema
@@ -350,6 +379,38 @@ class AuthService:
             client_name=client_name
         )
     
+    async def issue_client_token(self, client_id: str, client_secret: str) -> ClientTokenResponse:
+        """Exchange client credentials for a short-lived access token (client_credentials grant)"""
+        result = await self.db.execute(
+            select(
+                User.id, User.username, User.is_active, User.is_admin, User.is_premium,
+                User.daily_limit, User.token_version, User.client_secret
+            )
+            .where(User.client_id == client_id)
+        )
+        row = result.one_or_none()
+        
+        if row is None or not row.client_secret or not row.is_active:
+            raise ValueError("Invalid client credentials")
+        
+        cache_key = _client_secret_cache_key(client_id, client_secret)
+        cached_hash = client_secret_cache.get(cache_key)
+        if cached_hash is None or not hmac.compare_digest(cached_hash, row.client_secret):
+            if not self.verify_password(client_secret, row.client_secret):
+                raise ValueError("Invalid client credentials")
+            client_secret_cache.set(cache_key, row.client_secret)
+        
+        access_token = self.create_access_token(
+            data={**access_token_claims(row), "cid": client_id},
+            expires_delta=timedelta(minutes=settings.CLIENT_TOKEN_EXPIRE_MINUTES)
+        )
+        
+        return ClientTokenResponse(
+            access_token=access_token,
+            token_type="bearer",
+            expires_in=settings.CLIENT_TOKEN_EXPIRE_MINUTES * 60
+        )
+    
     async def send_verification_email(self, email: str):
         """Send email verification email"""
         if not self.email_service:
@@ -378,7 +439,8 @@ class AuthService:
         )
         await self.db.commit()
         
-        await self.email_service.send_verification_email(
+        await self.email_service.queue_verification_email(
+            self.db,
             email, 
             user.username,  # type: ignore
             token
@@ -417,11 +479,11 @@ class AuthService:
         )
         await self.db.commit()
         
-        # Send welcome email
+        # Queue welcome email
         try:
-            await self.email_service.send_welcome_email(email, user.username)  # type: ignore
+            await self.email_service.queue_welcome_email(self.db, email, user.username)  # type: ignore
         except Exception as e:
-            logger.error("Failed to send welcome email", user_id=user.id, error=str(e))
+            logger.error("Failed to queue welcome email", user_id=user.id, error=str(e))
     
     async def request_password_reset(self, email: str):
         """Request password reset"""
@@ -449,7 +511,8 @@ class AuthService:
         )
         await self.db.commit()
         
-        await self.email_service.send_password_reset_email(
+        await self.email_service.queue_password_reset_email(
+            self.db,
             email, 
             user.username,  # type: ignore
             token
@@ -485,6 +548,34 @@ class AuthService:
             )
         )
         await self.db.commit()
+        
+        # Tokens issued with the old password must stop working
+        await self.revoke_user_tokens(user.id)  # type: ignore
+    
+    async def revoke_user_tokens(self, user_id: int) -> int:
+        """Invalidate every access token issued to a user by bumping their token version"""
+        result = await self.db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(token_version=User.token_version + 1)
+            .returning(User.token_version)
+        )
+        version = result.scalar_one()
+        await self.db.commit()
+        await token_versions.set(user_id, version)
+        logger.info("User tokens revoked", user_id=user_id, token_version=version)
+        return version
+
+    async def deactivate_user(self, user_id: int):
+        """Disable an account; its outstanding tokens are revoked so claim-only checks reject them too"""
+        result = await self.db.execute(
+            update(User).where(User.id == user_id).values(is_active=False)
+        )
+        if result.rowcount == 0:
+            raise ValueError("User not found")
+        await self.db.commit()
+        await self.revoke_user_tokens(user_id)
+        logger.info("User deactivated", user_id=user_id)
     
     async def update_user_profile(self, user_id: int, profile_data: UserProfileUpdate) -> UserResponse:
         """Update user profile"""
@@ -0,0 +1,234 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+import asyncio
+import time
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class TTLCache:
+    """Bounded in-memory cache with per-entry expiry and LRU eviction"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, float, Any]]" = OrderedDict()  # expires_at, stored_at, value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry (refreshing its LRU position) or ``default``"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting expired and then least recently used entries"""
+        now = time.monotonic()
+        self._data[key] = (now + (self.ttl if ttl is None else ttl), now, value)
+        self._data.move_to_end(key)
+        self._evict(now)
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Seconds since a live entry was stored, or None if there is none"""
+        entry = self._data.get(key)
+        now = time.monotonic()
+        if entry is None or entry[0] <= now:
+            return None
+        return now - entry[1]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[2]
+
+    def clear(self):
+        self._data.clear()
+
+    def _evict(self, now: float):
+        # Drop a few expired entries from the cold end, then enforce the size bound
+        for _ in range(2):
+            if not self._data:
+                break
+            oldest_key, (expires_at, _, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[oldest_key]
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+class BackgroundRefresher:
+    """Runs at most one background refresh per key at a time"""
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+
+    def start(self, key: Hashable, refresh: Callable[[], Awaitable[Any]]) -> bool:
+        """Start ``refresh()`` unless one is already running for the key"""
+        if key in self._tasks:
+            return False
+        self._tasks[key] = asyncio.create_task(self._run(key, refresh))
+        self.started += 1
+        return True
+
+    async def _run(self, key: Hashable, refresh: Callable[[], Awaitable[Any]]):
+        try:
+            await refresh()
+        except Exception as e:
+            # The stale value keeps being served; the next request past the soft TTL retries
+            logger.warning("Background refresh failed", key=str(key), error=str(e))
+        finally:
+            self._tasks.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+
+# Halves every 4-bit counter in one bytes.translate call
+_HALVE = bytes(count >> 1 for count in range(256))
+
+
+class FrequencySketch:
+    """Approximate recent access counts per key, as used by TinyLFU admission.
+
+    A count-min sketch of small saturating counters. After ``10 * width``
+    increments every counter is halved, so counts reflect recent popularity
+    rather than all-time totals.
+    """
+
+    def __init__(self, width: int = 4096, depth: int = 4, max_count: int = 15):
+        self.width = width
+        self.max_count = max_count
+        self._rows = [bytearray(width) for _ in range(depth)]
+        self._sample_size = 10 * width
+        self._additions = 0
+
+    def _indexes(self, key: Hashable) -> list[int]:
+        key_hash = hash(key)
+        return [hash((seed, key_hash)) % self.width for seed in range(len(self._rows))]
+
+    def increment(self, key: Hashable):
+        indexes = self._indexes(key)
+        current = min(row[i] for row, i in zip(self._rows, indexes))
+        if current < self.max_count:
+            # Conservative update: only the counters holding the estimate grow
+            for row, i in zip(self._rows, indexes):
+                if row[i] == current:
+                    row[i] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            for row in self._rows:
+                row[:] = row.translate(_HALVE)
+            self._additions //= 2
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+
+class HotBlobCache:
+    """Byte-budgeted in-memory LRU of immutable blobs with TinyLFU admission.
+
+    Every lookup counts towards the key's recent frequency. When a blob
+    only fits by evicting others, it is admitted only if it is used more
+    often than each least recently used entry it would displace, so a burst
+    of one-off reads cannot flush the hot set; blobs over ``max_blob_bytes``
+    are never kept. Entries carry a version (such as a file's inode and
+    size) and a lookup for any other version is a miss.
+    """
+
+    def __init__(self, max_bytes: int, max_blob_bytes: int, sketch_width: int = 4096):
+        self.max_bytes = max_bytes
+        self.max_blob_bytes = max_blob_bytes
+        self.sketch = FrequencySketch(sketch_width)
+        self._entries: "OrderedDict[Hashable, tuple[Hashable, bytes]]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[bytes]:
+        """The blob stored for this version of the key, recording the access either way"""
+        self.sketch.increment(key)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            self.discard(key)
+        self.misses += 1
+        return None
+
+    def admits(self, key: Hashable, size: int) -> bool:
+        """Admission decision for a blob of ``size`` bytes, checked before reading it"""
+        if self._fits(key, size):
+            return True
+        self.rejected += 1
+        return False
+
+    def _fits(self, key: Hashable, size: int) -> bool:
+        if size > self.max_blob_bytes or size > self.max_bytes:
+            return False
+        free = self.max_bytes - self._total_bytes
+        if size <= free:
+            return True
+        frequency = self.sketch.estimate(key)
+        for victim, (_, blob) in self._entries.items():
+            if victim == key:
+                continue
+            if self.sketch.estimate(victim) >= frequency:
+                return False
+            free += len(blob)
+            if size <= free:
+                return True
+        return False
+
+    def put(self, key: Hashable, version: Hashable, blob: bytes) -> bool:
+        """Keep the blob if admission allows, evicting least recently used entries; True if kept"""
+        self.discard(key)
+        if not self.admits(key, len(blob)):
+            return False
+        while self._total_bytes + len(blob) > self.max_bytes:
+            _, (_, old) = self._entries.popitem(last=False)
+            self._total_bytes -= len(old)
+            self.evictions += 1
+        self._entries[key] = (version, blob)
+        self._total_bytes += len(blob)
+        self.admitted += 1
+        return True
+
+    def discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= len(entry[1])
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,95 @@
+from collections import deque
+from typing import Optional
+import time
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Upstream {name} is unavailable; retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by the failure ratio of recent calls.
+
+    The breaker opens once at least ``min_calls`` of the last ``window``
+    calls have been recorded and ``failure_ratio`` of them failed. While
+    open every call fails fast; after ``open_seconds`` a single probe is let
+    through, and its outcome either closes the circuit or reopens it.
+    """
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, min_calls: int = 10,
+                 window: int = 20, open_seconds: float = 30.0):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes: deque = deque(maxlen=window)
+        self._opened_until = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+
+    def before_call(self, now: Optional[float] = None):
+        """Admit a call or raise CircuitOpenError"""
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN:
+            if now < self._opened_until:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self._opened_until - now)
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._probe_in_flight = True
+
+    def record(self, success: bool, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if success:
+                self.state = CLOSED
+                self._outcomes.clear()
+                logger.info("Circuit closed", endpoint=self.name)
+            else:
+                self._open(now)
+            return
+
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                and failures >= self.failure_ratio * len(self._outcomes)):
+            self._open(now)
+
+    def abandon(self):
+        """Forget an admitted call that never reached the upstream"""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_until = now + self.open_seconds
+        self._outcomes.clear()
+        logger.warning("Circuit opened", endpoint=self.name, open_seconds=self.open_seconds)
+
+    def metrics(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "open_for_seconds": round(max(0.0, self._opened_until - time.monotonic()), 2)
+            if self.state == OPEN else 0.0,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+import asyncio
+import os
+import secrets
+
+from app.services.audio_cache import audio_cache
+from app.services.ogg import probe_ogg, trim_ogg
+from app.services.probe import get_audio_process_pool
+from app.config import settings
+
+
+class Clip(NamedTuple):
+    path: str
+    size: int
+    properties: Optional[dict]
+
+
+class AudioClipCache:
+    """Trimmed clips of cached audio, cut in the audio process pool and kept on disk.
+
+    Clips are keyed by asset, range and the identity of the source file, so
+    a re-downloaded original never serves an old clip. Files are evicted
+    least recently used once they total more than ``max_bytes``; concurrent
+    requests for the same clip share one cut.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Clip]" = OrderedDict()
+        self._total_bytes = 0
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self):
+        # Clips from before a restart count towards the budget, oldest first
+        self._loaded = True
+        if not os.path.isdir(self.directory):
+            return
+        files = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".ogg")]
+        for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+            self._add(entry.name, Clip(entry.path, entry.stat().st_size, None))
+
+    def _add(self, name: str, clip: Clip):
+        self._entries[name] = clip
+        self._total_bytes += clip.size
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self._total_bytes -= old.size
+            self.evictions += 1
+            try:
+                os.remove(old.path)
+            except FileNotFoundError:
+                pass
+
+    async def get(self, asset_id: int, start: float, end: Optional[float]) -> Clip:
+        """The clip of a cached asset, cutting it on first request; raises ValueError for unclippable audio"""
+        if not self._loaded:
+            self._load()
+        source = audio_cache.path(asset_id)
+        stat = os.stat(source)
+        end_ms = "end" if end is None else round(end * 1000)
+        name = f"{asset_id}-{round(start * 1000)}-{end_ms}-{stat.st_ino:x}-{stat.st_size:x}.ogg"
+
+        clip = self._entries.get(name)
+        if clip is not None and os.path.exists(clip.path):
+            self.hits += 1
+            self._entries.move_to_end(name)
+            if clip.properties is None:
+                properties = await asyncio.get_running_loop().run_in_executor(
+                    get_audio_process_pool(), probe_ogg, clip.path
+                )
+                clip = self._entries[name] = clip._replace(properties=properties)
+            return clip
+
+        in_flight = self._in_flight.get(name)
+        if in_flight is None:
+            self.misses += 1
+            in_flight = self._in_flight[name] = asyncio.ensure_future(self._cut(name, source, start, end))
+            in_flight.add_done_callback(lambda _: self._in_flight.pop(name, None))
+        return await asyncio.shield(in_flight)
+
+    async def _cut(self, name: str, source: str, start: float, end: Optional[float]) -> Clip:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        temp_path = f"{path}.{secrets.token_hex(4)}.part"
+        try:
+            properties = await asyncio.get_running_loop().run_in_executor(
+                get_audio_process_pool(), trim_ogg, source, temp_path, start, end
+            )
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        stale = self._entries.pop(name, None)
+        if stale is not None:
+            self._total_bytes -= stale.size
+        clip = Clip(path, os.path.getsize(path), properties)
+        self._add(name, clip)
+        return clip
+
+    def metrics(self) -> dict:
+        return {
+            "clips": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+audio_clips = AudioClipCache(os.path.join(settings.AUDIO_CACHE_DIR, "clips"), settings.AUDIO_CLIP_CACHE_MAX_BYTES)
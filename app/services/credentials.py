@@ -0,0 +1,117 @@
+from typing import Optional, Sequence
+import time
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+# Authenticated requests answered with these mean the cookie was rejected
+AUTH_FAILURE_STATUSES = {401, 403}
+
+
+class RobloxCredential:
+    """One .ROBLOSECURITY cookie and its health"""
+
+    def __init__(self, index: int, cookie: str):
+        self.index = index
+        self.cookie = cookie
+        self.state = "unknown"  # unknown -> healthy | quarantined
+        self.in_flight = 0
+        self.last_used = 0.0
+        self.requests = 0
+        self.auth_failures = 0
+        self.next_check = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"credential-{self.index}"
+
+    @property
+    def cookie_header(self) -> str:
+        return f".ROBLOSECURITY={self.cookie}"
+
+    def metrics(self, now: float) -> dict:
+        return {
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "auth_failures": self.auth_failures,
+            "next_check_seconds": round(max(0.0, self.next_check - now), 2)
+            if self.state == "quarantined" else 0.0,
+        }
+
+
+class CredentialPool:
+    """Spreads authenticated Roblox calls over several accounts.
+
+    ``select`` picks the usable credential with the fewest in-flight calls,
+    breaking ties by least recently used. A credential answered with
+    401/403 is quarantined and only handed out again as a single probe
+    every ``recheck_seconds``; a successful probe returns it to rotation.
+    """
+
+    def __init__(self, cookies: Sequence[str], recheck_seconds: float):
+        self.recheck_seconds = recheck_seconds
+        self.credentials = [RobloxCredential(i, cookie) for i, cookie in enumerate(cookies)]
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.credentials)
+
+    def __len__(self) -> int:
+        return len(self.credentials)
+
+    def select(self, now: Optional[float] = None) -> Optional[RobloxCredential]:
+        """Reserve a credential for one call, or None when every credential is quarantined"""
+        now = time.monotonic() if now is None else now
+        chosen = None
+        for credential in self.credentials:
+            if credential.state == "quarantined":
+                if now >= credential.next_check:
+                    # Due for recheck: this call probes it
+                    credential.next_check = now + self.recheck_seconds
+                    chosen = credential
+                    break
+                continue
+            if chosen is None or (credential.in_flight, credential.last_used) < (chosen.in_flight, chosen.last_used):
+                chosen = credential
+
+        if chosen is not None:
+            chosen.in_flight += 1
+            chosen.last_used = now
+            chosen.requests += 1
+        return chosen
+
+    def release(self, credential: RobloxCredential, status_code: Optional[int] = None,
+                now: Optional[float] = None):
+        """Return a credential, updating its health from the response status (if any)"""
+        now = time.monotonic() if now is None else now
+        credential.in_flight -= 1
+        if status_code is None:
+            return
+        if status_code in AUTH_FAILURE_STATUSES:
+            if credential.state != "quarantined":
+                logger.error("Roblox credential rejected - quarantined", credential=credential.name,
+                             status_code=status_code, recheck_seconds=self.recheck_seconds)
+            credential.state = "quarantined"
+            credential.auth_failures += 1
+            credential.next_check = now + self.recheck_seconds
+        elif status_code < 400:
+            if credential.state == "quarantined":
+                logger.info("Roblox credential accepted again", credential=credential.name)
+            credential.state = "healthy"
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            "total": len(self.credentials),
+            "usable": sum(1 for c in self.credentials if c.state != "quarantined"),
+            "credentials": {c.name: c.metrics(now) for c in self.credentials},
+        }
+
+
+def configured_cookies() -> list[str]:
+    """ROBLOX_COOKIES plus the legacy single ROBLOX_COOKIE, without duplicates"""
+    cookies = [cookie for cookie in [*settings.ROBLOX_COOKIES, settings.ROBLOX_COOKIE] if cookie]
+    return list(dict.fromkeys(cookies))
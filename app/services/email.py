@@ -1,28 +1,13 @@
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from pydantic import EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession
 from jinja2 import Environment, BaseLoader
 from itsdangerous import URLSafeTimedSerializer
-from datetime import datetime, timedelta
 import structlog
 
 from app.config import settings
+from app.services.email_outbox import email_outbox
 
 logger = structlog.get_logger(__name__)
 
-# Email configuration
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.MAIL_USERNAME,
-    MAIL_PASSWORD=settings.MAIL_PASSWORD,
-    MAIL_FROM=settings.MAIL_FROM,
-    MAIL_FROM_NAME=settings.MAIL_FROM_NAME,
-    MAIL_PORT=settings.MAIL_PORT,
-    MAIL_SERVER=settings.MAIL_SERVER,
-    MAIL_STARTTLS=settings.MAIL_STARTTLS,
-    MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
-)
-
 # Email templates
 VERIFICATION_EMAIL_TEMPLATE = """
 <!DOCTYPE html>
@@ -116,21 +101,79 @@ PASSWORD_RESET_EMAIL_TEMPLATE = """
 </html>
 """
 
+WELCOME_EMAIL_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Welcome to The Ultimate API!</title>
+    <style>
+        body { font-family: 'Inter', sans-serif; background-color: #1f1f1f; color: #ffffff; }
+        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+        .header { background: #3ac062; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
+        .content { background: #2a2a2a; padding: 30px; border-radius: 0 0 8px 8px; }
+        .feature { background: #1f1f1f; padding: 15px; margin: 10px 0; border-radius: 6px; }
+        .footer { text-align: center; margin-top: 20px; color: #888; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1 style="margin: 0; color: white;">🎉 Welcome to The Ultimate API!</h1>
+        </div>
+        <div class="content">
+            <h2>Your account is now verified!</h2>
+            <p>Hello {{ username }},</p>
+            <p>Congratulations! Your email has been successfully verified and your Ultimate API account is now fully activated.</p>
+            
+            <h3>🚀 What you can do now:</h3>
+            <div class="feature">
+                <strong>🎵 Download Roblox Audio:</strong> Access any public Roblox audio file instantly
+            </div>
+            <div class="feature">
+                <strong>🔑 Generate API Keys:</strong> Create API keys for your Discord bots and applications
+            </div>
+            <div class="feature">
+                <strong>📊 Track Your Usage:</strong> Monitor your downloads and API usage with detailed analytics
+            </div>
+            <div class="feature">
+                <strong>⚡ High Performance:</strong> Enjoy lightning-fast downloads with our optimized infrastructure
+            </div>
+            
+            <h3>🎯 Getting Started:</h3>
+            <ol>
+                <li>Login to your account at <a href="{{ frontend_url }}/login" style="color: #3ac062;">{{ frontend_url }}/login</a></li>
+                <li>Generate your first API key in the dashboard</li>
+                <li>Check out our documentation for integration examples</li>
+                <li>Start downloading audio files!</li>
+            </ol>
+            
+            <p>Your daily limit: <strong>1,000 downloads</strong> (upgrade to Premium for 10,000+ downloads)</p>
+            
+            <p>If you have any questions, feel free to reach out to our support team.</p>
+            
+            <p>Happy downloading!<br>The Ultimate API Team</p>
+        </div>
+        <div class="footer">
+            <p>© 2024 The Ultimate API. All rights reserved.</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
 class EmailService:
     """Email service for handling verification and password reset emails"""
     
     def __init__(self):
-        # Check if email is configured
-        self.email_configured = bool(settings.MAIL_USERNAME and settings.MAIL_PASSWORD)
-        
-        if self.email_configured:
-            self.fastmail = FastMail(conf)
-        else:
-            self.fastmail = None
-            logger.warning("Email service not configured - email features disabled")
-            
+        # Delivery is handled by the outbox worker; this service only renders and queues
         self.serializer = URLSafeTimedSerializer(settings.EMAIL_VERIFICATION_SECRET)
         self.jinja_env = Environment(loader=BaseLoader())
+        
+        # Compile templates once; rendering is then a plain function call per send
+        self.verification_template = self.jinja_env.from_string(VERIFICATION_EMAIL_TEMPLATE)
+        self.password_reset_template = self.jinja_env.from_string(PASSWORD_RESET_EMAIL_TEMPLATE)
+        self.welcome_template = self.jinja_env.from_string(WELCOME_EMAIL_TEMPLATE)
     
     def generate_verification_token(self, email: str) -> str:
         """Generate email verification token"""
@@ -164,148 +207,56 @@ class EmailService:
             logger.error("Failed to verify reset token", error=str(e))
             raise ValueError("Invalid or expired reset token")
     
-    async def send_verification_email(self, email: EmailStr, username: str, token: str):
-        """Send email verification email"""
-        if not self.email_configured:
-            logger.warning("Email not configured - skipping verification email", email=email)
-            return
-            
-        try:
-            verification_url = f"{settings.FRONTEND_URL}/verify-email?token={token}"
-            
-            template = self.jinja_env.from_string(VERIFICATION_EMAIL_TEMPLATE)
-            html_content = template.render(
-                username=username,
-                verification_url=verification_url
-            )
-            
-            message = MessageSchema(
-                subject="Verify Your Email - The Ultimate API",
-                recipients=[email],
-                body=html_content,
-                subtype=MessageType.html
-            )
-            
-            await self.fastmail.send_message(message)  # type: ignore
-            logger.info("Verification email sent", email=email, username=username)
-            
-        except Exception as e:
-            logger.error("Failed to send verification email", email=email, error=str(e))
-            raise ValueError(f"Failed to send verification email: {str(e)}")
+    async def queue_verification_email(self, db: AsyncSession, email: str, username: str, token: str):
+        """Queue email verification email for background delivery"""
+        verification_url = f"{settings.FRONTEND_URL}/verify-email?token={token}"
+        html_content = self.verification_template.render(
+            username=username,
+            verification_url=verification_url
+        )
+        await email_outbox.enqueue(
+            db,
+            kind="verification",
+            recipient=email,
+            subject="Verify Your Email - The Ultimate API",
+            body=html_content
+        )
     
-    async def send_password_reset_email(self, email: EmailStr, username: str, token: str):
-        """Send password reset email"""
-        if not self.email_configured:
-            logger.warning("Email not configured - skipping password reset email", email=email)
-            return
-            
-        try:
-            reset_url = f"{settings.FRONTEND_URL}/reset-password?token={token}"
-            
-            template = self.jinja_env.from_string(PASSWORD_RESET_EMAIL_TEMPLATE)
-            html_content = template.render(
-                username=username,
-                reset_url=reset_url
-            )
-            
-            message = MessageSchema(
-                subject="Reset Your Password - The Ultimate API",
-                recipients=[email],
-                body=html_content,
-                subtype=MessageType.html
-            )
-            
-            await self.fastmail.send_message(message)  # type: ignore
-            logger.info("Password reset email sent", email=email, username=username)
-            
-        except Exception as e:
-            logger.error("Failed to send password reset email", email=email, error=str(e))
-            raise ValueError(f"Failed to send password reset email: {str(e)}")
+    async def queue_password_reset_email(self, db: AsyncSession, email: str, username: str, token: str):
+        """Queue password reset email for background delivery"""
+        reset_url = f"{settings.FRONTEND_URL}/reset-password?token={token}"
+        html_content = self.password_reset_template.render(
+            username=username,
+            reset_url=reset_url
+        )
+        await email_outbox.enqueue(
+            db,
+            kind="password_reset",
+            recipient=email,
+            subject="Reset Your Password - The Ultimate API",
+            body=html_content
+        )
     
-    async def send_welcome_email(self, email: EmailStr, username: str):
-        """Send welcome email after successful verification"""
-        if not self.email_configured:
-            logger.warning("Email not configured - skipping welcome email", email=email)
-            return
-            
-        try:
-            welcome_template = """
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <title>Welcome to The Ultimate API!</title>
-                <style>
-                    body { font-family: 'Inter', sans-serif; background-color: #1f1f1f; color: #ffffff; }
-                    .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                    .header { background: #3ac062; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
-                    .content { background: #2a2a2a; padding: 30px; border-radius: 0 0 8px 8px; }
-                    .feature { background: #1f1f1f; padding: 15px; margin: 10px 0; border-radius: 6px; }
-                    .footer { text-align: center; margin-top: 20px; color: #888; }
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1 style="margin: 0; color: white;">🎉 Welcome to The Ultimate API!</h1>
-                    </div>
-                    <div class="content">
-                        <h2>Your account is now verified!</h2>
-                        <p>Hello {{ username }},</p>
-                        <p>Congratulations! Your email has been successfully verified and your Ultimate API account is now fully activated.</p>
-                        
-                        <h3>🚀 What you can do now:</h3>
-                        <div class="feature">
-                            <strong>🎵 Download Roblox Audio:</strong> Access any public Roblox audio file instantly
-                        </div>
-                        <div class="feature">
-                            <strong>🔑 Generate API Keys:</strong> Create API keys for your Discord bots and applications
-                        </div>
-                        <div class="feature">
-                            <strong>📊 Track Your Usage:</strong> Monitor your downloads and API usage with detailed analytics
-                        </div>
-                        <div class="feature">
-                            <strong>⚡ High Performance:</strong> Enjoy lightning-fast downloads with our optimized infrastructure
-                        </div>
-                        
-                        <h3>🎯 Getting Started:</h3>
-                        <ol>
-                            <li>Login to your account at <a href="{{ frontend_url }}/login" style="color: #3ac062;">{{ frontend_url }}/login</a></li>
-                            <li>Generate your first API key in the dashboard</li>
-                            <li>Check out our documentation for integration examples</li>
-                            <li>Start downloading audio files!</li>
-                        </ol>
-                        
-                        <p>Your daily limit: <strong>1,000 downloads</strong> (upgrade to Premium for 10,000+ downloads)</p>
-                        
-                        <p>If you have any questions, feel free to reach out to our support team.</p>
-                        
-                        <p>Happy downloading!<br>The Ultimate API Team</p>
-                    </div>
-                    <div class="footer">
-                        <p>© 2024 The Ultimate API. All rights reserved.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            template = self.jinja_env.from_string(welcome_template)
-            html_content = template.render(
-                username=username,
-                frontend_url=settings.FRONTEND_URL
-            )
-            
-            message = MessageSchema(
-                subject="🎉 Welcome to The Ultimate API - Account Verified!",
-                recipients=[email],
-                body=html_content,
-                subtype=MessageType.html
-            )
-            
-            await self.fastmail.send_message(message)  # type: ignore
-            logger.info("Welcome email sent", email=email, username=username)
-            
-        except Exception as e:
-            logger.error("Failed to send welcome email", email=email, error=str(e))
-            # Don't raise here as this is not critical
+    async def queue_welcome_email(self, db: AsyncSession, email: str, username: str):
+        """Queue welcome email after successful verification"""
+        html_content = self.welcome_template.render(
+            username=username,
+            frontend_url=settings.FRONTEND_URL
+        )
+        await email_outbox.enqueue(
+            db,
+            kind="welcome",
+            recipient=email,
+            subject="🎉 Welcome to The Ultimate API - Account Verified!",
+            body=html_content
+        )
+
+_email_service: EmailService | None = None
+
+
+def get_email_service() -> EmailService:
+    """Return the process-wide EmailService, creating it on first use"""
+    global _email_service
+    if _email_service is None:
+        _email_service = EmailService()
+    return _email_service
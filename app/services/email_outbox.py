@@ -0,0 +1,242 @@
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import select, update
+from email.message import EmailMessage
+from email.utils import formataddr
+from datetime import datetime, timedelta
+from typing import Optional
+import aiosmtplib
+import asyncio
+import random
+import time
+import structlog
+
+from app.database import async_session_factory
+from app.models.email_outbox import EmailOutbox
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+
+def mail_configured() -> bool:
+    """Whether outgoing mail can be delivered (credentials are optional for local sinks)"""
+    if not settings.MAIL_SERVER:
+        return False
+    if settings.MAIL_USE_CREDENTIALS:
+        return bool(settings.MAIL_USERNAME and settings.MAIL_PASSWORD)
+    return True
+
+
+class EmailOutboxService:
+    """Persistent email outbox with a background delivery worker.
+
+    Request handlers only insert rows; the worker claims due messages in
+    batches, delivers them over a single reused SMTP connection and retries
+    failures with exponential backoff. A pending message is replaced rather
+    than duplicated when the same kind of email is requested again for the
+    same recipient.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = async_session_factory):
+        self._session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._smtp_last_used = 0.0
+
+    async def enqueue(self, db: AsyncSession, kind: str, recipient: str, subject: str, body: str):
+        """Queue a rendered email, collapsing resends of a still-pending message"""
+        if not mail_configured():
+            logger.warning("Email not configured - skipping email", kind=kind, email=recipient)
+            return
+
+        now = datetime.utcnow()
+        dedupe_key = f"{kind}:{recipient.lower()}"
+        result = await db.execute(
+            select(EmailOutbox)
+            .where(EmailOutbox.dedupe_key == dedupe_key, EmailOutbox.status == "pending")
+            .limit(1)
+        )
+        pending = result.scalar_one_or_none()
+
+        if pending:
+            # Newest content wins (e.g. a fresh verification token); keep a single send
+            pending.subject = subject  # type: ignore
+            pending.body = body  # type: ignore
+            pending.next_attempt_at = now  # type: ignore
+        else:
+            db.add(EmailOutbox(
+                kind=kind,
+                recipient=recipient,
+                subject=subject,
+                body=body,
+                dedupe_key=dedupe_key,
+                status="pending",
+                attempts=0,
+                next_attempt_at=now
+            ))
+
+        await db.commit()
+        self._wakeup.set()
+        logger.info("Email queued", kind=kind, email=recipient, deduplicated=pending is not None)
+
+    def start(self):
+        """Start the background worker (no-op when mail is not configured)"""
+        if not mail_configured():
+            logger.warning("Email service not configured - email features disabled")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close_connection()
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                logger.error("Email outbox batch failed", error=str(e))
+                processed = 0
+
+            if processed >= settings.EMAIL_OUTBOX_BATCH_SIZE:
+                continue  # Backlog remaining; keep draining on the open connection
+
+            if time.monotonic() - self._smtp_last_used > settings.EMAIL_OUTBOX_SMTP_IDLE_SECONDS:
+                await self._close_connection()
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.EMAIL_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def process_batch(self) -> int:
+        """Claim and deliver one batch of due messages; returns how many were attempted"""
+        async with self._session_factory() as db:
+            messages = await self._claim_batch(db)
+
+            for message in messages:
+                now = datetime.utcnow()
+                message.attempts = (message.attempts or 0) + 1  # type: ignore
+                try:
+                    await self._deliver(message)
+                    message.status = "sent"  # type: ignore
+                    message.sent_at = now  # type: ignore
+                    message.last_error = None  # type: ignore
+                    logger.info("Email sent", kind=message.kind, email=message.recipient)
+                except Exception as e:
+                    message.last_error = str(e)  # type: ignore
+                    if message.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                        message.status = "failed"  # type: ignore
+                        logger.error("Email delivery abandoned", kind=message.kind,
+                                     email=message.recipient, attempts=message.attempts, error=str(e))
+                    else:
+                        message.status = "pending"  # type: ignore
+                        message.next_attempt_at = now + self._backoff(message.attempts)  # type: ignore
+                        logger.warning("Email delivery failed, will retry", kind=message.kind,
+                                       email=message.recipient, attempts=message.attempts, error=str(e))
+                # Commit per message so a crash never causes already-sent mail to go out twice
+                await db.commit()
+
+            return len(messages)
+
+    async def _claim_batch(self, db: AsyncSession) -> list[EmailOutbox]:
+        """Lease due messages so concurrent workers (or processes) don't send them twice"""
+        now = datetime.utcnow()
+        due = (
+            EmailOutbox.status.in_(("pending", "sending")),
+            EmailOutbox.next_attempt_at <= now,
+        )
+        result = await db.execute(
+            select(EmailOutbox.id)
+            .where(*due)
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(settings.EMAIL_OUTBOX_BATCH_SIZE)
+        )
+        ids = result.scalars().all()
+        if not ids:
+            return []
+
+        # An expired "sending" lease means a worker died mid-send; it becomes claimable again
+        lease_until = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+        await db.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(ids), *due)
+            .values(status="sending", next_attempt_at=lease_until)
+        )
+        await db.commit()
+
+        result = await db.execute(
+            select(EmailOutbox)
+            .where(
+                EmailOutbox.id.in_(ids),
+                EmailOutbox.status == "sending",
+                EmailOutbox.next_attempt_at == lease_until
+            )
+            .order_by(EmailOutbox.id)
+        )
+        return list(result.scalars().all())
+
+    @staticmethod
+    def _backoff(attempts: int) -> timedelta:
+        delay = min(
+            settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS * (2 ** (attempts - 1)),
+            settings.EMAIL_OUTBOX_RETRY_MAX_SECONDS
+        )
+        return timedelta(seconds=random.uniform(delay / 2, delay))
+
+    async def _deliver(self, message: EmailOutbox):
+        mime = EmailMessage()
+        mime["From"] = formataddr((settings.MAIL_FROM_NAME, settings.MAIL_FROM))
+        mime["To"] = message.recipient
+        mime["Subject"] = message.subject
+        mime.set_content(message.body, subtype="html")  # type: ignore
+
+        smtp = await self._connection()
+        try:
+            await smtp.send_message(mime)
+        except aiosmtplib.SMTPServerDisconnected:
+            # Server dropped the idle connection; reconnect once and retry
+            await self._close_connection()
+            smtp = await self._connection()
+            await smtp.send_message(mime)
+        self._smtp_last_used = time.monotonic()
+
+    async def _connection(self) -> aiosmtplib.SMTP:
+        """Return the shared authenticated SMTP connection, opening it if needed"""
+        if self._smtp is not None and self._smtp.is_connected:
+            return self._smtp
+
+        use_credentials = settings.MAIL_USE_CREDENTIALS
+        self._smtp = aiosmtplib.SMTP(
+            hostname=settings.MAIL_SERVER,
+            port=settings.MAIL_PORT,
+            username=settings.MAIL_USERNAME if use_credentials else None,
+            password=settings.MAIL_PASSWORD if use_credentials else None,
+            use_tls=settings.MAIL_SSL_TLS,
+            start_tls=settings.MAIL_STARTTLS,
+            validate_certs=settings.MAIL_VALIDATE_CERTS,
+        )
+        await self._smtp.connect()
+        logger.info("SMTP connection opened", server=settings.MAIL_SERVER, port=settings.MAIL_PORT)
+        return self._smtp
+
+    async def _close_connection(self):
+        if self._smtp is None:
+            return
+        try:
+            if self._smtp.is_connected:
+                await self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+
+email_outbox = EmailOutboxService()
@@ -0,0 +1,130 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from sqlalchemy.orm import aliased
+from typing import Optional
+import asyncio
+import structlog
+
+from app.models.audio_fingerprint import AudioFingerprint
+from app.schemas.stats import DuplicateClusterResponse
+from app.services.audio_cache import audio_cache
+from app.services.cache import TTLCache
+from app.services.ogg import fingerprint_ogg
+from app.services.probe import get_audio_process_pool
+
+logger = structlog.get_logger(__name__)
+
+# Assets known not to be exact copies, so cache misses for them skip the index query
+_not_exact_copies = TTLCache(maxsize=100000, ttl=3600)
+
+
+class FingerprintService:
+    """Detects the same audio uploaded under different asset IDs.
+
+    Each downloaded file is fingerprinted in the audio process pool and
+    indexed against the first asset seen with the same content (matched on
+    the audio-packet hash, or the whole-file hash for non-OGG files). Exact
+    copies are hard-linked to the canonical file so they share disk space.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record(self, asset_id: int) -> Optional[AudioFingerprint]:
+        """Fingerprint the asset's cached file and link it to its canonical asset"""
+        path = audio_cache.get(asset_id)
+        if path is None:
+            return None
+        fingerprint = await asyncio.get_running_loop().run_in_executor(
+            get_audio_process_pool(), fingerprint_ogg, path
+        )
+
+        if fingerprint["content_hash"]:
+            match = AudioFingerprint.content_hash == fingerprint["content_hash"]
+        else:
+            match = AudioFingerprint.sha256 == fingerprint["sha256"]
+        result = await self.db.execute(
+            select(AudioFingerprint)
+            .where(match, AudioFingerprint.asset_id != asset_id)
+            .order_by(AudioFingerprint.id)
+            .limit(1)
+        )
+        original = result.scalar_one_or_none()
+        canonical_asset_id = original.canonical_asset_id if original else asset_id
+
+        result = await self.db.execute(select(AudioFingerprint).where(AudioFingerprint.asset_id == asset_id))
+        record = result.scalar_one_or_none()
+        if record is None:
+            record = AudioFingerprint(asset_id=asset_id)
+            self.db.add(record)
+        record.sha256 = fingerprint["sha256"]
+        record.content_hash = fingerprint["content_hash"]
+        record.file_size = audio_cache.size(asset_id)
+        record.canonical_asset_id = canonical_asset_id
+        await self.db.commit()
+        _not_exact_copies.pop(asset_id)
+
+        if original is not None:
+            logger.info("Duplicate audio detected", asset_id=asset_id, canonical_asset_id=canonical_asset_id)
+            if original.sha256 == fingerprint["sha256"] and audio_cache.get(original.asset_id):
+                await audio_cache.link(asset_id, original.asset_id, identical=True)
+        return record
+
+    async def exact_copy_of(self, asset_id: int) -> Optional[int]:
+        """The canonical asset whose file is byte-identical to this asset's, if any.
+
+        Remuxed copies share a canonical asset but not their bytes, so they
+        are never served the canonical file.
+        """
+        if asset_id in _not_exact_copies:
+            return None
+        canonical = aliased(AudioFingerprint)
+        result = await self.db.execute(
+            select(canonical.asset_id)
+            .join(AudioFingerprint, AudioFingerprint.canonical_asset_id == canonical.asset_id)
+            .where(
+                AudioFingerprint.asset_id == asset_id,
+                canonical.asset_id != asset_id,
+                canonical.sha256 == AudioFingerprint.sha256
+            )
+        )
+        canonical_asset_id = result.scalar_one_or_none()
+        if canonical_asset_id is None:
+            _not_exact_copies.set(asset_id, True)
+        return canonical_asset_id
+
+    async def duplicate_clusters(self, limit: int = 50) -> list[DuplicateClusterResponse]:
+        """Clusters of assets sharing content, largest first"""
+        members = func.count(AudioFingerprint.id)
+        result = await self.db.execute(
+            select(AudioFingerprint.canonical_asset_id)
+            .group_by(AudioFingerprint.canonical_asset_id)
+            .having(members > 1)
+            .order_by(members.desc())
+            .limit(limit)
+        )
+        canonical_ids = list(result.scalars().all())
+        if not canonical_ids:
+            return []
+
+        result = await self.db.execute(
+            select(AudioFingerprint)
+            .where(AudioFingerprint.canonical_asset_id.in_(canonical_ids))
+            .order_by(AudioFingerprint.id)
+        )
+        clusters: dict[int, list[AudioFingerprint]] = {canonical_id: [] for canonical_id in canonical_ids}
+        for record in result.scalars().all():
+            clusters[record.canonical_asset_id].append(record)
+
+        responses = []
+        for canonical_id, records in clusters.items():
+            canonical = next((r for r in records if r.asset_id == canonical_id), records[0])
+            copies = [r for r in records if r is not canonical]
+            responses.append(DuplicateClusterResponse(
+                canonical_asset_id=canonical_id,
+                asset_ids=[canonical.asset_id] + [r.asset_id for r in copies],
+                exact_copies=sum(1 for r in copies if r.sha256 == canonical.sha256),
+                file_size=canonical.file_size,
+                bytes_duplicated=sum(r.file_size for r in copies)
+            ))
+        return responses
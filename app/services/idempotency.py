@@ -0,0 +1,111 @@
+from typing import Hashable, NamedTuple, Optional
+import asyncio
+import hashlib
+
+from fastapi import Request
+from starlette.responses import Response
+
+from app.config import settings
+from app.services.cache import TTLCache
+
+# Request state entry set once a request claims its key; read by IdempotencyMiddleware
+IDEMPOTENCY_STATE_KEY = "idempotency"
+
+# Per-request headers that must not be replayed from the original response
+_UNSTORED_HEADERS = {b"x-request-id", b"x-ratelimit-limit", b"x-ratelimit-remaining",
+                     b"x-ratelimit-reset", b"retry-after"}
+
+
+class StoredResponse(NamedTuple):
+    """A completed response kept for replay"""
+    fingerprint: str
+    status_code: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+
+
+class IdempotencyInProgressError(Exception):
+    """The original request for a key is still running after the duplicate's wait"""
+
+
+class IdempotentReplay(Exception):
+    """Raised by the idempotency dependency to answer with a stored response"""
+
+    def __init__(self, stored: StoredResponse):
+        self.stored = stored
+
+
+def request_fingerprint(method: str, path: str, body: bytes) -> str:
+    return hashlib.sha256(b"\0".join([method.encode(), path.encode(), body])).hexdigest()
+
+
+class IdempotencyStore:
+    """Results of requests sent with an Idempotency-Key, per principal.
+
+    The first request for a key executes; concurrent duplicates wait up to
+    ``wait_timeout`` seconds for it and then replay its stored response.
+    Only successful (2xx) responses
+    up to ``max_body`` bytes are kept, for ``ttl`` seconds; after a failure
+    the next duplicate executes afresh. Reusing a key for a different
+    request is rejected.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, max_body: int, wait_timeout: float):
+        self.max_body = max_body
+        self.wait_timeout = wait_timeout
+        self._completed = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight: dict[Hashable, tuple[str, asyncio.Future]] = {}
+        self.replays = 0
+
+    async def claim(self, key: Hashable, fingerprint: str) -> Optional[StoredResponse]:
+        """Return the stored response to replay, or None once the caller owns the execution"""
+        while True:
+            stored = self._completed.get(key)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    raise ValueError("Idempotency-Key was already used for a different request")
+                self.replays += 1
+                return stored
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                self._in_flight[key] = (fingerprint, asyncio.get_running_loop().create_future())
+                return None
+            if in_flight[0] != fingerprint:
+                raise ValueError("Idempotency-Key was already used for a different request")
+            try:
+                await asyncio.wait_for(asyncio.shield(in_flight[1]), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise IdempotencyInProgressError(
+                    "A request with this Idempotency-Key is still in progress; retry later"
+                )
+
+    def complete(self, key: Hashable, response: StoredResponse):
+        if 200 <= response.status_code < 300 and len(response.body) <= self.max_body:
+            self._completed.set(key, response)
+        self.release(key)
+
+    def release(self, key: Hashable):
+        """End an execution, waking any duplicates that are waiting on it"""
+        in_flight = self._in_flight.pop(key, None)
+        if in_flight is not None and not in_flight[1].done():
+            in_flight[1].set_result(None)
+
+
+idempotency_store = IdempotencyStore(
+    maxsize=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+    max_body=settings.IDEMPOTENCY_MAX_BODY_BYTES,
+    wait_timeout=settings.IDEMPOTENCY_WAIT_SECONDS
+)
+
+
+async def idempotent_replay_handler(request: Request, exc: IdempotentReplay) -> Response:
+    """Send a stored response again, byte for byte"""
+    response = Response(content=exc.stored.body, status_code=exc.stored.status_code)
+    response.raw_headers = [*exc.stored.headers, (b"idempotent-replayed", b"true")]
+    return response
+
+
+def storable_headers(headers: list[tuple[bytes, bytes]]) -> list[tuple[bytes, bytes]]:
+    return [(name, value) for name, value in headers if name.lower() not in _UNSTORED_HEADERS]
@@ -0,0 +1,232 @@
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+import asyncio
+import secrets
+import time
+import structlog
+
+from app.database import async_session_factory
+from app.schemas.audio import AudioDownloadResponse, AudioJobItem, AudioJobResponse
+from app.schemas.auth import Principal
+from app.services.audio import AudioService
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class JobLimitError(Exception):
+    """Raised instead of accepting a job over the active job caps"""
+
+    def __init__(self, message: str, per_principal: bool):
+        super().__init__(message)
+        self.per_principal = per_principal  # False when the whole service is at capacity
+
+
+class AudioJob:
+    """A batch download job and the per-item state its workers update"""
+
+    def __init__(self, principal: Principal, asset_ids: list[int], place_id: str):
+        self.id = secrets.token_hex(8)
+        self.principal = principal
+        self.asset_ids = asset_ids
+        self.place_id = place_id
+        self.statuses = [QUEUED] * len(asset_ids)
+        self.results: list[Optional[AudioDownloadResponse]] = [None] * len(asset_ids)
+        self.finished_order: list[int] = []  # Item indices in completion order, for event streams
+        self.next_item = 0
+        self.successful = 0
+        self.failed = 0
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.expires_at = float("inf")
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return len(self.finished_order) == len(self.asset_ids)
+
+    @property
+    def status(self) -> str:
+        if self.done:
+            return "completed"
+        return RUNNING if self.next_item else QUEUED
+
+    def finish_item(self, index: int, result: AudioDownloadResponse):
+        self.statuses[index] = SUCCEEDED if result.success else FAILED
+        self.results[index] = result
+        self.finished_order.append(index)
+        if result.success:
+            self.successful += 1
+        else:
+            self.failed += 1
+        if self.done:
+            self.finished_at = datetime.utcnow()
+            self.expires_at = time.monotonic() + settings.AUDIO_JOB_TTL_SECONDS
+        # Wake every waiting stream, then start a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def item(self, index: int) -> AudioJobItem:
+        return AudioJobItem(asset_id=self.asset_ids[index], status=self.statuses[index], result=self.results[index])
+
+    def to_response(self) -> AudioJobResponse:
+        return AudioJobResponse(
+            job_id=self.id,
+            status=self.status,
+            total=len(self.asset_ids),
+            completed=len(self.finished_order),
+            successful_downloads=self.successful,
+            failed_downloads=self.failed,
+            created_at=self.created_at,
+            finished_at=self.finished_at,
+            items=[self.item(i) for i in range(len(self.asset_ids))]
+        )
+
+
+class AudioJobManager:
+    """In-process job store and worker pool for batch downloads.
+
+    Workers take items round-robin across active jobs, so a 500-asset
+    playlist does not hold up a small job submitted after it; upstream
+    fairness between users is still handled by the fetch scheduler. Each
+    item runs in its own database session. Unfinished jobs are capped per
+    principal (``AUDIO_JOB_MAX_ACTIVE_PER_USER``) and overall
+    (``AUDIO_JOB_MAX_ACTIVE``). Finished jobs are kept for
+    ``AUDIO_JOB_TTL_SECONDS``, and only the newest ``AUDIO_JOB_MAX_STORED``.
+    """
+
+    def __init__(self, session_factory=async_session_factory):
+        self._session_factory = session_factory
+        self._jobs: dict[str, AudioJob] = {}
+        self._active: deque[AudioJob] = deque()
+        self._reserved: Counter[int] = Counter()  # Slots held by requests between their capacity check and submit
+        self._work_available = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        if not self._workers:
+            self._work_available = asyncio.Event()
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(settings.AUDIO_JOB_WORKERS)
+            ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+    def check_capacity(self, principal: Principal):
+        """Raise JobLimitError if the principal cannot queue another job right now"""
+        self._expire()
+        active = [job for job in self._jobs.values() if not job.done]
+        own = sum(1 for job in active if job.principal.id == principal.id) + self._reserved[principal.id]
+        if own >= settings.AUDIO_JOB_MAX_ACTIVE_PER_USER:
+            raise JobLimitError("Too many unfinished jobs; wait for one to complete", per_principal=True)
+        if len(active) + sum(self._reserved.values()) >= settings.AUDIO_JOB_MAX_ACTIVE:
+            raise JobLimitError("Job queue is full; try again later", per_principal=False)
+
+    @contextmanager
+    def reserve(self, principal: Principal):
+        """Hold a job slot while the caller awaits (e.g. charges quota) before ``submit(..., reserved=True)``.
+
+        The check and the hold happen without yielding to the event loop,
+        so concurrent requests cannot both pass the check; the slot is
+        released on exit whether or not the job was submitted.
+        """
+        self.check_capacity(principal)
+        self._reserved[principal.id] += 1
+        try:
+            yield
+        finally:
+            self._reserved[principal.id] -= 1
+            if not self._reserved[principal.id]:
+                del self._reserved[principal.id]
+
+    def submit(self, principal: Principal, asset_ids: list[int], place_id: str,
+               reserved: bool = False) -> AudioJob:
+        if not reserved:
+            self.check_capacity(principal)
+        self.start()
+        job = AudioJob(principal, asset_ids, place_id)
+        self._jobs[job.id] = job
+        self._active.append(job)
+        self._work_available.set()
+        logger.info("Audio job submitted", job_id=job.id, user_id=principal.id, total=len(asset_ids))
+        return job
+
+    def get(self, job_id: str, principal: Principal) -> Optional[AudioJob]:
+        """Look up a job visible to the principal (owners and admins)"""
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is None or (job.principal.id != principal.id and not principal.is_admin):
+            return None
+        return job
+
+    def _expire(self):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.expires_at <= now]:
+            del self._jobs[job_id]
+        finished = [job for job in self._jobs.values() if job.done]
+        if len(finished) > settings.AUDIO_JOB_MAX_STORED:
+            finished.sort(key=lambda job: job.expires_at)
+            for job in finished[:len(finished) - settings.AUDIO_JOB_MAX_STORED]:
+                del self._jobs[job.id]
+
+    def _next_item(self) -> Optional[tuple[AudioJob, int]]:
+        while self._active:
+            job = self._active.popleft()
+            if job.next_item >= len(job.asset_ids):
+                continue
+            index = job.next_item
+            job.next_item += 1
+            if job.next_item < len(job.asset_ids):
+                self._active.append(job)  # Back of the line: round-robin across jobs
+            return job, index
+        return None
+
+    async def _worker(self):
+        while True:
+            claimed = self._next_item()
+            if claimed is None:
+                self._work_available.clear()
+                await self._work_available.wait()
+                continue
+            job, index = claimed
+            job.statuses[index] = RUNNING
+            job.finish_item(index, await self._run_item(job, index))
+
+    async def _run_item(self, job: AudioJob, index: int) -> AudioDownloadResponse:
+        asset_id = job.asset_ids[index]
+        try:
+            async with self._session_factory() as db:
+                return await AudioService(db, job.principal).download_audio(
+                    user_id=job.principal.id, asset_id=asset_id, place_id=job.place_id
+                )
+        except Exception as e:
+            logger.error("Audio job item failed", job_id=job.id, asset_id=asset_id, error=str(e))
+            return AudioDownloadResponse(
+                success=False,
+                asset_id=asset_id,
+                asset_name=f"Asset {asset_id}",
+                creator="Unknown",
+                error_message="Download failed"
+            )
+
+
+job_manager = AudioJobManager()
@@ -0,0 +1,251 @@
+"""OGG Vorbis/Opus container parsing and page-level editing (RFC 3533).
+
+Pure functions with no application imports, so they can run in worker
+processes. Nothing here decodes audio.
+"""
+from typing import NamedTuple, Optional
+import hashlib
+import os
+import struct
+
+# OGG page header: capture pattern, version, header type, granule position,
+# stream serial, page sequence, CRC, segment count
+_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+_CRC_OFFSET = 22
+_BOS, _EOS = 0x02, 0x04
+_OPUS_GRANULE_RATE = 48000
+# The last page is rarely larger than this; read more only if no page is found
+_TAIL_BYTES = 64 * 1024
+
+
+def _crc_table() -> list[int]:
+    table = []
+    for byte in range(256):
+        crc = byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def ogg_crc(data: bytes) -> int:
+    """OGG page checksum: CRC-32, polynomial 0x04C11DB7, no reflection, zero initial value"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[(crc >> 24) ^ byte]
+    return crc
+
+
+class Page(NamedTuple):
+    header_type: int
+    granule: int
+    serial: int
+    segments: bytes
+    payload: bytes
+
+    @property
+    def size(self) -> int:
+        return _PAGE_HEADER.size + len(self.segments) + len(self.payload)
+
+    def encode(self, sequence: int) -> bytes:
+        """Serialize with the given sequence number and a freshly computed checksum"""
+        page = bytearray(_PAGE_HEADER.pack(b"OggS", 0, self.header_type, self.granule, self.serial,
+                                           sequence, 0, len(self.segments)))
+        page += self.segments + self.payload
+        struct.pack_into("<I", page, _CRC_OFFSET, ogg_crc(page))
+        return bytes(page)
+
+
+class StreamInfo(NamedTuple):
+    codec: str
+    sample_rate: int
+    channels: int
+    granule_rate: int  # Granule positions count samples at this rate
+    pre_skip: int
+    header_packets: int  # Codec header packets preceding the audio
+
+
+def read_page(data: bytes, offset: int) -> Optional[Page]:
+    """The page at ``offset``, or None if there is no whole page there"""
+    if len(data) - offset < _PAGE_HEADER.size:
+        return None
+    capture, version, header_type, granule, serial, _, _, count = _PAGE_HEADER.unpack_from(data, offset)
+    if capture != b"OggS" or version != 0:
+        return None
+    table_end = offset + _PAGE_HEADER.size + count
+    if table_end > len(data):
+        return None
+    segments = data[offset + _PAGE_HEADER.size:table_end]
+    payload_end = table_end + sum(segments)
+    if payload_end > len(data):
+        return None
+    return Page(header_type, granule, serial, segments, data[table_end:payload_end])
+
+
+def stream_info(first_page: Page) -> StreamInfo:
+    """Codec parameters from the identification header on a stream's first page"""
+    packet = first_page.payload
+    if packet[:7] == b"\x01vorbis" and len(packet) >= 30:
+        channels, sample_rate = struct.unpack_from("<BI", packet, 11)
+        info = StreamInfo("vorbis", sample_rate, channels, sample_rate, 0, 3)
+    elif packet[:8] == b"OpusHead" and len(packet) >= 19:
+        channels, pre_skip, input_rate = struct.unpack_from("<BHI", packet, 9)
+        # Opus always decodes at 48 kHz; the header records the original rate
+        info = StreamInfo("opus", input_rate or _OPUS_GRANULE_RATE, channels, _OPUS_GRANULE_RATE, pre_skip, 2)
+    else:
+        raise ValueError("Unsupported OGG codec")
+    if not info.sample_rate:
+        raise ValueError("Invalid sample rate")
+    return info
+
+
+def _properties(info: StreamInfo, last_granule: int, size: int) -> dict:
+    duration = max(0, last_granule - info.pre_skip) / info.granule_rate
+    return {
+        "codec": info.codec,
+        "duration_seconds": round(duration, 3),
+        "sample_rate": info.sample_rate,
+        "channels": info.channels,
+        "bitrate_kbps": round(size * 8 / duration / 1000, 1) if duration else None,
+    }
+
+
+def probe_ogg(path: str) -> dict:
+    """Read codec, sample rate, channels and duration from an OGG file's headers.
+
+    Only the first page (codec identification header) and the last page
+    (final granule position) are read, so the cost does not depend on the
+    file's length. Raises ValueError for files that are not OGG Vorbis or
+    Opus.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        first = read_page(f.read(_TAIL_BYTES), 0)
+        if first is None:
+            raise ValueError("Not an OGG file")
+        info = stream_info(first)
+
+        last_granule = None
+        tail_size = _TAIL_BYTES
+        while last_granule is None:
+            start = max(0, size - tail_size)
+            f.seek(start)
+            tail = f.read()
+            offset = tail.rfind(b"OggS")
+            while offset >= 0:
+                page = read_page(tail, offset)
+                if page is not None and page.serial == first.serial and page.granule >= 0:
+                    last_granule = page.granule
+                    break
+                offset = tail.rfind(b"OggS", 0, offset)
+            if start == 0:
+                break
+            tail_size *= 4
+
+    if last_granule is None:
+        raise ValueError("No audio pages found")
+    return _properties(info, last_granule, size)
+
+
+def trim_ogg(source: str, destination: str, start: float, end: Optional[float]) -> dict:
+    """Write the pages of ``source`` covering ``start``..``end`` seconds to ``destination``.
+
+    Cuts fall on page boundaries, so the clip can begin and end up to one
+    page (typically well under a second) outside the requested range; no
+    audio is re-encoded. Header pages are kept, pages are renumbered with
+    fresh checksums, granule positions are shifted so the clip starts at
+    zero and the last page is flagged end-of-stream. Returns the clip's
+    properties as ``probe_ogg`` would.
+    """
+    with open(source, "rb") as f:
+        data = f.read()
+    first = read_page(data, 0)
+    if first is None:
+        raise ValueError("Not an OGG file")
+    info = stream_info(first)
+    start_granule = int(start * info.granule_rate) + info.pre_skip
+    end_granule = None if end is None else int(end * info.granule_rate) + info.pre_skip
+
+    headers: list[Page] = []
+    clip: list[Page] = []
+    header_packets = 0
+    offset, previous_granule, shift = 0, 0, None
+    while offset < len(data):
+        page = read_page(data, offset)
+        if page is None:
+            break
+        offset += page.size
+        if page.serial != first.serial:
+            continue
+        if header_packets < info.header_packets:
+            # Codec headers end on a page boundary before any audio; a lacing value below 255 ends a packet
+            headers.append(page)
+            header_packets += sum(1 for lacing in page.segments if lacing < 255)
+            continue
+        if end_granule is not None and previous_granule >= end_granule:
+            break
+        # Pages without a finished packet (granule -1) are kept once the clip has started
+        if clip or page.granule > start_granule:
+            if shift is None:
+                # Granules already count pre_skip, which the clip's decoder discards again as warm-up
+                shift = previous_granule
+            clip.append(page)
+        if page.granule >= 0:
+            previous_granule = page.granule
+
+    if not clip or not headers:
+        raise ValueError("Requested range is outside the audio")
+
+    pages = headers + [
+        page._replace(granule=page.granule - shift if page.granule >= 0 else -1,
+                      header_type=page.header_type & ~(_BOS | _EOS))
+        for page in clip
+    ]
+    pages[-1] = pages[-1]._replace(header_type=pages[-1].header_type | _EOS)
+    output = b"".join(page.encode(sequence) for sequence, page in enumerate(pages))
+    with open(destination, "wb") as f:
+        f.write(output)
+
+    last_granule = next(page.granule for page in reversed(pages) if page.granule >= 0)
+    return _properties(info, last_granule, len(output))
+
+
+def fingerprint_ogg(path: str) -> dict:
+    """Exact and content fingerprints of an audio file.
+
+    ``sha256`` covers the whole file. ``content_hash`` covers only the audio
+    packets, which read the same however they are paginated, so remuxed
+    copies with different tags, stream serials or checksums still match;
+    it is None for files that are not OGG Vorbis or Opus.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    result = {"sha256": hashlib.sha256(data).hexdigest(), "content_hash": None}
+
+    first = read_page(data, 0)
+    try:
+        info = stream_info(first) if first is not None else None
+    except ValueError:
+        info = None
+    if info is None:
+        return result
+
+    content = hashlib.sha256()
+    header_packets = 0
+    offset = 0
+    while offset < len(data):
+        page = read_page(data, offset)
+        if page is None:
+            break
+        offset += page.size
+        if page.serial != first.serial:
+            continue
+        if header_packets < info.header_packets:
+            header_packets += sum(1 for lacing in page.segments if lacing < 255)
+            continue
+        content.update(page.payload)
+    result["content_hash"] = content.hexdigest()
+    return result
@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import asyncio
+import os
+import structlog
+
+from app.schemas.audio import AudioProperties
+from app.services.audio_cache import audio_cache
+from app.services.ogg import probe_ogg
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_audio_process_pool() -> ProcessPoolExecutor:
+    """Worker processes shared by audio probing and clipping"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.AUDIO_WORKER_PROCESSES or None)
+    return _pool
+
+
+def shutdown_audio_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class AudioProber:
+    """Probes cached audio in a process pool and stores the results with the blob.
+
+    Header parsing is pure Python, so it runs in the audio process pool
+    (``AUDIO_WORKER_PROCESSES``, one per core by default) instead of on
+    the event loop. Concurrent requests for the same asset share one probe, and a result
+    is only stored if the blob was not replaced while it was being probed.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[int, asyncio.Future] = {}
+
+    async def properties(self, asset_id: int) -> Optional[AudioProperties]:
+        """Properties of the cached blob, probing it on first use; None if not cached or not parseable"""
+        found, stored = await audio_cache.load_probe(asset_id)
+        if not found:
+            in_flight = self._in_flight.get(asset_id)
+            if in_flight is None:
+                in_flight = self._in_flight[asset_id] = asyncio.ensure_future(self._probe(asset_id))
+                in_flight.add_done_callback(lambda _: self._in_flight.pop(asset_id, None))
+            stored = await asyncio.shield(in_flight)
+        return AudioProperties(**stored) if stored else None
+
+    async def _probe(self, asset_id: int) -> Optional[dict]:
+        path = audio_cache.path(asset_id)
+        try:
+            before = os.stat(path)
+            properties = await asyncio.get_running_loop().run_in_executor(get_audio_process_pool(), probe_ogg, path)
+        except ValueError as e:
+            logger.info("Audio could not be probed", asset_id=asset_id, error=str(e))
+            properties = None
+        except OSError:
+            return None  # Blob went away mid-probe
+
+        try:
+            after = os.stat(path)
+        except FileNotFoundError:
+            return properties
+        if (after.st_size, after.st_ino) == (before.st_size, before.st_ino):
+            await audio_cache.save_probe(asset_id, properties)
+        return properties
+
+
+audio_prober = AudioProber()
@@ -0,0 +1,292 @@
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional, Sequence
+import math
+import time
+import structlog
+
+from app.redis_client import get_redis
+
+logger = structlog.get_logger(__name__)
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of a rate limit check"""
+    allowed: bool
+    limit: int
+    remaining: int  # Units left after this request, or units still admissible when rejected
+    retry_after: float  # Seconds until the request would be admitted (0 when allowed)
+    reset_after: float  # Seconds until the current fixed bucket rolls over
+
+
+class LimitSpec(NamedTuple):
+    """One limit to enforce: ``limit`` units per ``window`` seconds for ``key`` in namespace ``name``.
+
+    ``fixed`` windows ignore the previous bucket, so counts reset at each
+    window boundary (e.g. daily quotas reset at UTC midnight).
+    """
+    name: str
+    key: str
+    limit: int
+    window: float
+    cost: int = 1
+    fixed: bool = False
+
+
+def sliding_window_result(
+    previous: int, current: int, cost: int, limit: int, window: float, now: float,
+    fixed: bool = False
+) -> RateLimitResult:
+    """Evaluate a sliding-window counter given the previous and current fixed bucket counts"""
+    bucket = int(now // window)
+    elapsed = now - bucket * window
+    weight = 0.0 if fixed else 1.0 - elapsed / window
+    estimated = previous * weight + current
+    reset_after = window - elapsed
+
+    if estimated + cost <= limit:
+        remaining = max(0, math.floor(limit - estimated - cost))
+        return RateLimitResult(True, limit, remaining, 0.0, reset_after)
+
+    if fixed:
+        retry_after = reset_after if cost <= limit else math.inf
+    else:
+        retry_after = _retry_after(previous, current, cost, limit, window, elapsed)
+    # A rejected request records nothing, so report what a smaller request could still use
+    available = max(0, math.floor(limit - estimated))
+    return RateLimitResult(False, limit, available, retry_after, reset_after)
+
+
+def _retry_after(previous: int, current: int, cost: int, limit: int, window: float, elapsed: float) -> float:
+    """Time until the decaying previous bucket leaves room for ``cost`` more"""
+    if cost > limit:
+        return math.inf
+    if current + cost <= limit:
+        # Still in this bucket: wait for previous * weight to drop enough
+        needed_weight = (limit - current - cost) / previous
+        return max(0.0, (1.0 - needed_weight) * window - elapsed)
+    # Only the next bucket can help; its previous count will be today's current
+    until_next = window - elapsed
+    needed_weight = (limit - cost) / current
+    return until_next + max(0.0, (1.0 - needed_weight) * window)
+
+
+class SlidingWindowLimiter:
+    """Sliding-window counter rate limiter.
+
+    Each key keeps only the counts of the current and previous fixed
+    buckets; the previous bucket is weighted by how much of it still
+    overlaps the sliding window. Checks are O(1), memory is three numbers
+    per key, and idle keys are expired incrementally from the LRU end
+    instead of by sweeping every key on each request.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100_000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [bucket index, previous bucket count, current bucket count]
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()
+
+    def check(self, key: Hashable, cost: int = 1, now: Optional[float] = None,
+              limit: Optional[int] = None, fixed: bool = False) -> RateLimitResult:
+        """Evaluate a request without recording it"""
+        now = time.time() if now is None else now
+        bucket = int(now // self.window)
+        previous, current = self._counts(self._entries.get(key), bucket)
+        return sliding_window_result(
+            previous, current, cost, self.limit if limit is None else limit, self.window, now, fixed
+        )
+
+    def hit(self, key: Hashable, cost: int = 1, now: Optional[float] = None,
+            limit: Optional[int] = None, fixed: bool = False) -> RateLimitResult:
+        """Evaluate a request and record it if admitted"""
+        now = time.time() if now is None else now
+        result = self.check(key, cost, now, limit, fixed)
+
+        if result.allowed:
+            self.record(key, cost, now)
+        return result
+
+    def record(self, key: Hashable, cost: int = 1, now: Optional[float] = None):
+        """Unconditionally add ``cost`` to the key's current bucket"""
+        now = time.time() if now is None else now
+        bucket = int(now // self.window)
+        entry = self._entries.get(key)
+        previous, current = self._counts(entry, bucket)
+        if entry is None:
+            self._entries[key] = [bucket, previous, current + cost]
+        else:
+            entry[0], entry[1], entry[2] = bucket, previous, current + cost
+            self._entries.move_to_end(key)
+        self._expire(bucket)
+
+    def _counts(self, entry: Optional[list], bucket: int) -> tuple[int, int]:
+        if entry is None:
+            return 0, 0
+        entry_bucket, previous, current = entry
+        if entry_bucket == bucket:
+            return previous, current
+        if entry_bucket == bucket - 1:
+            return current, 0
+        return 0, 0
+
+    def _expire(self, bucket: int):
+        # Amortized cleanup: drop a couple of fully expired keys from the cold end
+        for _ in range(2):
+            if not self._entries:
+                break
+            oldest_key, oldest = next(iter(self._entries.items()))
+            if oldest[0] >= bucket - 1:
+                break
+            del self._entries[oldest_key]
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def rate_limit_headers(result: RateLimitResult) -> dict[str, str]:
+    """Standard X-RateLimit-* headers (plus Retry-After when rejected)"""
+    headers = {
+        "X-RateLimit-Limit": str(result.limit),
+        "X-RateLimit-Remaining": str(result.remaining),
+        "X-RateLimit-Reset": str(math.ceil(result.reset_after)),
+    }
+    if not result.allowed and math.isfinite(result.retry_after):
+        headers["Retry-After"] = str(max(1, math.ceil(result.retry_after)))
+    return headers
+
+
+class RateLimitBackend:
+    """Storage for rate limit counters.
+
+    ``hit_many`` is all-or-nothing: the request is recorded against every
+    spec only when every spec admits it, so one rejected limit never
+    consumes budget from the others.
+    """
+
+    async def hit_many(self, specs: Sequence[LimitSpec], now: Optional[float] = None) -> list[RateLimitResult]:
+        raise NotImplementedError
+
+    async def hit(self, spec: LimitSpec, now: Optional[float] = None) -> RateLimitResult:
+        return (await self.hit_many([spec], now))[0]
+
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """Per-process counters; exact for a single worker"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._limiters: dict[tuple[str, float], SlidingWindowLimiter] = {}
+
+    def _limiter(self, spec: LimitSpec) -> SlidingWindowLimiter:
+        limiter = self._limiters.get((spec.name, spec.window))
+        if limiter is None:
+            limiter = SlidingWindowLimiter(spec.limit, spec.window, self.max_keys)
+            self._limiters[(spec.name, spec.window)] = limiter
+        return limiter
+
+    async def hit_many(self, specs: Sequence[LimitSpec], now: Optional[float] = None) -> list[RateLimitResult]:
+        now = time.time() if now is None else now
+        results = [
+            self._limiter(spec).check(spec.key, spec.cost, now, limit=spec.limit, fixed=spec.fixed)
+            for spec in specs
+        ]
+        if all(result.allowed for result in results):
+            for spec in specs:
+                self._limiter(spec).record(spec.key, spec.cost, now)
+        return results
+
+
+# Check every limit, then record all of them only if all admit the request.
+# KEYS: per limit, the current bucket key followed by the previous bucket key.
+# ARGV: per limit, limit, cost, previous-bucket weight and key TTL.
+# Returns {admitted, previous_1, current_1, previous_2, current_2, ...}.
+SLIDING_WINDOW_LUA = """
+local admitted = 1
+local counts = {}
+local n = #KEYS / 2
+for i = 1, n do
+    local limit = tonumber(ARGV[4 * i - 3])
+    local cost = tonumber(ARGV[4 * i - 2])
+    local weight = tonumber(ARGV[4 * i - 1])
+    local current = tonumber(redis.call('GET', KEYS[2 * i - 1]) or '0')
+    local previous = tonumber(redis.call('GET', KEYS[2 * i]) or '0')
+    if previous * weight + current + cost > limit then
+        admitted = 0
+    end
+    counts[2 * i - 1] = previous
+    counts[2 * i] = current
+end
+if admitted == 1 then
+    for i = 1, n do
+        redis.call('INCRBY', KEYS[2 * i - 1], ARGV[4 * i - 2])
+        redis.call('EXPIRE', KEYS[2 * i - 1], ARGV[4 * i])
+    end
+end
+table.insert(counts, 1, admitted)
+return counts
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Counters shared by every worker, updated atomically in one round trip per check.
+
+    If Redis is unreachable the check is answered by a local backend and
+    Redis is skipped for a short cooldown, so an outage degrades to
+    per-process limits instead of failing requests or adding timeouts.
+    """
+
+    def __init__(self, redis, fallback: Optional[RateLimitBackend] = None,
+                 prefix: str = "rl", retry_seconds: float = 5.0):
+        self.redis = redis
+        self.fallback = fallback or LocalRateLimitBackend()
+        self.prefix = prefix
+        self.retry_seconds = retry_seconds
+        self._script = redis.register_script(SLIDING_WINDOW_LUA)
+        self._unavailable_until = 0.0
+
+    async def hit_many(self, specs: Sequence[LimitSpec], now: Optional[float] = None) -> list[RateLimitResult]:
+        now = time.time() if now is None else now
+        if time.monotonic() < self._unavailable_until:
+            return await self.fallback.hit_many(specs, now)
+
+        keys: list[str] = []
+        args: list = []
+        for spec in specs:
+            bucket = int(now // spec.window)
+            base = f"{self.prefix}:{{{spec.name}:{spec.key}}}"
+            weight = 0.0 if spec.fixed else 1.0 - (now - bucket * spec.window) / spec.window
+            keys += [f"{base}:{bucket}", f"{base}:{bucket - 1}"]
+            args += [spec.limit, spec.cost, repr(weight), math.ceil(spec.window * 2)]
+
+        try:
+            reply = await self._script(keys=keys, args=args)
+        except Exception as e:
+            self._unavailable_until = time.monotonic() + self.retry_seconds
+            logger.warning("Rate limit store unavailable, using local limits", error=str(e))
+            return await self.fallback.hit_many(specs, now)
+
+        counts = [int(value) for value in reply[1:]]
+        return [
+            sliding_window_result(
+                counts[2 * i], counts[2 * i + 1], spec.cost, spec.limit, spec.window, now, spec.fixed
+            )
+            for i, spec in enumerate(specs)
+        ]
+
+
+_backend: Optional[RateLimitBackend] = None
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    """Shared backend: Redis when enabled (with local fallback), otherwise in-process"""
+    global _backend
+    if _backend is None:
+        redis = get_redis()
+        if redis is not None:
+            _backend = RedisRateLimitBackend(redis)
+        else:
+            _backend = LocalRateLimitBackend()
+    return _backend
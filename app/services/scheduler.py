@@ -0,0 +1,167 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Hashable, Optional
+import asyncio
+import heapq
+import itertools
+import time
+
+from app.config import settings
+from app.services.credentials import configured_cookies
+
+
+class _Flow:
+    """Per-principal queue state"""
+    __slots__ = ("key", "weight", "tier", "last_finish", "queued", "in_flight",
+                 "dispatched", "total_wait", "max_wait")
+
+    def __init__(self, key: Hashable, weight: float, tier: str):
+        self.key = key
+        self.weight = weight
+        self.tier = tier
+        self.last_finish = 0.0  # Virtual finish tag of the flow's latest request
+        self.queued = 0
+        self.in_flight = 0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class FairShareScheduler:
+    """Weighted fair queueing in front of upstream fetches.
+
+    Requests are tagged with start-time fair queueing virtual times: a flow's
+    next request starts at the later of the current virtual time and the
+    flow's previous finish tag, and advances it by ``cost / weight``. Free
+    slots go to the smallest start tag, so a principal with a deep backlog
+    only delays others by its fair share while a light user's next request
+    is served almost immediately. At most ``max_concurrency`` fetches run at
+    once across all principals.
+    """
+
+    def __init__(self, max_concurrency: int, sample_size: int = 1000):
+        self.max_concurrency = max_concurrency
+        self._active = 0
+        self._virtual_time = 0.0
+        self._heap: list[tuple[float, int, asyncio.Future, _Flow, float]] = []
+        self._sequence = itertools.count()
+        self._flows: dict[Hashable, _Flow] = {}
+        self._waits: dict[str, deque] = {}
+        self._sample_size = sample_size
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable, weight: float = 1.0, tier: str = "standard", cost: float = 1.0):
+        """Hold one upstream slot for the duration of the block"""
+        flow = await self.acquire(key, weight, tier, cost)
+        try:
+            yield
+        finally:
+            self.release(flow)
+
+    async def acquire(self, key: Hashable, weight: float = 1.0, tier: str = "standard",
+                      cost: float = 1.0) -> _Flow:
+        flow = self._flows.get(key)
+        if flow is None:
+            flow = self._flows[key] = _Flow(key, weight, tier)
+        flow.weight, flow.tier = weight, tier
+
+        start = max(self._virtual_time, flow.last_finish)
+        flow.last_finish = start + cost / weight
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (start, next(self._sequence), future, flow, time.monotonic()))
+        flow.queued += 1
+        self._dispatch()  # Resolves immediately when a slot is free
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted as we were cancelled; hand it on
+                self.release(flow)
+            else:
+                flow.queued -= 1
+                self._forget(flow)
+            raise
+        return flow
+
+    def release(self, flow: _Flow):
+        self._active -= 1
+        flow.in_flight -= 1
+        self._dispatch()
+        self._forget(flow)
+
+    def _grant(self, flow: _Flow, wait: float):
+        self._active += 1
+        flow.in_flight += 1
+        flow.dispatched += 1
+        flow.total_wait += wait
+        flow.max_wait = max(flow.max_wait, wait)
+        samples = self._waits.get(flow.tier)
+        if samples is None:
+            samples = self._waits[flow.tier] = deque(maxlen=self._sample_size)
+        samples.append(wait)
+
+    def _dispatch(self):
+        while self._active < self.max_concurrency and self._heap:
+            start, _, future, flow, enqueued_at = heapq.heappop(self._heap)
+            if future.done():
+                continue  # Waiter was cancelled
+            flow.queued -= 1
+            self._virtual_time = start
+            self._grant(flow, time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    def _forget(self, flow: _Flow):
+        # An idle flow restarts at the current virtual time, so its tags need not be kept
+        if flow.queued == 0 and flow.in_flight == 0:
+            self._flows.pop(flow.key, None)
+
+    @property
+    def load(self) -> float:
+        """Running plus queued fetches as a fraction of capacity"""
+        return (self._active + len(self._heap)) / self.max_concurrency
+
+    def metrics(self) -> dict:
+        """Global, per-tier and per-queue scheduling metrics (queues listed while active)"""
+        tiers = {}
+        for tier, samples in self._waits.items():
+            ordered = sorted(samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            tiers[tier] = {
+                "samples": len(ordered),
+                "avg_wait_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p95_wait_ms": round(p95 * 1000, 2),
+            }
+        queues = [
+            {
+                "principal": str(flow.key),
+                "tier": flow.tier,
+                "weight": flow.weight,
+                "queued": flow.queued,
+                "in_flight": flow.in_flight,
+                "dispatched": flow.dispatched,
+                "avg_wait_ms": round(flow.total_wait / flow.dispatched * 1000, 2) if flow.dispatched else 0.0,
+                "max_wait_ms": round(flow.max_wait * 1000, 2),
+            }
+            for flow in sorted(self._flows.values(), key=lambda f: f.queued, reverse=True)[:20]
+        ]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "queued": sum(flow.queued for flow in self._flows.values()),
+            "tiers": tiers,
+            "queues": queues,
+        }
+
+
+_scheduler: Optional[FairShareScheduler] = None
+
+
+def get_upstream_scheduler() -> FairShareScheduler:
+    """Process-wide scheduler shared by all AudioService instances"""
+    global _scheduler
+    if _scheduler is None:
+        # Roblox limits each account separately, so capacity grows with the credential pool
+        credentials = max(1, len(configured_cookies()))
+        _scheduler = FairShareScheduler(settings.UPSTREAM_MAX_CONCURRENCY * credentials)
+    return _scheduler
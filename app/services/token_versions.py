@@ -0,0 +1,104 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Optional
+import asyncio
+import structlog
+
+from app.database import async_session_factory
+from app.models.user import User
+from app.redis_client import get_redis
+from app.services.cache import TTLCache
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+REDIS_KEY = "auth:token_versions"
+# Present while the hash holds every revoked user; without it a missing field proves nothing
+SEEDED_FIELD = "__seeded__"
+
+
+class TokenVersionStore:
+    """Per-user token versions used to invalidate stateless JWTs.
+
+    Redis is used when enabled so every worker sees a bump at once; only
+    users that have ever had their tokens revoked appear there, so the hash
+    stays small. If it was flushed or evicted it is reseeded from the
+    database before answering, and while Redis is unreachable versions are
+    read from the database. Without Redis, versions are read from the
+    database and cached per user for ``TOKEN_VERSION_CACHE_SECONDS``, which
+    bounds how long another worker can miss a bump. Versions only grow, so
+    a lookup never returns less than this process has seen.
+    """
+
+    def __init__(self, session_factory=async_session_factory):
+        self._session_factory = session_factory
+        self._versions: dict[int, int] = {}
+        self._db_versions = TTLCache(maxsize=100000, ttl=settings.TOKEN_VERSION_CACHE_SECONDS)
+        self._reseeding: Optional[asyncio.Future] = None
+
+    async def get(self, user_id: int) -> int:
+        redis = get_redis()
+        if redis is None:
+            version = self._db_versions.get(user_id)
+            if version is None:
+                version = await self._read_db(user_id)
+                self._db_versions.set(user_id, version)
+            return max(version, self._versions.get(user_id, 0))
+        try:
+            value, seeded = await redis.hmget(REDIS_KEY, [str(user_id), SEEDED_FIELD])
+        except Exception as e:
+            logger.warning("Token version lookup failed, reading database", error=str(e))
+            return await self._read_db(user_id)
+        if seeded is None:
+            await self._reseed()
+            return self._versions.get(user_id, 0)
+        return max(int(value or 0), self._versions.get(user_id, 0))
+
+    async def set(self, user_id: int, version: int):
+        """Record a bump; raises if the other workers could not be told about it"""
+        self._versions[user_id] = max(version, self._versions.get(user_id, 0))
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.hset(REDIS_KEY, str(user_id), version)
+            except Exception as e:
+                logger.error("Token version update failed", user_id=user_id, error=str(e))
+                raise
+
+    async def load_from_db(self, db: AsyncSession):
+        """Seed the store with every user whose tokens have been revoked"""
+        result = await db.execute(
+            select(User.id, User.token_version).where(User.token_version > 0)
+        )
+        rows = result.all()
+        for row in rows:
+            self._versions[row.id] = max(row.token_version, self._versions.get(row.id, 0))
+        redis = get_redis()
+        if redis is not None:
+            mapping = {str(row.id): row.token_version for row in rows}
+            try:
+                await redis.hset(REDIS_KEY, mapping={**mapping, SEEDED_FIELD: 1})
+            except Exception as e:
+                # Lookups keep reseeding until this succeeds
+                logger.warning("Token versions could not be written to Redis", error=str(e))
+        logger.info("Token versions loaded", users=len(rows))
+
+    async def _reseed(self):
+        if self._reseeding is None:
+            self._reseeding = asyncio.ensure_future(self._reload())
+            self._reseeding.add_done_callback(lambda _: setattr(self, "_reseeding", None))
+        await asyncio.shield(self._reseeding)
+
+    async def _reload(self):
+        logger.warning("Token versions missing from Redis, reseeding from database")
+        async with self._session_factory() as db:
+            await self.load_from_db(db)
+
+    async def _read_db(self, user_id: int) -> int:
+        async with self._session_factory() as db:
+            result = await db.execute(select(User.token_version).where(User.id == user_id))
+            version = result.scalar_one_or_none() or 0
+        return max(version, self._versions.get(user_id, 0))
+
+
+token_versions = TokenVersionStore()
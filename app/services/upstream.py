@@ -0,0 +1,410 @@
+from email.utils import parsedate_to_datetime
+from datetime import timezone
+from collections import deque
+from typing import Optional
+from urllib.parse import urlsplit
+import asyncio
+import random
+import time
+import httpx
+import structlog
+
+from app.config import settings
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.credentials import CredentialPool, RobloxCredential, configured_cookies
+
+logger = structlog.get_logger(__name__)
+
+# Statuses that mean the upstream wants us to slow down
+THROTTLE_STATUSES = {429, 503}
+
+# Transient failures worth another attempt, and the methods safe to repeat
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised instead of sending a request that cannot succeed right now"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamThrottledError(UpstreamUnavailableError):
+    """The upstream host would not accept the request in time"""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Upstream {host} is rate limiting us; retry in {retry_after:.0f}s", retry_after)
+        self.host = host
+
+
+class UpstreamCircuitOpenError(UpstreamUnavailableError):
+    """The endpoint's circuit breaker is open"""
+
+    def __init__(self, error: CircuitOpenError):
+        super().__init__(str(error), error.retry_after)
+        self.endpoint = error.name
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now = time.time() if now is None else now
+    return max(0.0, when.timestamp() - now)
+
+
+class HostGovernor:
+    """Token bucket for one upstream host with an AIMD-adjusted refill rate.
+
+    Each success raises the rate by roughly ``increase`` requests/second per
+    second of full utilisation; each throttling response halves it and
+    pauses the host for the advertised Retry-After. Callers reserve a token
+    up front and sleep until it is due, or are shed immediately when that
+    wait would exceed ``max_wait``. A throttling response seen while they
+    sleep extends the wait, and shed them if it no longer fits.
+    """
+
+    def __init__(self, host: str, rate: float, burst: float, min_rate: float, max_rate: float,
+                 max_wait: float, increase: float = 1.0, decrease: float = 0.5):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_wait = max_wait
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = burst
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self.sent = 0
+        self.throttled = 0
+        self.shed = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        """Take a token and return how long to wait before using it"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+        wait = max(self.blocked_until - now, -self.tokens / self.rate if self.tokens < 0 else 0.0)
+        if wait > self.max_wait:
+            self.tokens += 1
+            self.shed += 1
+            raise UpstreamThrottledError(self.host, wait)
+        return wait
+
+    async def acquire(self):
+        now = time.monotonic()
+        deadline = now + self.max_wait
+        wait = self.reserve(now)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            # A 429 may have arrived while we slept
+            now = time.monotonic()
+            wait = self.blocked_until - now
+            if now + wait > deadline:
+                self.tokens += 1
+                self.shed += 1
+                raise UpstreamThrottledError(self.host, wait)
+        self.sent += 1
+
+    def observe(self, status_code: int, retry_after: Optional[float] = None, now: Optional[float] = None):
+        """Adapt the rate to an upstream response"""
+        now = time.monotonic() if now is None else now
+        if status_code in THROTTLE_STATUSES:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.blocked_until = max(self.blocked_until, now + pause)
+            logger.warning("Upstream throttled us", host=self.host, status_code=status_code,
+                           rate=round(self.rate, 2), retry_after=retry_after)
+        elif status_code < 500:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "rate_per_second": round(self.rate, 2),
+            "tokens": round(self.tokens, 2),
+            "blocked_for_seconds": round(max(0.0, self.blocked_until - now), 2),
+            "sent": self.sent,
+            "throttled": self.throttled,
+            "shed": self.shed,
+        }
+
+
+class RetryBudget:
+    """Caps retries and hedges to a fraction of overall traffic.
+
+    Every request deposits ``ratio`` tokens and every extra attempt spends
+    one, so during an outage retries add at most ``ratio`` extra load
+    instead of multiplying it. ``min_tokens`` keeps a small allowance for
+    quiet periods.
+    """
+
+    def __init__(self, ratio: float, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max(min_tokens, max_tokens)
+        self.tokens = min_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LatencyTracker:
+    """Recent successful response times for one endpoint"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples: deque = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class UpstreamClient:
+    """Shared HTTP client for Roblox.
+
+    Every request passes its endpoint's circuit breaker and a rate governor.
+    Authenticated requests carry a credential from the pool and are paced
+    per host *and* credential, since Roblox limits each account separately;
+    their responses feed the credential's health. Idempotent requests are
+    retried with jittered backoff within a shared retry budget and can be
+    hedged once they run past the endpoint's observed p95.
+    """
+
+    def __init__(self, cookies: Optional[list[str]] = None):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._governors: dict[str, HostGovernor] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._latency: dict[str, LatencyTracker] = {}
+        self.retry_budget = RetryBudget(settings.UPSTREAM_RETRY_BUDGET_RATIO)
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.credentials = CredentialPool(
+            configured_cookies() if cookies is None else cookies,
+            settings.ROBLOX_COOKIE_RECHECK_SECONDS
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=settings.UPSTREAM_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.UPSTREAM_MAX_CONCURRENCY * max(1, len(self.credentials)) * 2
+                )
+            )
+        return self._client
+
+    def governor(self, host: str, credential: Optional[RobloxCredential] = None) -> HostGovernor:
+        key = host if credential is None else f"{host}#{credential.index}"
+        governor = self._governors.get(key)
+        if governor is None:
+            governor = self._governors[key] = HostGovernor(
+                key,
+                rate=settings.UPSTREAM_RATE_PER_SECOND,
+                burst=settings.UPSTREAM_BURST,
+                min_rate=settings.UPSTREAM_MIN_RATE_PER_SECOND,
+                max_rate=settings.UPSTREAM_MAX_RATE_PER_SECOND,
+                max_wait=settings.UPSTREAM_MAX_QUEUE_SECONDS,
+            )
+        return governor
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(
+                endpoint,
+                failure_ratio=settings.UPSTREAM_BREAKER_FAILURE_RATIO,
+                min_calls=settings.UPSTREAM_BREAKER_MIN_CALLS,
+                window=settings.UPSTREAM_BREAKER_WINDOW,
+                open_seconds=settings.UPSTREAM_BREAKER_OPEN_SECONDS,
+            )
+        return breaker
+
+    def latency(self, endpoint: str) -> LatencyTracker:
+        tracker = self._latency.get(endpoint)
+        if tracker is None:
+            tracker = self._latency[endpoint] = LatencyTracker(
+                min_samples=settings.UPSTREAM_HEDGE_MIN_SAMPLES
+            )
+        return tracker
+
+    async def request(self, method: str, url: str, endpoint: Optional[str] = None,
+                      credential: Optional[RobloxCredential] = None, idempotent: Optional[bool] = None,
+                      hedge: bool = False, **kwargs) -> httpx.Response:
+        """Send a request, retrying transient failures when it is safe to.
+
+        ``endpoint`` names the breaker to use (defaults to the host).
+        ``credential`` comes from ``credentials.select()`` and is released
+        here whatever happens; retries select a fresh one. ``idempotent``
+        defaults to the HTTP method's semantics, and ``hedge`` enables a
+        duplicate request for slow unauthenticated calls.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        authenticated = credential is not None
+        self.retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                if hedge and idempotent and not authenticated:
+                    response = await self._send_hedged(method, url, endpoint, **kwargs)
+                else:
+                    response = await self._send(method, url, endpoint, credential, **kwargs)
+                if response.status_code not in RETRYABLE_STATUSES:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None and retry_after > settings.UPSTREAM_RETRY_MAX_SECONDS:
+                    return response  # Upstream asked for a longer pause than a retry should wait
+            except httpx.TransportError as e:
+                error = e
+
+            if not idempotent or attempt >= settings.UPSTREAM_MAX_RETRIES or not self.retry_budget.withdraw():
+                if error is not None:
+                    raise error
+                return response
+
+            attempt += 1
+            self.retries += 1
+            # Full jitter keeps retries from many callers from arriving in lockstep
+            delay = random.uniform(0, min(settings.UPSTREAM_RETRY_MAX_SECONDS,
+                                          settings.UPSTREAM_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+            logger.info("Retrying upstream request", url=url, attempt=attempt, delay=round(delay, 3),
+                        status_code=response.status_code if response is not None else None,
+                        error=str(error) if error is not None else None)
+            await asyncio.sleep(delay)
+
+            if authenticated:
+                credential = self.credentials.select()
+                if credential is None:
+                    if error is not None:
+                        raise error
+                    return response
+
+    async def _send_hedged(self, method: str, url: str, endpoint: Optional[str], **kwargs) -> httpx.Response:
+        """Send once, and again in parallel if the first attempt outlives the endpoint's p95"""
+        threshold = self.latency(endpoint or urlsplit(url).hostname or "").p95()
+        first = asyncio.create_task(self._send(method, url, endpoint, None, **kwargs))
+        if threshold is None:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=threshold)
+        if done or not self.retry_budget.withdraw():
+            return await first
+
+        self.hedges += 1
+        second = asyncio.create_task(self._send(method, url, endpoint, None, **kwargs))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRYABLE_STATUSES:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+            return first.result()  # Both failed: report the original attempt's outcome
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(self, method: str, url: str, endpoint: Optional[str],
+                    credential: Optional[RobloxCredential], **kwargs) -> httpx.Response:
+        """One attempt through the breaker, governor and credential pool"""
+        status_code = None
+        try:
+            host = urlsplit(url).hostname or ""
+            endpoint = endpoint or host
+            breaker = self.breaker(endpoint)
+            governor = self.governor(host, credential)
+            if credential is not None:
+                kwargs["headers"] = {**(kwargs.get("headers") or {}), "Cookie": credential.cookie_header}
+            try:
+                breaker.before_call()
+            except CircuitOpenError as e:
+                raise UpstreamCircuitOpenError(e) from None
+
+            try:
+                await governor.acquire()
+                started = time.monotonic()
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                breaker.record(False)
+                if isinstance(e, httpx.TimeoutException):
+                    governor.observe(503)  # Timeouts are the upstream being overloaded too
+                raise
+            except BaseException:
+                breaker.abandon()
+                raise
+
+            status_code = response.status_code
+            governor.observe(status_code, parse_retry_after(response.headers.get("Retry-After")))
+            breaker.record(status_code < 500)
+            if status_code < 400:
+                self.latency(endpoint).record(time.monotonic() - started)
+            return response
+        finally:
+            if credential is not None:
+                self.credentials.release(credential, status_code)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def metrics(self) -> dict:
+        return {
+            "hosts": {host: governor.metrics() for host, governor in self._governors.items()},
+            "endpoints": {name: breaker.metrics() for name, breaker in self._breakers.items()},
+            "credentials": self.credentials.metrics(),
+            "retries": {
+                "budget_tokens": round(self.retry_budget.tokens, 2),
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            },
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+upstream = UpstreamClient()
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import structlog
+
+from sqlalchemy import select, func
+
+from app.database import async_session_factory
+from app.models.audio_log import AudioDownloadLog
+from app.services.audio import AudioService, asset_info_cache
+from app.services.audio_cache import audio_cache
+from app.services.scheduler import get_upstream_scheduler
+from app.services.upstream import upstream, UpstreamUnavailableError
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+# Upstream calls per refresh: asset delivery + catalog lookup, or audio URL + CDN fetch
+INFO_REFRESH_COST = 2
+AUDIO_FETCH_COST = 2
+
+
+class CacheWarmer:
+    """Keeps the most downloaded assets in the metadata and audio caches ahead of demand.
+
+    Each cycle ranks assets by successful downloads per hour over the last
+    ``CACHE_WARMER_WINDOW_HOURS`` and, for the top ``CACHE_WARMER_TOP_N``,
+    refreshes catalog details and audio that are missing or would go stale
+    before the next cycle. Fetches run as the "system" flow of the fair
+    scheduler, stop as soon as upstream load rises above
+    ``CACHE_WARMER_MAX_LOAD`` and spend at most ``CACHE_WARMER_UPSTREAM_BUDGET``
+    upstream calls per cycle. The first cycle runs at startup, so a deploy
+    starts with the hot set cached.
+    """
+
+    def __init__(self, session_factory=async_session_factory):
+        self._session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self.cycles = 0
+        self.skipped_busy = 0
+        self.info_refreshed = 0
+        self.audio_fetched = 0
+        self.last_hot_set: list[dict] = []
+
+    def start(self):
+        if settings.CACHE_WARMER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def hot_assets(self, db) -> list[tuple[int, float]]:
+        """Top assets as (asset_id, downloads per hour) over the velocity window"""
+        window_hours = settings.CACHE_WARMER_WINDOW_HOURS
+        since = datetime.utcnow() - timedelta(hours=window_hours)
+        downloads = func.count(AudioDownloadLog.id)
+        result = await db.execute(
+            select(AudioDownloadLog.asset_id, downloads)
+            .where(AudioDownloadLog.success == True, AudioDownloadLog.created_at >= since)
+            .group_by(AudioDownloadLog.asset_id)
+            .order_by(downloads.desc())
+            .limit(settings.CACHE_WARMER_TOP_N)
+        )
+        return [(asset_id, count / window_hours) for asset_id, count in result.all()]
+
+    @staticmethod
+    def _busy() -> bool:
+        return get_upstream_scheduler().load > settings.CACHE_WARMER_MAX_LOAD
+
+    async def warm_once(self) -> dict:
+        """Run one warming cycle and report what it did"""
+        report = {"hot": 0, "info_refreshed": 0, "audio_fetched": 0, "budget_left": 0, "stopped": None}
+        if not upstream.credentials.configured:
+            report["stopped"] = "no_credentials"
+            return report
+
+        budget = settings.CACHE_WARMER_UPSTREAM_BUDGET
+        # Refresh anything that would go stale before the next cycle
+        info_refresh_age = settings.ASSET_INFO_FRESH_SECONDS - settings.CACHE_WARMER_INTERVAL_SECONDS
+        audio_refresh_age = settings.AUDIO_CACHE_FRESH_SECONDS - settings.CACHE_WARMER_INTERVAL_SECONDS
+        async with self._session_factory() as db:
+            hot = await self.hot_assets(db)
+        report["hot"] = len(hot)
+        self.last_hot_set = [{"asset_id": a, "downloads_per_hour": round(v, 2)} for a, v in hot[:20]]
+
+        # Refreshes only talk to upstream, so no database connection is held while they wait
+        service = AudioService(None)
+        for asset_id, _ in hot:
+            info_age = asset_info_cache.age(asset_id)
+            audio_age = audio_cache.age(asset_id)
+            needs_info = info_age is None or info_age >= info_refresh_age
+            needs_audio = audio_age is None or audio_age >= audio_refresh_age
+            cost = INFO_REFRESH_COST * needs_info + AUDIO_FETCH_COST * needs_audio
+            if not cost:
+                continue
+            if cost > budget:
+                report["stopped"] = "budget"
+                break
+            if self._busy():
+                report["stopped"] = "busy"
+                break
+
+            budget -= cost
+            try:
+                if needs_info:
+                    await service.fetch_asset_info(asset_id)
+                    report["info_refreshed"] += 1
+                if needs_audio and await service.refresh_audio(asset_id):
+                    report["audio_fetched"] += 1
+            except UpstreamUnavailableError:
+                report["stopped"] = "upstream_unavailable"
+                break
+            except Exception as e:
+                logger.warning("Cache warming failed for asset", asset_id=asset_id, error=str(e))
+
+        report["budget_left"] = budget
+        self.info_refreshed += report["info_refreshed"]
+        self.audio_fetched += report["audio_fetched"]
+        return report
+
+    async def _run(self):
+        while True:
+            try:
+                if self._busy():
+                    self.skipped_busy += 1
+                else:
+                    report = await self.warm_once()
+                    self.cycles += 1
+                    if report["info_refreshed"] or report["audio_fetched"]:
+                        logger.info("Cache warming cycle complete", **report)
+            except Exception as e:
+                logger.error("Cache warming cycle failed", error=str(e))
+            await asyncio.sleep(settings.CACHE_WARMER_INTERVAL_SECONDS)
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": settings.CACHE_WARMER_ENABLED,
+            "cycles": self.cycles,
+            "skipped_busy": self.skipped_busy,
+            "info_refreshed": self.info_refreshed,
+            "audio_fetched": self.audio_fetched,
+            "hot_set": self.last_hot_set,
+        }
+
+
+cache_warmer = CacheWarmer()
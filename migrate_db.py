@@ -15,7 +15,7 @@ from pathlib import Path
 # Add the app directory to Python path
 sys.path.append(str(Path(__file__).parent / "app"))
 
-from sqlalchemy import text, select
+from sqlalchemy import text, select, inspect
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import async_session_factory, engine
 from app.models.user import User
@@ -74,6 +74,17 @@ async def migrate_database():
         # Create all tables
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            # create_all does not touch existing tables; add newer columns and indexes explicitly
+            columns = await conn.run_sync(
+                lambda sync_conn: [c["name"] for c in inspect(sync_conn).get_columns("users")]
+            )
+            if "token_version" not in columns:
+                await conn.execute(text(
+                    "ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"
+                ))
+            await conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_client_id ON users (client_id)"
+            ))
         
         print("✅ Database tables created/updated successfully")
         
@@ -97,3 +97,1294 @@ def test_user_login(client):
     assert response.status_code == 200
     assert "access_token" in response.json()
     assert response.json()["token_type"] == "bearer"
+
+
+def test_ttl_cache_expiry_and_bound():
+    """TTL cache drops expired entries and evicts least recently used ones"""
+    from app.services.cache import TTLCache
+
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    cache.set("short", 4, ttl=0)
+    assert cache.get("short") is None
+
+
+def test_client_token_endpoint_caches_verified_secrets(monkeypatch):
+    """POST /auth/token accepts form and Basic credentials, skips bcrypt when cached and rejects rotated secrets"""
+    from sqlalchemy import update
+    from app.models.user import User
+    from app.services import auth as auth_module
+    from app.services.auth import AuthService, client_secret_cache
+
+    bcrypt_checks = []
+    verify_password = AuthService.verify_password
+    monkeypatch.setattr(AuthService, "verify_password",
+                        lambda self, plain, hashed: bcrypt_checks.append(plain) or verify_password(self, plain, hashed))
+    client_secret_cache.clear()
+
+    async def setup():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with TestingSessionLocal() as db:
+            user = User(username="bot-owner", email="bot@example.com", hashed_password="x")
+            db.add(user)
+            await db.commit()
+            return user.id, await AuthService(db).generate_client_credentials(user.id, "bot")
+
+    async def rotate(user_id: int, new_secret: str):
+        async with TestingSessionLocal() as db:
+            hashed = AuthService(db).get_password_hash(new_secret)
+            await db.execute(update(User).where(User.id == user_id).values(client_secret=hashed))
+            await db.commit()
+
+    async def teardown():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await test_engine.dispose()
+
+    with TestClient(app, base_url="http://localhost") as c:
+        user_id, credentials = c.portal.call(setup)
+        form = {"grant_type": "client_credentials", "client_id": credentials.client_id,
+                "client_secret": credentials.client_secret}
+
+        response = c.post("/auth/token", data=form)
+        assert response.status_code == 200 and response.json()["token_type"] == "bearer"
+        assert bcrypt_checks == [credentials.client_secret]
+
+        # Same secret over HTTP Basic: answered from the cache without bcrypt
+        response = c.post("/auth/token", data={"grant_type": "client_credentials"},
+                          auth=(credentials.client_id, credentials.client_secret))
+        assert response.status_code == 200 and response.json()["access_token"]
+        assert len(bcrypt_checks) == 1
+
+        response = c.post("/auth/token", data={**form, "client_secret": "secret_wrong"})
+        assert response.status_code == 401 and response.headers["WWW-Authenticate"] == "Basic"
+
+        c.portal.call(rotate, user_id, "secret_rotated")
+        assert auth_module._client_secret_cache_key(credentials.client_id, credentials.client_secret) in client_secret_cache
+        assert c.post("/auth/token", data=form).status_code == 401
+        assert c.post("/auth/token", data={**form, "client_secret": "secret_rotated"}).status_code == 200
+        c.portal.call(teardown)
+
+
+def test_api_key_header_authenticates_and_tracks_usage(monkeypatch):
+    """X-API-Key authenticates with a live key only, records usage, and loses to a Bearer token"""
+    import hashlib
+    from datetime import datetime, timedelta
+    from sqlalchemy import select
+    from app.models.api_key import APIKey
+    from app.models.user import User
+    from app.services import token_versions as token_versions_module
+    from app.services.auth import AuthService, access_token_claims
+    from app.services.cache import TTLCache
+
+    store = token_versions_module.token_versions
+    monkeypatch.setattr(token_versions_module, "get_redis", lambda: None)
+    monkeypatch.setattr(store, "_session_factory", TestingSessionLocal)
+    monkeypatch.setattr(store, "_versions", {})
+    monkeypatch.setattr(store, "_db_versions", TTLCache(maxsize=10, ttl=60))
+
+    def raw_key(user_id, name, **values):
+        key = f"rapi_{name}"
+        return key, APIKey(user_id=user_id, key_hash=hashlib.sha256(key.encode()).hexdigest(),
+                           key_preview=key[:8] + "...", name=name, **values)
+
+    async def setup():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with TestingSessionLocal() as db:
+            owner = User(username="key-owner", email="owner@example.com", hashed_password="x")
+            bearer = User(username="bearer-user", email="bearer@example.com", hashed_password="x")
+            dormant = User(username="dormant", email="dormant@example.com", hashed_password="x", is_active=False)
+            db.add_all([owner, bearer, dormant])
+            await db.commit()
+            auth = AuthService(db)
+            valid = (await auth.generate_api_key(owner.id, "bot")).api_key
+            expired, expired_row = raw_key(owner.id, "expired", expires_at=datetime.utcnow() - timedelta(minutes=1))
+            inactive, inactive_row = raw_key(owner.id, "inactive", is_active=False)
+            orphaned, orphaned_row = raw_key(dormant.id, "dormant")
+            db.add_all([expired_row, inactive_row, orphaned_row])
+            await db.commit()
+            token = auth.create_access_token(access_token_claims(bearer))
+            return valid, expired, inactive, orphaned, token
+
+    async def usage(key):
+        async with TestingSessionLocal() as db:
+            digest = hashlib.sha256(key.encode()).hexdigest()
+            row = (await db.execute(select(APIKey).where(APIKey.key_hash == digest))).scalar_one()
+            return row.last_used, row.usage_count
+
+    async def teardown():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await test_engine.dispose()
+
+    with TestClient(app, base_url="http://localhost") as c:
+        valid, expired, inactive, orphaned, token = c.portal.call(setup)
+
+        response = c.get("/auth/me", headers={"X-API-Key": valid})
+        assert response.status_code == 200 and response.json()["username"] == "key-owner"
+        last_used, usage_count = c.portal.call(usage, valid)
+        assert last_used is not None and usage_count == 1
+        assert c.get("/auth/me", headers={"X-API-Key": valid}).status_code == 200
+        assert c.portal.call(usage, valid)[1] == 2
+
+        for key in (expired, inactive, orphaned, "rapi_unknown"):
+            assert c.get("/auth/me", headers={"X-API-Key": key}).status_code == 401
+
+        response = c.get("/auth/me", headers={"X-API-Key": valid, "Authorization": f"Bearer {token}"})
+        assert response.status_code == 200 and response.json()["username"] == "bearer-user"
+        assert c.portal.call(usage, valid)[1] == 2
+        c.portal.call(teardown)
+
+
+class _FakeHashRedis:
+    """In-process stand-in for the Redis hash commands used by the token version store"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.fail = False
+
+    async def hmget(self, key, fields):
+        if self.fail:
+            raise ConnectionError("redis unreachable")
+        values = self.hashes.get(key, {})
+        return [values.get(field) for field in fields]
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        if self.fail:
+            raise ConnectionError("redis unreachable")
+        values = self.hashes.setdefault(key, {})
+        if field is not None:
+            values[field] = str(value)
+        values.update({k: str(v) for k, v in (mapping or {}).items()})
+
+
+def test_revoked_and_deactivated_tokens_rejected_from_claims(monkeypatch):
+    """Claim-only JWT checks honour revocation and deactivation, even after the Redis hash is flushed"""
+    from fastapi import HTTPException
+    from app.dependencies import _principal_from_jwt
+    from app.models.user import User
+    from app.services import token_versions as token_versions_module
+    from app.services.auth import AuthService, access_token_claims
+
+    fake = _FakeHashRedis()
+    store = token_versions_module.token_versions
+    monkeypatch.setattr(token_versions_module, "get_redis", lambda: fake)
+    monkeypatch.setattr(store, "_session_factory", TestingSessionLocal)
+    monkeypatch.setattr(store, "_versions", {})
+
+    async def rejected(token, db) -> bool:
+        try:
+            await _principal_from_jwt(token, db)
+        except HTTPException as e:
+            return e.status_code == 401
+        return False
+
+    async def scenario():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with TestingSessionLocal() as db:
+            user = User(username="claims-user", email="claims@example.com", hashed_password="x")
+            db.add(user)
+            await db.commit()
+            auth = AuthService(db)
+            token = auth.create_access_token(access_token_claims(user))
+
+            principal = await _principal_from_jwt(token, db)
+            await db.refresh(user)
+            assert principal.id == user.id and user.last_seen is not None
+
+            await auth.revoke_user_tokens(user.id)
+            assert await rejected(token, db)
+            # Another worker after the hash was evicted: its local copy knows nothing
+            fake.hashes.clear()
+            store._versions.clear()
+            assert await rejected(token, db)
+
+            await db.refresh(user)
+            current = auth.create_access_token(access_token_claims(user))
+            assert (await _principal_from_jwt(current, db)).id == user.id
+            await auth.deactivate_user(user.id)
+            assert await rejected(current, db)
+
+            fake.fail = True
+            with pytest.raises(ConnectionError):
+                await auth.revoke_user_tokens(user.id)
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await test_engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_revocations_reach_other_workers_without_redis(monkeypatch):
+    """Without Redis, a bump made by one worker is read from the database once the other's cache expires"""
+    from app.models.user import User
+    from app.services import token_versions as token_versions_module
+    from app.services.auth import AuthService
+
+    monkeypatch.setattr(token_versions_module, "get_redis", lambda: None)
+    monkeypatch.setattr(token_versions_module.token_versions, "_session_factory", TestingSessionLocal)
+    monkeypatch.setattr(token_versions_module.token_versions, "_versions", {})
+    other_worker = token_versions_module.TokenVersionStore(TestingSessionLocal)
+
+    async def scenario():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with TestingSessionLocal() as db:
+            user = User(username="solo-worker", email="solo@example.com", hashed_password="x")
+            db.add(user)
+            await db.commit()
+            assert await other_worker.get(user.id) == 0
+
+            await AuthService(db).revoke_user_tokens(user.id)
+            assert await token_versions_module.token_versions.get(user.id) == 1
+            # Still inside the other worker's staleness window
+            assert await other_worker.get(user.id) == 0
+            other_worker._db_versions.clear()
+            assert await other_worker.get(user.id) == 1
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await test_engine.dispose()
+
+    asyncio.run(scenario())
+
+
+class _SMTPSink:
+    """Minimal local SMTP server that records connections and delivered messages"""
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        writer.write(b"220 sink ready\r\n")
+        while line := await reader.readline():
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                writer.write(b"250 sink\r\n")
+            elif command == "DATA":
+                writer.write(b"354 go ahead\r\n")
+                await writer.drain()
+                data = b""
+                while (chunk := await reader.readline()) != b".\r\n":
+                    data += chunk
+                self.messages.append(data)
+                writer.write(b"250 queued\r\n")
+            elif command == "QUIT":
+                writer.write(b"221 bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 ok\r\n")
+            await writer.drain()
+        writer.close()
+
+
+def test_email_outbox_batches_over_one_connection(monkeypatch):
+    """Queued emails are deduplicated and delivered over a single SMTP connection"""
+    from app.services.email_outbox import EmailOutboxService
+
+    async def scenario():
+        sink = _SMTPSink()
+        server = await asyncio.start_server(sink.handle, "127.0.0.1", 0)
+        monkeypatch.setattr(settings, "MAIL_SERVER", "127.0.0.1")
+        monkeypatch.setattr(settings, "MAIL_PORT", server.sockets[0].getsockname()[1])
+        monkeypatch.setattr(settings, "MAIL_USE_CREDENTIALS", False)
+        monkeypatch.setattr(settings, "MAIL_STARTTLS", False)
+        monkeypatch.setattr(settings, "MAIL_SSL_TLS", False)
+
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        outbox = EmailOutboxService(session_factory=TestingSessionLocal)
+        async with TestingSessionLocal() as db:
+            await outbox.enqueue(db, "verification", "a@example.com", "Verify", "<p>old</p>")
+            await outbox.enqueue(db, "verification", "a@example.com", "Verify", "<p>new</p>")
+            await outbox.enqueue(db, "welcome", "b@example.com", "Welcome", "<p>hi</p>")
+
+        assert await outbox.process_batch() == 2
+        assert await outbox.process_batch() == 0
+        await outbox.stop()
+        server.close()
+
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await test_engine.dispose()
+        return sink
+
+    sink = asyncio.run(scenario())
+    assert sink.connections == 1
+    assert len(sink.messages) == 2
+    assert b"new" in sink.messages[0] and b"old" not in sink.messages[0]
+
+
+def test_sliding_window_limiter():
+    """Sliding-window limiter admits up to the limit and weights the previous bucket"""
+    from app.services.rate_limiter import SlidingWindowLimiter
+
+    limiter = SlidingWindowLimiter(limit=10, window=60)
+    for _ in range(10):
+        assert limiter.hit("ip", now=30.0).allowed
+    denied = limiter.hit("ip", now=30.0)
+    assert not denied.allowed and denied.retry_after > 0
+
+    # Halfway through the next bucket, half of the previous 10 still counts
+    assert limiter.check("ip", now=90.0).remaining == 4
+    assert limiter.hit("ip", cost=5, now=90.0).allowed
+    assert not limiter.hit("ip", now=90.0).allowed
+    assert limiter.hit("ip", now=150.0).allowed
+
+
+def test_rate_limit_middleware_returns_429_with_headers(monkeypatch):
+    """Rate-limited requests get a real 429 with Retry-After, limit headers and a request ID"""
+    from fastapi import FastAPI
+    from app.middleware.logging import LoggingMiddleware
+    from app.middleware.rate_limit import RateLimitMiddleware
+    from app.services.rate_limiter import LocalRateLimitBackend
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP_REQUESTS_PER_MINUTE", 60)
+    mini_app = FastAPI()
+    mini_app.get("/ping")(lambda: {"ok": True})
+    mini_app.add_middleware(RateLimitMiddleware, backend=LocalRateLimitBackend())
+    mini_app.add_middleware(LoggingMiddleware)
+
+    with TestClient(mini_app) as mini_client:
+        for _ in range(60):
+            response = mini_client.get("/ping")
+            assert response.status_code == 200
+        assert response.headers["X-RateLimit-Remaining"] == "0"
+
+        response = mini_client.get("/ping")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.headers["X-RateLimit-Limit"] == "60"
+        assert "X-Request-ID" in response.headers
+
+
+class _FakeRedis:
+    """In-process stand-in for Redis that executes the rate limit script's logic"""
+
+    def __init__(self, fail: bool = False):
+        self.store = {}
+        self.fail = fail
+
+    def register_script(self, script):
+        async def run(keys, args):
+            if self.fail:
+                raise ConnectionError("redis unreachable")
+            counts, admitted = [], 1
+            for i in range(len(keys) // 2):
+                limit, cost, weight = int(args[4 * i]), int(args[4 * i + 1]), float(args[4 * i + 2])
+                current = self.store.get(keys[2 * i], 0)
+                previous = self.store.get(keys[2 * i + 1], 0)
+                if previous * weight + current + cost > limit:
+                    admitted = 0
+                counts += [previous, current]
+            if admitted:
+                for i in range(len(keys) // 2):
+                    self.store[keys[2 * i]] = self.store.get(keys[2 * i], 0) + int(args[4 * i + 1])
+            return [admitted] + counts
+        return run
+
+
+def test_redis_rate_limit_backend_shared_and_fallback():
+    """Workers sharing a store enforce one combined limit; an unreachable store falls back locally"""
+    from app.services.rate_limiter import RedisRateLimitBackend, LimitSpec
+
+    spec = LimitSpec("ip_requests", "1.2.3.4", limit=4, window=60)
+
+    async def scenario():
+        shared = _FakeRedis()
+        worker_a, worker_b = RedisRateLimitBackend(shared), RedisRateLimitBackend(shared)
+        admitted = [(await worker.hit(spec, now=10.0)).allowed for worker in (worker_a, worker_b) * 3]
+
+        broken = RedisRateLimitBackend(_FakeRedis(fail=True))
+        fallback = [(await broken.hit(spec, now=10.0)).allowed for _ in range(5)]
+        return admitted, fallback
+
+    admitted, fallback = asyncio.run(scenario())
+    assert admitted == [True, True, True, True, False, False]
+    assert fallback == [True, True, True, True, False]
+
+
+def test_daily_quota_resets_at_day_boundary():
+    """Fixed daily windows ignore yesterday's usage instead of sliding over it"""
+    from app.services.rate_limiter import LocalRateLimitBackend, LimitSpec
+
+    daily = LimitSpec("user_daily_downloads", "user:1", limit=2, window=86400, fixed=True)
+
+    async def scenario():
+        backend = LocalRateLimitBackend()
+        late_today = 86400 - 60
+        results = [(await backend.hit(daily, now=late_today)).allowed for _ in range(3)]
+        results.append((await backend.hit(daily, now=86400 + 60)).allowed)
+        return results
+
+    assert asyncio.run(scenario()) == [True, True, False, True]
+
+
+def test_weighted_cost_reports_partial_admission():
+    """Batch requests are charged per item and rejections report what still fits"""
+    from app.services.rate_limiter import LocalRateLimitBackend, LimitSpec
+
+    async def scenario():
+        backend = LocalRateLimitBackend()
+        first = await backend.hit(LimitSpec("downloads", "user:1", limit=12, window=3600, cost=10), now=0.0)
+        second = await backend.hit(LimitSpec("downloads", "user:1", limit=12, window=3600, cost=5), now=1.0)
+        third = await backend.hit(LimitSpec("downloads", "user:1", limit=12, window=3600, cost=2), now=2.0)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first.allowed and first.remaining == 2
+    assert not second.allowed and second.remaining == 2  # Nothing recorded for the rejected batch
+    assert third.allowed and third.remaining == 0
+
+
+def test_fair_share_scheduler_serves_light_user_ahead_of_backlog():
+    """A heavy principal's backlog does not delay another principal's single request"""
+    from app.services.scheduler import FairShareScheduler
+
+    async def scenario():
+        scheduler = FairShareScheduler(max_concurrency=2)
+        order = []
+
+        async def fetch(key, weight=1.0):
+            async with scheduler.slot(key, weight):
+                await asyncio.sleep(0.001)
+                order.append(key)
+
+        heavy = [asyncio.create_task(fetch("bot")) for _ in range(20)]
+        await asyncio.sleep(0)
+        light = asyncio.create_task(fetch("user"))
+        premium = [asyncio.create_task(fetch("premium", weight=4.0)) for _ in range(4)]
+        await asyncio.gather(*heavy, light, *premium)
+        return order, scheduler.metrics()
+
+    order, metrics = asyncio.run(scenario())
+    assert order.index("user") <= 3
+    assert max(i for i, key in enumerate(order) if key == "premium") < 10  # Weight 4 drains faster
+    assert metrics["active"] == 0 and metrics["queued"] == 0 and metrics["queues"] == []
+    assert metrics["tiers"]["standard"]["samples"] == 25
+
+
+def test_upstream_governor_backs_off_on_429_and_sheds():
+    """A 429 halves the host's rate, honours Retry-After and sheds work that cannot run in time"""
+    import httpx
+    from app.services.upstream import HostGovernor, UpstreamClient, UpstreamThrottledError, parse_retry_after
+
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("Thu, 01 Jan 1970 00:00:10 GMT", now=4.0) == 6.0
+
+    statuses = iter([200, 429])
+
+    def handler(request):
+        return httpx.Response(next(statuses), headers={"Retry-After": "30"})
+
+    async def scenario():
+        client = UpstreamClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        first = await client.get("https://assetdelivery.roblox.com/v1/asset/?id=1")
+        rate_after_success = client.governor("assetdelivery.roblox.com").rate
+        second = await client.get("https://assetdelivery.roblox.com/v1/asset/?id=2")
+        try:
+            await client.get("https://assetdelivery.roblox.com/v1/asset/?id=3")
+            shed = None
+        except UpstreamThrottledError as e:
+            shed = e
+        await client.close()
+        return first, rate_after_success, second, shed, client.metrics()["hosts"]["assetdelivery.roblox.com"]
+
+    first, rate_after_success, second, shed, metrics = asyncio.run(scenario())
+    assert first.status_code == 200 and second.status_code == 429
+    assert metrics["rate_per_second"] < rate_after_success
+    assert shed is not None and shed.retry_after > 25  # Retry-After outlasts the queueing budget
+    assert metrics["throttled"] == 1 and metrics["shed"] == 1 and metrics["sent"] == 2
+
+    async def pending_reservations():
+        governor = HostGovernor("example.com", rate=10, burst=1, min_rate=1, max_rate=10, max_wait=1.0)
+        await governor.acquire()
+        # Queued behind the bucket when a short 429 arrives: waits it out, then sends
+        waiter = asyncio.ensure_future(governor.acquire())
+        await asyncio.sleep(0.01)
+        governor.observe(429, retry_after=0.3)
+        await waiter
+        # Queued when a 429 asks for longer than the queueing budget: shed, not sent
+        waiter = asyncio.ensure_future(governor.acquire())
+        await asyncio.sleep(0.01)
+        governor.observe(429, retry_after=30)
+        with pytest.raises(UpstreamThrottledError):
+            await waiter
+        return governor
+
+    governor = asyncio.run(pending_reservations())
+    assert governor.sent == 2 and governor.shed == 1 and governor.throttled == 2
+
+
+def test_circuit_breaker_and_rejected_cookie_skip_upstream(monkeypatch):
+    """An open circuit serves cached asset info and a rejected cookie stops further round trips"""
+    import httpx
+    from app.config import settings
+    from app.services import audio as audio_module
+    from app.services.upstream import UpstreamClient
+
+    monkeypatch.setattr(settings, "ROBLOX_COOKIE", "cookie")
+    monkeypatch.setattr(settings, "UPSTREAM_BREAKER_MIN_CALLS", 3)
+    calls = []
+    mode = {"asset": 200}
+
+    def handler(request):
+        calls.append(request.url.host)
+        if request.url.host == "catalog.roblox.com":
+            return httpx.Response(200, json={"data": [{"name": "Song", "creatorName": "Builder"}]})
+        return httpx.Response(mode["asset"])
+
+    async def scenario():
+        client = UpstreamClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(audio_module, "upstream", client)
+        audio_module.asset_info_cache.clear()
+        service = audio_module.AudioService(db=None)
+
+        fresh = await service.fetch_asset_info(1)
+        mode["asset"] = 500
+        degraded = [await service.fetch_asset_info(1) for _ in range(3)]
+        sent_before_open = len(calls)
+        while_open = await service.fetch_asset_info(1)
+        assert len(calls) == sent_before_open  # Failed fast without a round trip
+        assert client.breaker("assetdelivery").state == "open"
+
+        mode["asset"] = 403
+        client.breaker("assetdelivery").state = "half_open"  # Skip the open period
+        rejected = await service.fetch_asset_info(2)
+        sent_after_403 = len(calls)
+        again = await service.fetch_asset_info(2)
+        assert len(calls) == sent_after_403
+        await client.close()
+        return fresh, degraded, while_open, rejected, again, client.metrics()
+
+    fresh, degraded, while_open, rejected, again, metrics = asyncio.run(scenario())
+    assert fresh.name == "Song"
+    assert all(info == fresh for info in degraded) and while_open == fresh
+    assert rejected.creator == again.creator == "Unknown (Auth Failed)"
+    assert metrics["credentials"]["credentials"]["credential-0"]["state"] == "quarantined"
+    assert metrics["endpoints"]["assetdelivery"]["state"] == "closed"  # The 403 probe reached Roblox
+
+
+def test_credential_pool_spreads_load_and_quarantines():
+    """Calls go to the least busy cookie; a rejected cookie is skipped until its recheck"""
+    from app.services.credentials import CredentialPool
+
+    pool = CredentialPool(["a", "b", "c"], recheck_seconds=60)
+    picked = [pool.select(now=float(i)) for i in range(3)]
+    assert [c.cookie for c in picked] == ["a", "b", "c"]
+
+    pool.release(picked[1], 200, now=3.0)
+    assert pool.select(now=4.0).cookie == "b"  # Only idle credential
+
+    pool.release(picked[0], 403, now=5.0)
+    pool.release(picked[2], 200, now=5.0)
+    assert pool.select(now=6.0).cookie == "c"  # "a" is quarantined, "b" still busy
+    assert pool.metrics()["usable"] == 2
+
+    probe = pool.select(now=70.0)
+    assert probe.cookie == "a"  # Due for recheck
+    pool.release(probe, 200, now=71.0)
+    assert pool.metrics()["credentials"]["credential-0"]["state"] == "healthy"
+
+
+def test_upstream_retries_idempotent_requests_and_hedges_slow_ones(monkeypatch):
+    """Transient failures are retried for GETs only, and a GET slower than p95 is hedged"""
+    import httpx
+    from app.config import settings
+    from app.services.upstream import UpstreamClient
+
+    monkeypatch.setattr(settings, "UPSTREAM_RETRY_BASE_SECONDS", 0.001)
+    monkeypatch.setattr(settings, "UPSTREAM_HEDGE_MIN_SAMPLES", 5)
+    calls = {"flaky": 0, "post": 0, "slow": 0}
+
+    async def handler(request):
+        path = request.url.path
+        if path == "/flaky":
+            calls["flaky"] += 1
+            if calls["flaky"] == 1:
+                raise httpx.ConnectError("connection reset")
+            return httpx.Response(502 if calls["flaky"] == 2 else 200)
+        if path == "/post":
+            calls["post"] += 1
+            return httpx.Response(502)
+        calls["slow"] += 1
+        # The 6th fetch stalls; its hedged duplicate answers quickly
+        await asyncio.sleep(1.0 if calls["slow"] == 6 else 0.001)
+        return httpx.Response(200, content=b"audio")
+
+    async def scenario():
+        client = UpstreamClient(cookies=[])
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        flaky = await client.get("https://cdn.test/flaky")
+        post = await client.post("https://api.test/post")
+        for _ in range(5):
+            await client.get("https://cdn.test/slow", endpoint="cdn", hedge=True)
+        started = asyncio.get_running_loop().time()
+        hedged = await client.get("https://cdn.test/slow", endpoint="cdn", hedge=True)
+        elapsed = asyncio.get_running_loop().time() - started
+        await client.close()
+        return flaky, post, hedged, elapsed, client.metrics()["retries"]
+
+    flaky, post, hedged, elapsed, retries = asyncio.run(scenario())
+    assert flaky.status_code == 200 and calls["flaky"] == 3
+    assert post.status_code == 502 and calls["post"] == 1  # POST is never repeated
+    assert hedged.content == b"audio" and elapsed < 0.5
+    assert retries["retries"] == 2 and retries["hedges"] == 1 and retries["hedge_wins"] == 1
+
+
+def test_audio_jobs_round_robin_and_stream_progress(monkeypatch):
+    """Job workers interleave jobs and wake waiting event streams as items finish"""
+    from app.config import settings
+    from app.schemas.audio import AudioDownloadResponse
+    from app.schemas.auth import Principal
+    from app.services.jobs import AudioJobManager
+
+    monkeypatch.setattr(settings, "AUDIO_JOB_WORKERS", 1)
+    processed = []
+
+    async def fake_run_item(job, index):
+        await asyncio.sleep(0)
+        processed.append((job.principal.id, job.asset_ids[index]))
+        return AudioDownloadResponse(success=index % 2 == 0, asset_id=job.asset_ids[index],
+                                     asset_name="a", creator="c")
+
+    async def scenario():
+        manager = AudioJobManager()
+        monkeypatch.setattr(manager, "_run_item", fake_run_item)
+        owner = Principal(id=1, username="bot", is_admin=False, is_premium=False,
+                          daily_limit=1000, auth_method="jwt")
+        other = Principal(id=2, username="user", is_admin=False, is_premium=False,
+                          daily_limit=1000, auth_method="jwt")
+        big = manager.submit(owner, [10, 11, 12, 13], "1")
+        small = manager.submit(other, [20], "1")
+        while not big.done:
+            await big.wait_for_change(1.0)
+        await manager.stop()
+        return manager, owner, other, big, small
+
+    manager, owner, other, big, small = asyncio.run(scenario())
+    assert processed[:2] == [(1, 10), (2, 20)]  # The small job is not stuck behind the big one
+    summary = big.to_response()
+    assert summary.status == "completed" and summary.successful_downloads == 2 and summary.failed_downloads == 2
+    assert manager.get(big.id, other) is None and manager.get(big.id, owner) is big
+
+
+def test_audio_jobs_capped_per_user_and_overall(monkeypatch):
+    """Unfinished jobs are capped per principal and in total; finished jobs free the slots"""
+    from app.config import settings
+    from app.schemas.audio import AudioDownloadResponse
+    from app.schemas.auth import Principal
+    from app.services.jobs import AudioJobManager, JobLimitError
+
+    monkeypatch.setattr(settings, "AUDIO_JOB_MAX_ACTIVE_PER_USER", 2)
+    monkeypatch.setattr(settings, "AUDIO_JOB_MAX_ACTIVE", 3)
+    monkeypatch.setattr(settings, "AUDIO_JOB_MAX_STORED", 2)
+
+    def principal(user_id: int) -> Principal:
+        return Principal(id=user_id, username=f"user{user_id}", is_admin=False, is_premium=False,
+                         daily_limit=1000, auth_method="jwt")
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def blocked_run_item(job, index):
+            await release.wait()
+            return AudioDownloadResponse(success=True, asset_id=job.asset_ids[index], asset_name="a", creator="c")
+
+        manager = AudioJobManager()
+        monkeypatch.setattr(manager, "_run_item", blocked_run_item)
+        jobs = [manager.submit(principal(1), [1], "1"), manager.submit(principal(1), [2], "1")]
+        rejections = []
+        for user_id in (1, 2, 3):
+            try:
+                jobs.append(manager.submit(principal(user_id), [3], "1"))
+            except JobLimitError as e:
+                rejections.append((user_id, e.per_principal))
+
+        release.set()
+        while not all(job.done for job in jobs):
+            await jobs[-1].wait_for_change(1.0)
+        after = manager.submit(principal(1), [4], "1")
+        await manager.stop()
+        return manager, jobs, rejections, after
+
+    manager, jobs, rejections, after = asyncio.run(scenario())
+    assert rejections == [(1, True), (3, False)]  # User 2 took the last global slot
+    assert after is not None
+    assert len(manager._jobs) == 3  # The oldest finished job was dropped past AUDIO_JOB_MAX_STORED
+
+
+def test_concurrent_job_submits_at_capacity_charge_only_the_admitted_one(monkeypatch):
+    """The job slot is reserved before the quota charge, so the rejected request is never charged"""
+    from fastapi import HTTPException, Response
+    from app.routers import audio as audio_router
+    from app.schemas.audio import AudioJobRequest
+    from app.schemas.auth import Principal
+    from app.services.jobs import AudioJobManager
+
+    monkeypatch.setattr(settings, "AUDIO_JOB_MAX_ACTIVE_PER_USER", 2)
+    principal = Principal(id=1, username="bot", is_admin=False, is_premium=False,
+                          daily_limit=1000, auth_method="jwt")
+    charges = []
+
+    async def slow_charge(principal, response, items=1):
+        await asyncio.sleep(0.01)  # A round trip to the rate limit store
+        charges.append(items)
+
+    async def idle_run_item(job, index):
+        await asyncio.sleep(3600)
+
+    async def scenario():
+        manager = AudioJobManager()
+        monkeypatch.setattr(manager, "_run_item", idle_run_item)
+        monkeypatch.setattr(audio_router, "job_manager", manager)
+        monkeypatch.setattr(audio_router, "charge_downloads", slow_charge)
+        manager.submit(principal, [1], "1")  # One slot left
+
+        async def post():
+            try:
+                return await audio_router.create_audio_job(
+                    AudioJobRequest(asset_ids=[2, 3], place_id="1"), Response(), current_user=principal, _replay=None
+                )
+            except HTTPException as e:
+                return e.status_code
+
+        results = await asyncio.gather(post(), post())
+        await manager.stop()
+        return results, manager
+
+    results, manager = asyncio.run(scenario())
+    assert sorted(r if isinstance(r, int) else 202 for r in results) == [202, 429]
+    assert charges == [2]
+    assert not manager._reserved
+
+
+def test_audio_archive_streams_stored_zip_from_cache(monkeypatch, tmp_path):
+    """The archive is emitted in chunks, stores entries uncompressed and lists failures"""
+    import io
+    import json
+    import zipfile
+    from app.schemas.audio import AudioDownloadResponse
+    from app.schemas.auth import Principal
+    from app.services import archive as archive_module
+    from app.services.audio_cache import AudioBlobCache
+
+    cache = AudioBlobCache(str(tmp_path))
+    monkeypatch.setattr(archive_module, "audio_cache", cache)
+    blob = bytes(range(256)) * 1024  # 256 KiB, several read chunks
+
+    async def fake_download(principal, asset_id, place_id):
+        if asset_id == 2:
+            return AudioDownloadResponse(success=False, asset_id=2, asset_name="Asset 2", creator="Unknown",
+                                         error_message="Could not get audio URL")
+        await cache.put(asset_id, blob)
+        return AudioDownloadResponse(success=True, asset_id=asset_id, asset_name="Song/1", creator="c",
+                                     file_size=len(blob))
+
+    monkeypatch.setattr(archive_module, "_download", fake_download)
+    principal = Principal(id=1, username="u", is_admin=False, is_premium=False, daily_limit=10, auth_method="jwt")
+
+    async def collect():
+        return [chunk async for chunk in archive_module.stream_audio_archive(principal, [1, 2], "1")]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 3 and max(len(c) for c in chunks) < len(blob)
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        entry = archive.getinfo("1 - Song1.ogg")
+        assert entry.compress_type == zipfile.ZIP_STORED
+        assert archive.read(entry) == blob
+        manifest = json.loads(archive.read("manifest.json"))
+    assert {item["asset_id"]: item["success"] for item in manifest} == {1: True, 2: False}
+
+
+def test_audio_archive_charges_each_asset_once(monkeypatch):
+    """Repeated asset IDs in an archive request are charged and archived once"""
+    from fastapi import Response
+    from app.routers import audio as audio_router
+    from app.schemas.audio import AudioBatchRequest
+    from app.schemas.auth import Principal
+
+    principal = Principal(id=1, username="u", is_admin=False, is_premium=False, daily_limit=10, auth_method="jwt")
+    charges, archived = [], []
+
+    async def charge(principal, response, items=1):
+        charges.append(items)
+
+    def fake_archive(principal, asset_ids, place_id):
+        archived.append(asset_ids)
+        return iter([b""])
+
+    monkeypatch.setattr(audio_router, "charge_downloads", charge)
+    monkeypatch.setattr(audio_router, "stream_audio_archive", fake_archive)
+    request = AudioBatchRequest(asset_ids=[5, 3, 5, 5, 3], place_id="1")
+    asyncio.run(audio_router.download_audio_archive(request, Response(), current_user=principal))
+    assert charges == [2]
+    assert archived == [[5, 3]]
+
+
+def test_idempotency_store_shares_in_flight_execution_and_replays():
+    """Concurrent duplicates wait for the first execution; failures are not stored"""
+    from app.services.idempotency import IdempotencyInProgressError, IdempotencyStore, StoredResponse
+
+    store = IdempotencyStore(maxsize=10, ttl=60, max_body=1024, wait_timeout=1.0)
+    executions = []
+
+    async def handle(key, fingerprint, status_code=200):
+        stored = await store.claim(key, fingerprint)
+        if stored is not None:
+            return stored.body
+        executions.append(key)
+        await asyncio.sleep(0.05)
+        body = f"result-{len(executions)}".encode()
+        store.complete(key, StoredResponse(fingerprint, status_code, [], body))
+        return body
+
+    async def scenario():
+        bodies = await asyncio.gather(*[handle((1, "a"), "fp") for _ in range(5)])
+        failed = await asyncio.gather(handle((1, "b"), "fp", 500), handle((1, "b"), "fp"))
+        return bodies, failed
+
+    bodies, failed = asyncio.run(scenario())
+    assert bodies == [b"result-1"] * 5 and executions.count((1, "a")) == 1
+    assert failed == [b"result-2", b"result-3"]  # The 500 was not replayed; the duplicate ran again
+    with pytest.raises(ValueError):
+        asyncio.run(store.claim((1, "a"), "other-body"))
+
+    async def stuck_original():
+        store.wait_timeout = 0.01
+        assert await store.claim((1, "c"), "fp") is None  # Never completes
+        await store.claim((1, "c"), "fp")
+
+    with pytest.raises(IdempotencyInProgressError):
+        asyncio.run(stuck_original())
+
+
+def test_idempotent_download_replays_without_executing_again(monkeypatch):
+    """A repeated POST /audio/download is replayed byte for byte without downloading, logging or charging"""
+    from app import dependencies
+    from app.models.user import User
+    from app.schemas.audio import AudioDownloadResponse
+    from app.services.audio import AudioService
+    from app.services.auth import AuthService
+    from app.services.idempotency import idempotency_store
+
+    calls = {"download": 0, "log": 0, "charge": 0}
+    log_download = AudioService._log_download
+    charge_downloads = dependencies.charge_downloads
+
+    async def fake_download(self, user_id, asset_id, place_id, start=None, end=None):
+        calls["download"] += 1
+        await self._log_download(user_id, asset_id, "Song", "Builder", True, None, 3)
+        return AudioDownloadResponse(success=True, asset_id=asset_id, asset_name="Song", creator="Builder",
+                                     file_size=3, download_url=f"/cache/{asset_id}.ogg")
+
+    async def counting_log(self, *args, **kwargs):
+        calls["log"] += 1
+        return await log_download(self, *args, **kwargs)
+
+    async def counting_charge(*args, **kwargs):
+        calls["charge"] += 1
+        return await charge_downloads(*args, **kwargs)
+
+    monkeypatch.setattr(AudioService, "download_audio", fake_download)
+    monkeypatch.setattr(AudioService, "_log_download", counting_log)
+    monkeypatch.setattr(dependencies, "charge_downloads", counting_charge)
+    idempotency_store._completed.clear()
+
+    async def setup():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with TestingSessionLocal() as db:
+            user = User(username="retrying-bot", email="retry@example.com", hashed_password="x")
+            db.add(user)
+            await db.commit()
+            return (await AuthService(db).generate_api_key(user.id, "bot")).api_key
+
+    async def teardown():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await test_engine.dispose()
+
+    with TestClient(app, base_url="http://localhost") as c:
+        headers = {"X-API-Key": c.portal.call(setup), "Idempotency-Key": "download-7"}
+        body = {"asset_id": 7, "place_id": "1"}
+
+        first = c.post("/audio/download", json=body, headers=headers)
+        assert first.status_code == 200 and "idempotent-replayed" not in first.headers
+        replay = c.post("/audio/download", json=body, headers=headers)
+        assert replay.status_code == 200 and replay.headers["idempotent-replayed"] == "true"
+        assert replay.content == first.content
+        assert replay.headers["content-type"] == first.headers["content-type"]
+        assert calls == {"download": 1, "log": 1, "charge": 1}
+
+        conflicting = c.post("/audio/download", json={**body, "asset_id": 8}, headers=headers)
+        assert conflicting.status_code == 422
+        assert calls == {"download": 1, "log": 1, "charge": 1}
+        c.portal.call(teardown)
+
+
+def test_cache_warmer_refreshes_hot_set_within_budget(monkeypatch, tmp_path):
+    """Only expiring info and missing audio are fetched, hottest first, until the budget runs out"""
+    from contextlib import asynccontextmanager
+    from types import SimpleNamespace
+    from app.services import warmer as warmer_module
+    from app.services.audio import AudioService, asset_info_cache
+    from app.services.audio_cache import AudioBlobCache
+
+    cache = AudioBlobCache(str(tmp_path))
+    monkeypatch.setattr(warmer_module, "audio_cache", cache)
+    monkeypatch.setattr(warmer_module, "upstream", SimpleNamespace(credentials=SimpleNamespace(configured=True)))
+    monkeypatch.setattr(settings, "CACHE_WARMER_UPSTREAM_BUDGET", 6)
+    fetched = []
+
+    async def fake_info(self, asset_id):
+        fetched.append(("info", asset_id))
+
+    async def fake_refresh(self, asset_id):
+        fetched.append(("audio", asset_id))
+        return True
+
+    async def fake_hot_assets(self, db):
+        return [(1, 30.0), (2, 20.0), (3, 10.0), (4, 5.0)]
+
+    @asynccontextmanager
+    async def no_session():
+        yield None
+        fetched.append(("session", "closed"))
+
+    monkeypatch.setattr(AudioService, "fetch_asset_info", fake_info)
+    monkeypatch.setattr(AudioService, "refresh_audio", fake_refresh)
+    monkeypatch.setattr(warmer_module.CacheWarmer, "hot_assets", fake_hot_assets)
+    asset_info_cache.clear()
+    asset_info_cache.set(1, object())  # Fresh info, audio missing
+    asyncio.run(cache.put(2, b"ogg"))  # Audio cached, info missing
+
+    report = asyncio.run(warmer_module.CacheWarmer(session_factory=no_session).warm_once())
+    asset_info_cache.clear()
+    # The ranking session is closed before any upstream work; asset 3 needs 4 calls, more than the 2 left
+    assert fetched == [("session", "closed"), ("audio", 1), ("info", 2)]
+    assert report["stopped"] == "budget" and report["budget_left"] == 2
+
+
+def test_stale_asset_info_served_while_one_refresh_runs(monkeypatch):
+    """Past the soft TTL cached info is returned at once and concurrent readers share one refresh"""
+    from app.schemas.audio import AssetInfo
+    from app.services import audio as audio_module
+
+    fetches = []
+
+    async def slow_fetch(self, asset_id):
+        fetches.append(asset_id)
+        await asyncio.sleep(0.05)
+        info = AssetInfo(asset_id=asset_id, name="New", creator="c")
+        audio_module.asset_info_cache.set(asset_id, info)
+        return info
+
+    monkeypatch.setattr(audio_module.AudioService, "fetch_asset_info", slow_fetch)
+    monkeypatch.setattr(settings, "ASSET_INFO_FRESH_SECONDS", 0)
+    audio_module.asset_info_cache.clear()
+    audio_module.asset_info_cache.set(7, AssetInfo(asset_id=7, name="Old", creator="c"))
+
+    async def scenario():
+        services = [audio_module.AudioService(db=None) for _ in range(3)]
+        served = await asyncio.gather(*[s.get_asset_info(7) for s in services])
+        await asyncio.sleep(0.1)
+        return served, [s.cache_status.state for s in services]
+
+    served, states = asyncio.run(scenario())
+    refreshed = audio_module.asset_info_cache.get(7)
+    audio_module.asset_info_cache.clear()
+    assert [info.name for info in served] == ["Old"] * 3 and states == ["stale"] * 3
+    assert fetches == [7] and refreshed.name == "New"
+
+
+def test_expired_audio_revalidated_with_conditional_request(monkeypatch, tmp_path):
+    """A 304 keeps the cached blob and extends its lifetime; a changed blob is downloaded again"""
+    import os
+    import httpx
+    from app.services import audio as audio_module
+    from app.services.audio_cache import AudioBlobCache
+    from app.services.upstream import UpstreamClient
+
+    cache = AudioBlobCache(str(tmp_path))
+    monkeypatch.setattr(audio_module, "audio_cache", cache)
+    cdn = {"etag": '"v1"', "body": b"O" * 1000}
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == cdn["etag"]:
+            return httpx.Response(304, headers={"ETag": cdn["etag"]})
+        return httpx.Response(200, content=cdn["body"], headers={"ETag": cdn["etag"]})
+
+    async def scenario():
+        client = UpstreamClient(cookies=[])
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(audio_module, "upstream", client)
+        service = audio_module.AudioService(db=None)
+        url = "https://c0.rbxcdn.com/audio"
+
+        first = await service._download_file(url, 5)
+        os.utime(cache.path(5), (0, 0))
+        revalidated = await service._download_file(url, 5)
+        assert cache.age(5) < 60  # The 304 restarted the blob's lifetime
+        cdn.update(etag='"v2"', body=b"N" * 10)
+        changed = await service._download_file(url, 5)
+        await client.close()
+        return first, revalidated, changed
+
+    first, revalidated, changed = asyncio.run(scenario())
+    assert seen == [None, '"v1"', '"v1"']
+    assert first[0] == revalidated[0] == 1000 and changed[0] == 10
+    assert cache.metrics() == {"revalidated": 1, "revalidation_misses": 1, "bytes_saved": 1000}
+    assert asyncio.run(cache.validators(5)).etag == '"v2"'
+
+
+def _ogg_page(granule: int, payload: bytes, serial: int = 1, sequence: int = 0) -> bytes:
+    import struct
+    segments = [255] * (len(payload) // 255) + [len(payload) % 255]
+    return struct.pack("<4sBBqIIIB", b"OggS", 0, 0, granule, serial, sequence, 0, len(segments)) + bytes(segments) + payload
+
+
+def test_audio_prober_reads_ogg_headers_in_process_pool(monkeypatch, tmp_path):
+    """Duration, rate and channels come from the first and last pages; results are stored with the blob"""
+    import struct
+    from app.services import probe as probe_module
+    from app.services.audio_cache import AudioBlobCache
+
+    cache = AudioBlobCache(str(tmp_path))
+    monkeypatch.setattr(probe_module, "audio_cache", cache)
+    identification = b"\x01vorbis" + struct.pack("<IBIiiiBB", 0, 2, 44100, 0, 128000, 0, 0xB8, 1)
+    ogg = _ogg_page(0, identification) + b"".join(
+        _ogg_page(44100 * (i + 1), b"\x00" * 4000, sequence=i + 1) for i in range(90)
+    )
+    prober = probe_module.AudioProber()
+
+    async def scenario():
+        await cache.put(3, ogg)
+        await cache.put(4, b"ID3 not an ogg file")
+        first = await asyncio.gather(prober.properties(3), prober.properties(3))
+        stored = await cache.load_probe(3)
+        return first, stored, await prober.properties(4), await prober.properties(99)
+
+    try:
+        (a, b), stored, mp3, missing = asyncio.run(scenario())
+    finally:
+        probe_module.shutdown_audio_process_pool()
+    assert a == b and (a.codec, a.sample_rate, a.channels, a.duration_seconds) == ("vorbis", 44100, 2, 90.0)
+    assert stored == (True, a.model_dump())
+    assert mp3 is None and missing is None
+
+
+def test_ogg_clips_are_page_accurate_and_cached_within_budget(monkeypatch, tmp_path):
+    """Clips keep the headers, renumber pages with valid checksums and are evicted least recently used"""
+    import os
+    import struct
+    from app.services import clips as clips_module
+    from app.services.audio_cache import AudioBlobCache
+    from app.services.ogg import ogg_crc, read_page, trim_ogg
+    from app.services.probe import shutdown_audio_process_pool
+
+    identification = b"\x01vorbis" + struct.pack("<IBIiiiBB", 0, 1, 44100, 0, 96000, 0, 0xB8, 1)
+    source = tmp_path / "source.ogg"
+    source.write_bytes(
+        _ogg_page(0, identification) + _ogg_page(0, b"\x03vorbis", sequence=1) + _ogg_page(0, b"\x05vorbis", sequence=2)
+        + b"".join(_ogg_page(44100 * (i + 1), bytes([i]) * 3000, sequence=i + 3) for i in range(90))
+    )
+
+    properties = trim_ogg(str(source), str(tmp_path / "clip.ogg"), 10.0, 20.0)
+    data = (tmp_path / "clip.ogg").read_bytes()
+    pages, offset = [], 0
+    while offset < len(data):
+        page = read_page(data, offset)
+        raw = bytearray(data[offset:offset + page.size])
+        assert struct.unpack_from("<I", raw, 22)[0] == ogg_crc(bytes(raw[:22]) + b"\0\0\0\0" + bytes(raw[26:]))
+        assert struct.unpack_from("<I", raw, 18)[0] == len(pages)  # Renumbered
+        pages.append(page)
+        offset += page.size
+    assert len(pages) == 13 and pages[3].payload[0] == 10  # Headers, then the page covering 10-11 s
+    assert pages[-1].granule == 10 * 44100 and pages[-1].header_type & 0x04
+    assert properties["duration_seconds"] == 10.0
+
+    cache = AudioBlobCache(str(tmp_path / "blobs"))
+    monkeypatch.setattr(clips_module, "audio_cache", cache)
+    asyncio.run(cache.put(1, source.read_bytes()))
+    clips = clips_module.AudioClipCache(str(tmp_path / "clips"), max_bytes=len(data) + 100)
+
+    async def scenario():
+        first, again = await asyncio.gather(clips.get(1, 10.0, 20.0), clips.get(1, 10.0, 20.0))
+        repeat = await clips.get(1, 10.0, 20.0)
+        await clips.get(1, 30.0, 40.0)  # Over budget: the 10-20 s clip is evicted
+        return first, again, repeat
+
+    try:
+        first, again, repeat = asyncio.run(scenario())
+    finally:
+        shutdown_audio_process_pool()
+    assert first == again == repeat and first.size == len(data)
+    assert clips.metrics()["misses"] == 2 and clips.metrics()["hits"] == 1 and clips.metrics()["evictions"] == 1
+    assert not os.path.exists(first.path)
+
+
+def test_opus_clips_keep_granules_aligned_with_pre_skip(tmp_path):
+    """Opus granules include pre_skip, so a clip from zero keeps them and mid-stream cuts start at the cut"""
+    import struct
+    from app.services.ogg import probe_ogg, read_page, trim_ogg
+
+    pre_skip = 312
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, pre_skip, 48000, 0, 0)
+    source = tmp_path / "source.opus"
+    source.write_bytes(
+        _ogg_page(0, head) + _ogg_page(0, b"OpusTags", sequence=1)
+        + b"".join(_ogg_page(pre_skip + 48000 * (i + 1), bytes([i]) * 500, sequence=i + 2) for i in range(10))
+    )
+    assert probe_ogg(str(source))["duration_seconds"] == 10.0
+
+    whole = trim_ogg(str(source), str(tmp_path / "whole.opus"), 0.0, None)
+    assert whole["duration_seconds"] == 10.0
+    assert probe_ogg(str(tmp_path / "whole.opus"))["duration_seconds"] == 10.0
+
+    middle = trim_ogg(str(source), str(tmp_path / "middle.opus"), 3.0, 6.0)
+    data = (tmp_path / "middle.opus").read_bytes()
+    pages, offset = [], 0
+    while offset < len(data):
+        page = read_page(data, offset)
+        pages.append(page)
+        offset += page.size
+    # Pages for 3-4, 4-5 and 5-6 s: granules count exactly the kept samples
+    assert [page.payload[0] for page in pages[2:]] == [3, 4, 5]
+    assert [page.granule for page in pages[2:]] == [48000, 96000, 144000]
+    assert middle["duration_seconds"] == round((144000 - pre_skip) / 48000, 3)
+
+
+def test_clip_from_zero_without_end_is_still_a_clip(monkeypatch, tmp_path):
+    """start=0 with no end asks for a clip (the whole stream, re-cut), not the original file"""
+    from app.schemas.audio import AssetInfo
+    from app.services import audio as audio_module
+    from app.services.clips import Clip
+
+    original = tmp_path / "7.ogg"
+    original.write_bytes(b"original")
+    clip_requests = []
+
+    class _Clips:
+        async def get(self, asset_id, start, end):
+            clip_requests.append((asset_id, start, end))
+            return Clip(str(tmp_path / "clip.ogg"), 4, None)
+
+    async def no_properties(asset_id):
+        return None
+
+    async def no_log(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(audio_module, "audio_clips", _Clips())
+    monkeypatch.setattr(audio_module.audio_prober, "properties", no_properties)
+    service = audio_module.AudioService(db=None)
+    monkeypatch.setattr(service, "get_asset_info", lambda asset_id: asyncio.sleep(0, AssetInfo(
+        asset_id=asset_id, name="a", creator="c")))
+    monkeypatch.setattr(service, "_cached_audio", lambda asset_id: str(original))
+    monkeypatch.setattr(service, "_log_download", no_log)
+
+    async def scenario():
+        return (await service.download_audio(1, 7, "1", start=0),
+                await service.download_audio(1, 7, "1"))
+
+    clipped, whole = asyncio.run(scenario())
+    assert clip_requests == [(7, 0, None)]
+    assert clipped.success and clipped.file_size == 4
+    assert whole.success and whole.download_url == str(original) and whole.file_size == len(b"original")
+
+
+def test_reuploads_map_to_canonical_asset_and_are_listed_as_clusters(monkeypatch, tmp_path):
+    """Exact and remuxed copies share a canonical asset; only exact copies share or are served its file"""
+    import os
+    import struct
+    from app.services import fingerprints as fingerprints_module
+    from app.services.audio_cache import AudioBlobCache
+    from app.services.probe import shutdown_audio_process_pool
+
+    cache = AudioBlobCache(str(tmp_path))
+    monkeypatch.setattr(fingerprints_module, "audio_cache", cache)
+    identification = b"\x01vorbis" + struct.pack("<IBIiiiBB", 0, 1, 44100, 0, 96000, 0, 0xB8, 1)
+
+    def ogg(serial: int, comment: bytes, audio: bytes) -> bytes:
+        headers = [identification, b"\x03vorbis" + comment, b"\x05vorbis"]
+        pages = [_ogg_page(0, h, serial=serial, sequence=i) for i, h in enumerate(headers)]
+        pages += [_ogg_page(44100 * (i + 1), audio * 2000, serial=serial, sequence=i + 3) for i in range(5)]
+        return b"".join(pages)
+
+    original = ogg(1, b"original", b"\x01")
+
+    async def scenario():
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with TestingSessionLocal() as db:
+            service = fingerprints_module.FingerprintService(db)
+            for asset_id, content in [(10, original), (11, original),
+                                      (12, ogg(7, b"reupload", b"\x01")), (13, ogg(1, b"original", b"\x02"))]:
+                await cache.put(asset_id, content)
+                await service.record(asset_id)
+            canonical = [await service.exact_copy_of(a) for a in (10, 11, 12, 13)]
+            clusters = await service.duplicate_clusters()
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await test_engine.dispose()
+        return canonical, clusters
+
+    try:
+        canonical, clusters = asyncio.run(scenario())
+    finally:
+        shutdown_audio_process_pool()
+    assert canonical == [None, 10, None, None]  # The remux shares the cluster but not the bytes
+    assert 12 in fingerprints_module._not_exact_copies and 11 not in fingerprints_module._not_exact_copies
+    assert len(clusters) == 1
+    cluster = clusters[0]
+    assert cluster.canonical_asset_id == 10 and cluster.asset_ids == [10, 11, 12]
+    assert cluster.exact_copies == 1 and cluster.bytes_duplicated == len(original) + os.path.getsize(cache.path(12))
+    assert os.stat(cache.path(11)).st_ino == os.stat(cache.path(10)).st_ino
+
+
+def test_hot_blob_tier_keeps_frequent_audio_and_admits_by_frequency(tmp_path):
+    """Repeat reads come from memory; one-off reads cannot displace the hot set; replaced blobs are reread"""
+    from app.services.audio_cache import AudioBlobCache
+    from app.services.cache import HotBlobCache
+
+    memory = HotBlobCache(max_bytes=3000, max_blob_bytes=2000)
+    cache = AudioBlobCache(str(tmp_path), memory)
+
+    async def read(asset_id: int) -> bytes:
+        return b"".join([bytes(chunk) async for chunk in cache.iter_chunks(asset_id, chunk_size=256)])
+
+    async def scenario():
+        for asset_id, fill in [(1, b"a"), (2, b"b"), (3, b"c"), (4, b"d")]:
+            await cache.put(asset_id, fill * 1000)
+        await cache.put(5, b"e" * 5000)
+        for _ in range(3):
+            assert await read(1) == b"a" * 1000 and await read(2) == b"b" * 1000
+        reads = [await read(3), await read(4), await read(5)]  # One-off reads
+        await cache.put(1, b"z" * 1000)
+        return reads, await read(1)
+
+    reads, replaced = asyncio.run(scenario())
+    assert reads == [b"c" * 1000, b"d" * 1000, b"e" * 5000]
+    assert replaced == b"z" * 1000
+    metrics = cache.tier_metrics()["memory"]
+    assert metrics["hits"] == 4  # Both hot assets on their 2nd and 3rd reads
+    assert metrics["admitted"] == 4 and metrics["rejected"] == 2 and metrics["evictions"] == 0
+    assert list(memory._entries) == [2, 3, 1]  # Asset 4 lost to the hotter entries, 5 is over the blob limit
+    assert memory.get(1, None) is None and 1 not in memory._entries  # A different version is a miss